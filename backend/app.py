@@ -1,9 +1,18 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from .db.connection import Database
 from .db.database import init_db
-from .routers import userFitnessProfileRouter, fitnessPlanRouter, authRouter, chatRouter, mealLoggerRouter, nutritionGoalRouter, caloriesTrackerRouter, exerciseLoggerRouter, weightLoggerRouter
+from .core.llm_gateway import LLMGateway
+from .core.ocr_engine import OCREngine
+from .core.similarity_index import SimilarityIndexStore
+from .core.intent_classifier import IntentModel
+from .core.fatsecret import FatSecretHTTP
+from .core.food_catalog import FoodCatalog
+from .services.planJobService import PlanJobQueue
+from .services.rollupService import RollupRefresher
+from .routers import userFitnessProfileRouter, fitnessPlanRouter, authRouter, chatRouter, mealLoggerRouter, nutritionGoalRouter, caloriesTrackerRouter, exerciseLoggerRouter, weightLoggerRouter, exportRouter
 
 app = FastAPI()
 
@@ -27,10 +36,22 @@ app.add_middleware(
 async def startup_db_client():
     await Database.connect_db()
     await init_db()
+    # Train the local intent model in the background so startup isn't delayed
+    asyncio.create_task(IntentModel.train_from_history())
+    # Searches fall through to FatSecret until the food catalog finishes loading
+    asyncio.create_task(FoodCatalog.load())
+    # Fitness plans are generated by background workers, profile saves only enqueue them
+    PlanJobQueue.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await PlanJobQueue.stop()
+    await RollupRefresher.flush()
+    await SimilarityIndexStore.flush()
     await Database.close_db()
+    await FatSecretHTTP.close()
+    LLMGateway.shutdown()
+    OCREngine.shutdown()
 
 # Include routers
 app.include_router(authRouter.auth_router, prefix="/api/auth", tags=["Authentication"])
@@ -63,6 +84,10 @@ app.include_router(
     weightLoggerRouter.weight_log_router,
     tags=["Weight Logger"]
 )
+app.include_router(
+    exportRouter.export_router,
+    tags=["Export"]
+)
 
 # Data model for analysis input
 class DataAnalysisInput(BaseModel):
@@ -0,0 +1,72 @@
+"""Async HTTP transport for the FatSecret API: one pooled httpx.AsyncClient with timeouts and retries."""
+import asyncio
+import importlib.util
+import os
+import random
+
+import httpx
+
+FATSECRET_TIMEOUT_SECONDS = float(os.getenv("FATSECRET_TIMEOUT_SECONDS", 10))
+FATSECRET_MAX_RETRIES = int(os.getenv("FATSECRET_MAX_RETRIES", 3))
+FATSECRET_BACKOFF_SECONDS = float(os.getenv("FATSECRET_BACKOFF_SECONDS", 0.5))
+FATSECRET_MAX_CONNECTIONS = int(os.getenv("FATSECRET_MAX_CONNECTIONS", 50))
+
+# Rate limiting and transient server errors are worth another try
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FatSecretHTTP:
+    _client: httpx.AsyncClient = None
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """Long-lived client so TCP+TLS connections are reused across requests"""
+        if cls._client is None:
+            cls._client = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,  # HTTP/2 when the h2 extra is installed
+                timeout=httpx.Timeout(FATSECRET_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=FATSECRET_MAX_CONNECTIONS,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=60
+                )
+            )
+        return cls._client
+
+    @classmethod
+    async def close(cls):
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @staticmethod
+    def _backoff_delay(attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        # Exponential backoff with jitter
+        return FATSECRET_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, FATSECRET_BACKOFF_SECONDS)
+
+    @classmethod
+    async def request(cls, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying 429/5xx responses and transport errors with backoff"""
+        client = cls.get_client()
+        for attempt in range(FATSECRET_MAX_RETRIES + 1):
+            is_last_attempt = attempt == FATSECRET_MAX_RETRIES
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if is_last_attempt:
+                    raise
+                print(f"FatSecret request error ({str(e)}), retrying...")
+                await asyncio.sleep(cls._backoff_delay(attempt))
+                continue
+
+            if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+                return response
+
+            print(f"FatSecret returned {response.status_code}, retrying...")
+            await asyncio.sleep(cls._backoff_delay(attempt, response))
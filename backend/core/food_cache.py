@@ -0,0 +1,134 @@
+"""Two-tier cache for FatSecret responses: an in-process LRU in front of the food_cache collection."""
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+from .cache import TTLCache
+from ..db.database import food_cache_collection
+
+FOOD_CACHE_MAX_ENTRIES = int(os.getenv("FOOD_CACHE_MAX_ENTRIES", 5000))
+# Entries younger than this are served as-is
+FOOD_CACHE_FRESH_SECONDS = float(os.getenv("FOOD_CACHE_FRESH_SECONDS", 6 * 60 * 60))
+# Older entries are still served while a background refresh runs, until the TTL index removes them
+FOOD_CACHE_STALE_SECONDS = float(os.getenv("FOOD_CACHE_STALE_SECONDS", 7 * 24 * 60 * 60))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def search_cache_key(food_name: str) -> str:
+    return "search:" + _WHITESPACE.sub(" ", food_name.lower()).strip()
+
+
+def food_cache_key(food_id: str) -> str:
+    return "food:" + food_id.strip()
+
+
+class FoodCache:
+    _memory = TTLCache(FOOD_CACHE_MAX_ENTRIES, FOOD_CACHE_STALE_SECONDS)
+    _refreshing = {}  # key -> task fetching that key, so concurrent misses share one upstream call
+    memory_hits = 0
+    mongo_hits = 0
+    misses = 0
+    stale_served = 0
+    refresh_errors = 0
+
+    @classmethod
+    async def _read_mongo(cls, key: str):
+        try:
+            doc = await food_cache_collection.find_one({"_id": key})
+        except PyMongoError as e:
+            print(f"Food cache read failed: {str(e)}")
+            return None
+        if not doc or doc["expires_at"] <= datetime.utcnow():
+            return None
+        return {"data": doc["data"], "fresh_until": doc["fresh_until"], "expires_at": doc["expires_at"]}
+
+    @classmethod
+    def _remember(cls, key: str, entry: dict):
+        ttl_seconds = (entry["expires_at"] - datetime.utcnow()).total_seconds()
+        if ttl_seconds > 0:
+            cls._memory.set(key, entry, ttl_seconds=ttl_seconds)
+
+    @classmethod
+    async def _refresh(cls, key: str, fetch):
+        data = await fetch()
+        # FatSecret reports failures (bad token, rate limit, unknown id) as a 200 with an error object;
+        # raising here keeps them out of both tiers, leaves a stale entry in place and reaches the caller as a 400
+        if isinstance(data, dict) and "error" in data:
+            error = data["error"]
+            message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            raise HTTPException(status_code=400, detail=f"FatSecret API error: {message}")
+        now = datetime.utcnow()
+        entry = {
+            "data": data,
+            "fresh_until": now + timedelta(seconds=FOOD_CACHE_FRESH_SECONDS),
+            "expires_at": now + timedelta(seconds=FOOD_CACHE_STALE_SECONDS),
+        }
+        cls._remember(key, entry)
+        try:
+            await food_cache_collection.update_one(
+                {"_id": key}, {"$set": {**entry, "updated_at": now}}, upsert=True
+            )
+        except PyMongoError as e:
+            print(f"Food cache write failed: {str(e)}")
+        return data
+
+    @classmethod
+    def _on_refresh_done(cls, key: str, task: asyncio.Task):
+        cls._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            cls.refresh_errors += 1
+            print(f"Food cache refresh failed for {key}: {str(task.exception())}")
+
+    @classmethod
+    def _start_refresh(cls, key: str, fetch):
+        task = cls._refreshing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cls._refresh(key, fetch))
+            cls._refreshing[key] = task
+            task.add_done_callback(lambda done: cls._on_refresh_done(key, done))
+        return task
+
+    @classmethod
+    async def get_or_fetch(cls, key: str, fetch):
+        """
+        Return the cached payload for key, calling the async fetch() only on a miss.
+        Stale entries are returned immediately and revalidated in the background.
+        """
+        entry = cls._memory.get(key)
+        if entry is not None:
+            cls.memory_hits += 1
+        else:
+            entry = await cls._read_mongo(key)
+            if entry is not None:
+                cls.mongo_hits += 1
+                cls._remember(key, entry)
+
+        if entry is None:
+            cls.misses += 1
+            return await asyncio.shield(cls._start_refresh(key, fetch))
+
+        if entry["fresh_until"] <= datetime.utcnow():
+            cls.stale_served += 1
+            cls._start_refresh(key, fetch)
+        return entry["data"]
+
+    @classmethod
+    def get_metrics(cls):
+        lookups = cls.memory_hits + cls.mongo_hits + cls.misses
+        hits = cls.memory_hits + cls.mongo_hits
+        return {
+            "lookups": lookups,
+            "memory_hits": cls.memory_hits,
+            "mongo_hits": cls.mongo_hits,
+            "misses": cls.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stale_served": cls.stale_served,
+            "refresh_errors": cls.refresh_errors,
+            "refreshes_in_flight": len(cls._refreshing),
+            "memory": cls._memory.stats(),
+        }
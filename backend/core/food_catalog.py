@@ -0,0 +1,257 @@
+"""Local food catalog with an in-memory prefix/trigram index, ranked with rapidfuzz."""
+import asyncio
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from rapidfuzz import fuzz
+
+from ..db.database import food_catalog_collection, meal_diary_collection
+
+# Search answers locally once it has at least this many matches
+FOOD_CATALOG_MIN_RESULTS = int(os.getenv("FOOD_CATALOG_MIN_RESULTS", 5))
+FOOD_CATALOG_MIN_SCORE = float(os.getenv("FOOD_CATALOG_MIN_SCORE", 70))
+# Upper bound on candidates scored per query, keeps typeahead in the low milliseconds
+FOOD_CATALOG_MAX_CANDIDATES = int(os.getenv("FOOD_CATALOG_MAX_CANDIDATES", 300))
+MAX_PREFIX_LENGTH = 15
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner", "snacks"]
+CATALOG_FIELDS = [
+    "food_name", "food_description", "brand_name",
+    "calories_per_serving", "fat_per_serving", "carbs_per_serving", "protein_per_serving"
+]
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_food_name(name: str) -> str:
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FoodCatalog:
+    _foods = {}  # food_id -> entry
+    _names = {}  # food_id -> normalized name currently indexed
+    _prefixes = defaultdict(set)  # word prefix -> food_ids
+    _trigram_index = defaultdict(set)  # trigram -> food_ids
+    _pending_writes = set()  # keep background persistence tasks referenced
+
+    # ---- index maintenance ----
+    @classmethod
+    def _unindex(cls, food_id: str):
+        name = cls._names.pop(food_id, None)
+        if name is None:
+            return
+        for word in name.split():
+            for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+                cls._prefixes[word[:length]].discard(food_id)
+        for trigram in _trigrams(name):
+            cls._trigram_index[trigram].discard(food_id)
+
+    @classmethod
+    def _index(cls, food_id: str, entry: dict):
+        name = normalize_food_name(entry.get("food_name") or "")
+        if cls._names.get(food_id) == name:
+            return
+        cls._unindex(food_id)
+        if not name:
+            return
+        cls._names[food_id] = name
+        for word in name.split():
+            for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+                cls._prefixes[word[:length]].add(food_id)
+        for trigram in _trigrams(name):
+            cls._trigram_index[trigram].add(food_id)
+
+    @classmethod
+    def _merge(cls, food_id: str, fields: dict, popularity: int = 0):
+        """Update the in-memory entry, keeping known values when the new source lacks them"""
+        entry = cls._foods.setdefault(food_id, {"food_id": food_id, "popularity": 0})
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        entry["popularity"] += popularity
+        cls._index(food_id, entry)
+        return entry
+
+    # ---- persistence ----
+    @classmethod
+    def _persist(cls, updates):
+        """Write-behind upserts so ingestion never adds a round trip to the request path"""
+        if not updates:
+            return
+        operations = [
+            UpdateOne(
+                {"_id": food_id},
+                {
+                    "$set": {**{k: v for k, v in fields.items() if v is not None}, "updated_at": datetime.utcnow()},
+                    "$inc": {"popularity": popularity},
+                },
+                upsert=True
+            )
+            for food_id, fields, popularity in updates
+        ]
+
+        async def write():
+            try:
+                await food_catalog_collection.bulk_write(operations, ordered=False)
+            except PyMongoError as e:
+                print(f"Error persisting food catalog entries: {str(e)}")
+
+        task = asyncio.ensure_future(write())
+        cls._pending_writes.add(task)
+        task.add_done_callback(cls._pending_writes.discard)
+
+    @classmethod
+    async def load(cls):
+        """Load the persisted catalog, seeding it from the meal diary the first time"""
+        try:
+            if await food_catalog_collection.estimated_document_count() == 0:
+                await cls.backfill_from_meal_diary()
+
+            async for doc in food_catalog_collection.find({}):
+                food_id = doc.pop("_id")
+                doc.pop("updated_at", None)
+                popularity = doc.pop("popularity", 0)
+                cls._merge(food_id, doc)
+                cls._foods[food_id]["popularity"] = max(cls._foods[food_id]["popularity"], popularity)
+            print(f"Food catalog loaded with {len(cls._foods)} foods")
+        except Exception as e:
+            print(f"Error loading food catalog: {str(e)}")
+
+    @classmethod
+    async def backfill_from_meal_diary(cls):
+        """Collect every food ever logged into the catalog collection"""
+        pipeline = [
+            {"$project": {"items": {"$concatArrays": [{"$ifNull": [f"${meal_type}", []]} for meal_type in MEAL_TYPES]}}},
+            {"$unwind": "$items"},
+            {"$match": {"items.food_id": {"$exists": True}}},
+            {"$group": {
+                "_id": "$items.food_id",
+                **{field: {"$last": f"$items.{field}"} for field in CATALOG_FIELDS if field != "brand_name"},
+                "popularity": {"$sum": 1},
+            }},
+        ]
+        operations = []
+        async for doc in meal_diary_collection.aggregate(pipeline, allowDiskUse=True):
+            popularity = doc.pop("popularity")
+            food_id = doc.pop("_id")
+            fields = {k: v for k, v in doc.items() if v is not None}
+            operations.append(UpdateOne(
+                {"_id": food_id},
+                {"$set": {**fields, "updated_at": datetime.utcnow()}, "$max": {"popularity": popularity}},
+                upsert=True
+            ))
+        if operations:
+            await food_catalog_collection.bulk_write(operations, ordered=False)
+        print(f"Food catalog backfilled with {len(operations)} foods from the meal diary")
+
+    # ---- ingestion ----
+    @classmethod
+    def ingest_search_results(cls, foods):
+        """Foods from a FatSecret foods/search response"""
+        updates = []
+        for food in foods:
+            if not food.get("food_id") or not food.get("food_name"):
+                continue
+            fields = {
+                "food_name": food["food_name"],
+                "food_description": food.get("food_description"),
+                "brand_name": food.get("brand_name"),
+            }
+            cls._merge(food["food_id"], fields)
+            updates.append((food["food_id"], fields, 0))
+        cls._persist(updates)
+
+    @classmethod
+    def ingest_food_details(cls, food_data: dict):
+        """A FatSecret food/v4 response; per-serving macros come from the first serving"""
+        food = (food_data or {}).get("food") or {}
+        if not food.get("food_id") or not food.get("food_name"):
+            return
+        servings = (food.get("servings") or {}).get("serving") or []
+        if isinstance(servings, dict):
+            servings = [servings]
+        serving = servings[0] if servings else {}
+
+        fields = {
+            "food_name": food["food_name"],
+            "brand_name": food.get("brand_name"),
+            "calories_per_serving": _to_float(serving.get("calories")),
+            "fat_per_serving": _to_float(serving.get("fat")),
+            "carbs_per_serving": _to_float(serving.get("carbohydrate")),
+            "protein_per_serving": _to_float(serving.get("protein")),
+        }
+        cls._merge(food["food_id"], fields)
+        cls._persist([(food["food_id"], fields, 0)])
+
+    @classmethod
+    def ingest_meal_log(cls, meal_log: dict):
+        """A logged meal; each log makes the food rank a little higher"""
+        if not meal_log.get("food_id") or not meal_log.get("food_name"):
+            return
+        fields = {field: meal_log.get(field) for field in CATALOG_FIELDS if field in meal_log}
+        cls._merge(meal_log["food_id"], fields, popularity=1)
+        cls._persist([(meal_log["food_id"], fields, 1)])
+
+    # ---- lookup ----
+    @classmethod
+    def _candidates(cls, query: str):
+        words = query.split()
+        prefix_sets = sorted(
+            (cls._prefixes.get(word[:MAX_PREFIX_LENGTH], set()) for word in words), key=len
+        )
+        candidates = set.intersection(*prefix_sets) if prefix_sets else set()
+        if len(candidates) >= FOOD_CATALOG_MAX_CANDIDATES:
+            return list(candidates)[:FOOD_CATALOG_MAX_CANDIDATES]
+
+        # Typos: fall back to foods sharing enough trigrams with the query
+        query_trigrams = _trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(cls._trigram_index.get(trigram, ()))
+        min_shared = max(2, len(query_trigrams) // 3)
+        for food_id, count in shared.most_common(FOOD_CATALOG_MAX_CANDIDATES):
+            if count < min_shared or len(candidates) >= FOOD_CATALOG_MAX_CANDIDATES:
+                break
+            candidates.add(food_id)
+        return list(candidates)
+
+    @classmethod
+    def search(cls, query: str, limit: int = 10):
+        """Ranked catalog entries matching the query (prefix matches first, then fuzzy)"""
+        query = normalize_food_name(query)
+        if not query:
+            return []
+
+        scored = []
+        for food_id in cls._candidates(query):
+            name = cls._names.get(food_id)
+            if name is None:
+                continue
+            score = fuzz.WRatio(query, name)
+            if name.startswith(query):
+                score += 10
+            if score < FOOD_CATALOG_MIN_SCORE:
+                continue
+            popularity = cls._foods[food_id]["popularity"]
+            scored.append((score + min(popularity, 50) / 10, food_id))
+
+        scored.sort(reverse=True)
+        return [cls._foods[food_id] for _, food_id in scored[:limit]]
+
+    @classmethod
+    def size(cls):
+        return len(cls._foods)
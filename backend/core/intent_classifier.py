@@ -0,0 +1,170 @@
+"""Fast local intent classifier consulted before falling back to Gemini."""
+import asyncio
+import os
+import re
+
+from ..db.database import conversation_history_collection
+
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.75))
+INTENT_MODEL_MIN_SAMPLES = int(os.getenv("INTENT_MODEL_MIN_SAMPLES", 200))
+INTENT_MODEL_MAX_SAMPLES = int(os.getenv("INTENT_MODEL_MAX_SAMPLES", 20000))
+
+# Labels match the QueryIntent member names in chatRouter
+CALORIES_TODAY = "CALORIES_TODAY"
+CALORIES_DATE = "CALORIES_DATE"
+MEAL_PLAN = "MEAL_PLAN"
+WORKOUT = "WORKOUT"
+GENERAL_FITNESS = "GENERAL_FITNESS"
+UNKNOWN = "UNKNOWN"
+
+# Precompiled once at import time
+_PERSONAL = re.compile(r"\b(i|i've|ive|i'd|my|me)\b")
+_CONSUMPTION = re.compile(r"\b(ate|eaten|eat|had|have|consumed?|intake|logged|log|total)\b")
+_CALORIE_TERMS = re.compile(r"\b(calories?|kcal|macros?|protein|carbs?|fat|food|meals?|breakfast|lunch|dinner|snacks?)\b")
+_INTAKE_QUESTION = re.compile(r"\b(how (many|much)|what did|what have|did i|have i|total|show|tell|so far|logged)\b")
+# Diary lookups are about what was already eaten or logged
+_LOGGED = re.compile(r"\b(ate|had|eaten|consumed|logged|so far|did i|have i|i've|ive)\b")
+# "should I eat", "could I have", "recommend": advice, even when the wording matches everything else
+_ADVICE = re.compile(r"\b(should|could|would|recommend\w*|suggest\w*|ought|need to|supposed to)\b")
+_TODAY = re.compile(r"\b(today|so far|this morning|tonight)\b")
+_RELATIVE_DATE = re.compile(r"\b(yesterday|last week)\b")
+_MEAL_PLAN = re.compile(
+    r"\b(meal|diet|eating|nutrition|food)\s+plans?\b|\bwhat should i eat\b|\brecipes?\b|\bmeal ideas?\b|\bmeal prep\b"
+)
+_WORKOUT = re.compile(
+    r"\b(workouts?|exercises?|exercising|training|cardio|strength|running|jogging|lifting|squats?|push ?ups?|"
+    r"gym|reps|sets|stretch(ing)?|yoga|hiit)\b"
+)
+_GENERAL_FITNESS = re.compile(
+    r"\b(water|hydrat\w*|sleep|rest|weight|bmi|lose|gain|muscle|vitamins?|supplements?|health\w*|"
+    r"fitness|diet|nutrition|steps|energy)\b"
+)
+# Also common in intake questions the rules above didn't catch ("calories in my lunch"), so on their
+# own they stay below the threshold and the model or Gemini decides
+_NUTRIENT_TERMS = re.compile(r"\b(calories?|protein|fat)\b")
+
+
+def classify_intent_locally(message: str):
+    """Return {"intent", "confidence", "explanation"} using the keyword/regex rules"""
+    text = message.lower()
+
+    is_personal = bool(_PERSONAL.search(text))
+    mentions_calories = bool(_CALORIE_TERMS.search(text))
+    mentions_consumption = bool(_CONSUMPTION.search(text))
+
+    # Questions about the user's own diary need personal + consumption + nutrition terms
+    # and must actually ask about logged amounts ("should I eat protein today" is advice)
+    is_diary_question = (
+        is_personal and mentions_calories and mentions_consumption and _INTAKE_QUESTION.search(text)
+        and _LOGGED.search(text) and not _ADVICE.search(text)
+    )
+    if is_diary_question:
+        if _RELATIVE_DATE.search(text):
+            return {"intent": CALORIES_DATE, "confidence": 0.9,
+                    "explanation": "Personal intake question with a relative date"}
+        if _TODAY.search(text):
+            return {"intent": CALORIES_TODAY, "confidence": 0.95,
+                    "explanation": "Personal intake question about today"}
+        if not _MEAL_PLAN.search(text):
+            return {"intent": CALORIES_TODAY, "confidence": 0.7,
+                    "explanation": "Personal intake question without a date"}
+
+    if _MEAL_PLAN.search(text):
+        return {"intent": MEAL_PLAN, "confidence": 0.9, "explanation": "Mentions a meal or diet plan"}
+
+    if _WORKOUT.search(text):
+        return {"intent": WORKOUT, "confidence": 0.85, "explanation": "Mentions workouts or exercise"}
+
+    if _GENERAL_FITNESS.search(text):
+        return {"intent": GENERAL_FITNESS, "confidence": 0.8, "explanation": "Mentions a general fitness topic"}
+
+    if _NUTRIENT_TERMS.search(text):
+        return {"intent": GENERAL_FITNESS, "confidence": 0.6, "explanation": "Mentions a nutrient without an intake question"}
+
+    return {"intent": UNKNOWN, "confidence": 0.3, "explanation": "No local rule matched"}
+
+
+class IntentModel:
+    """Optional scikit-learn tier trained on messages Gemini already labeled in conversation_history"""
+    _pipeline = None
+    _labels = []
+
+    @classmethod
+    def _fit(cls, messages, labels):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        pipeline = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True),
+            LogisticRegression(max_iter=1000)
+        )
+        pipeline.fit(messages, labels)
+        return pipeline
+
+    @classmethod
+    async def train_from_history(cls):
+        """Train on conversations Gemini labeled itself (not cache hits); a no-op until enough samples exist"""
+        try:
+            cursor = conversation_history_collection.find(
+                {"intent": {"$exists": True}, "intent_source": "gemini"},
+                {"message": 1, "intent": 1}
+            ).sort("timestamp", -1).limit(INTENT_MODEL_MAX_SAMPLES)
+            samples = await cursor.to_list(length=None)
+
+            messages = [sample["message"] for sample in samples]
+            labels = [sample["intent"] for sample in samples]
+            if len(samples) < INTENT_MODEL_MIN_SAMPLES or len(set(labels)) < 2:
+                print(f"Intent model not trained: {len(samples)} labeled samples")
+                return
+
+            cls._pipeline = await asyncio.to_thread(cls._fit, messages, labels)
+            cls._labels = list(cls._pipeline.classes_)
+            print(f"Intent model trained on {len(samples)} samples")
+        except Exception as e:
+            print(f"Error training intent model: {str(e)}")
+
+    @classmethod
+    def predict(cls, message: str):
+        if cls._pipeline is None:
+            return None
+        probabilities = cls._pipeline.predict_proba([message])[0]
+        best = probabilities.argmax()
+        return {
+            "intent": cls._labels[best],
+            "confidence": float(probabilities[best]),
+            "explanation": "Predicted by the local intent model"
+        }
+
+
+def classify_intent(message: str):
+    """Rules first, then the trained model; the caller falls back to Gemini below the threshold"""
+    result = classify_intent_locally(message)
+    if result["confidence"] >= INTENT_CONFIDENCE_THRESHOLD:
+        return result
+
+    predicted = IntentModel.predict(message)
+    if predicted and predicted["confidence"] > result["confidence"]:
+        return predicted
+    return result
+
+
+# Phrases whose local classification must not regress; check with python -m backend.core.intent_classifier
+REGRESSION_CASES = [
+    ("how many calories did i eat today", CALORIES_TODAY),
+    ("what did i have for lunch yesterday", CALORIES_DATE),
+    ("how much protein have i had so far", CALORIES_TODAY),
+    ("how much protein should i eat today", GENERAL_FITNESS),
+    ("should i eat protein today", GENERAL_FITNESS),
+    ("give me a meal plan for this week", MEAL_PLAN),
+]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for phrase, expected in REGRESSION_CASES:
+        result = classify_intent_locally(phrase)
+        if result["intent"] != expected:
+            failures += 1
+            print(f"FAIL {phrase!r}: expected {expected}, got {result['intent']} ({result['confidence']})")
+    print(f"{len(REGRESSION_CASES) - failures}/{len(REGRESSION_CASES)} intent regression cases pass")
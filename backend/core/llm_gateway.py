@@ -0,0 +1,209 @@
+"""Shared non-blocking gateway for all Gemini generate_content calls."""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+# Per-process limits (override through environment variables)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+# Streams hold their slot until the last chunk, so they get a longer overall deadline
+LLM_STREAM_TIMEOUT_SECONDS = float(os.getenv("LLM_STREAM_TIMEOUT_SECONDS", 120))
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within its timeout."""
+
+
+class LLMGateway:
+    """Runs Gemini calls off the event loop with a concurrency cap, timeouts and queue metrics."""
+    _semaphore: asyncio.Semaphore = None
+    _executor: ThreadPoolExecutor = None
+    _models = {}
+    _metrics = {
+        "calls": 0,
+        "errors": 0,
+        "timeouts": 0,
+        "in_flight": 0,
+        "queued": 0,
+        "max_queue_depth": 0,
+        "total_wait_seconds": 0.0,
+        "total_call_seconds": 0.0,
+        "streams": 0,
+        "total_first_chunk_seconds": 0.0,
+    }
+
+    @classmethod
+    def get_model(cls, model_name: str = DEFAULT_MODEL):
+        """Reuse one GenerativeModel instance per model name"""
+        if model_name not in cls._models:
+            cls._models[model_name] = genai.GenerativeModel(model_name)
+        return cls._models[model_name]
+
+    @classmethod
+    def _get_semaphore(cls):
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        return cls._semaphore
+
+    @classmethod
+    def _get_executor(cls):
+        # Only used when the installed SDK has no native async API
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+        return cls._executor
+
+    @classmethod
+    async def _acquire_slot(cls):
+        """Wait for a concurrency slot, tracking how many callers are queued"""
+        metrics = cls._metrics
+        metrics["queued"] += 1
+        metrics["max_queue_depth"] = max(metrics["max_queue_depth"], metrics["queued"])
+        wait_started = time.perf_counter()
+        try:
+            await cls._get_semaphore().acquire()
+        finally:
+            metrics["queued"] -= 1
+            metrics["total_wait_seconds"] += time.perf_counter() - wait_started
+        metrics["in_flight"] += 1
+
+    @classmethod
+    def _release_slot(cls):
+        cls._metrics["in_flight"] -= 1
+        cls._get_semaphore().release()
+
+    @classmethod
+    async def _call_model(cls, model, contents, **kwargs):
+        if hasattr(model, "generate_content_async"):
+            return await model.generate_content_async(contents, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls._get_executor(),
+            lambda: model.generate_content(contents, **kwargs)
+        )
+
+    @classmethod
+    async def generate_content(cls, contents, model_name: str = DEFAULT_MODEL, timeout: float = None, **kwargs):
+        """Async drop-in for model.generate_content(contents, **kwargs)"""
+        model = cls.get_model(model_name)
+        timeout = timeout or LLM_TIMEOUT_SECONDS
+
+        await cls._acquire_slot()
+        cls._metrics["calls"] += 1
+        call_started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(cls._call_model(model, contents, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            cls._metrics["timeouts"] += 1
+            print(f"LLM call timed out after {timeout}s")
+            raise LLMTimeoutError(f"Gemini call timed out after {timeout}s")
+        except Exception:
+            cls._metrics["errors"] += 1
+            raise
+        finally:
+            cls._metrics["total_call_seconds"] += time.perf_counter() - call_started
+            cls._release_slot()
+
+    @classmethod
+    async def _stream_model(cls, model, contents, **kwargs):
+        if hasattr(model, "generate_content_async"):
+            response = await model.generate_content_async(contents, stream=True, **kwargs)
+            async for chunk in response:
+                yield chunk
+            return
+
+        # Sync SDK: iterate the stream on the executor and hand chunks back to the loop
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+
+        def produce():
+            try:
+                for chunk in model.generate_content(contents, stream=True, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        loop.run_in_executor(cls._get_executor(), produce)
+        while True:
+            item = await queue.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    @classmethod
+    async def stream_content(cls, contents, model_name: str = DEFAULT_MODEL, timeout: float = None, **kwargs):
+        """Async generator of text chunks as Gemini produces them"""
+        model = cls.get_model(model_name)
+        timeout = timeout or LLM_STREAM_TIMEOUT_SECONDS
+        loop = asyncio.get_running_loop()
+
+        await cls._acquire_slot()
+        cls._metrics["calls"] += 1
+        cls._metrics["streams"] += 1
+        call_started = time.perf_counter()
+        deadline = loop.time() + timeout
+        chunks = cls._stream_model(model, contents, **kwargs)
+        first_chunk = True
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                if first_chunk:
+                    cls._metrics["total_first_chunk_seconds"] += time.perf_counter() - call_started
+                    first_chunk = False
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only safety ratings)
+                    continue
+                if text:
+                    yield text
+        except asyncio.TimeoutError:
+            cls._metrics["timeouts"] += 1
+            print(f"LLM stream timed out after {timeout}s")
+            raise LLMTimeoutError(f"Gemini stream timed out after {timeout}s")
+        except Exception:
+            cls._metrics["errors"] += 1
+            raise
+        finally:
+            await chunks.aclose()
+            cls._metrics["total_call_seconds"] += time.perf_counter() - call_started
+            cls._release_slot()
+
+    @classmethod
+    def get_metrics(cls):
+        metrics = dict(cls._metrics)
+        calls = metrics["calls"] or 1
+        metrics["max_concurrency"] = LLM_MAX_CONCURRENCY
+        metrics["avg_wait_seconds"] = round(metrics.pop("total_wait_seconds") / calls, 4)
+        metrics["avg_call_seconds"] = round(metrics.pop("total_call_seconds") / calls, 4)
+        metrics["avg_first_chunk_seconds"] = round(metrics.pop("total_first_chunk_seconds") / (metrics["streams"] or 1), 4)
+        return metrics
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
+
+
+async def generate_content(contents, model_name: str = DEFAULT_MODEL, timeout: float = None, **kwargs):
+    """Module-level shortcut used by the routers"""
+    return await LLMGateway.generate_content(contents, model_name=model_name, timeout=timeout, **kwargs)
+
+
+def stream_content(contents, model_name: str = DEFAULT_MODEL, timeout: float = None, **kwargs):
+    """Module-level shortcut for streaming generations"""
+    return LLMGateway.stream_content(contents, model_name=model_name, timeout=timeout, **kwargs)
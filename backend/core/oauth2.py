@@ -1,80 +1,163 @@
 """Utility class to handle OAuth2.0 token fetching and refreshing."""
+import asyncio
+import json
 import os
-from datetime import datetime, timedelta
+import tempfile
+import time
 
-import requests
 from fastapi import HTTPException
 
+from .fatsecret import FatSecretHTTP
+
+try:
+    import fcntl
+except ImportError:  # Windows: tokens are still shared through the store, just without the file lock
+    fcntl = None
+
 CLIENT_ID = os.getenv("FATSECRET_CLIENT_ID")
 CLIENT_SECRET = os.getenv("FATSECRET_CLIENT_SECRET")
 TOKEN_URL = os.getenv("FATSECRET_TOKEN_URL")
 
-ACCESS_TOKEN = None
-REFRESH_TOKEN = None
-TOKEN_EXPIRY_TIME = None
+# Refresh this many seconds before the token expires
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("FATSECRET_TOKEN_REFRESH_MARGIN_SECONDS", 300))
+# Small local store shared by every uvicorn worker on this host
+TOKEN_STORE_PATH = os.getenv(
+    "FATSECRET_TOKEN_STORE_PATH",
+    os.path.join(tempfile.gettempdir(), "360fitness_fatsecret_token.json")
+)
 
 
 class FatSecretAuthorization:
+    """
+    Async token manager: one refresh in flight per process (single-flight), a file lock so only
+    one worker hits the token endpoint, and background refresh ahead of expiry.
+    """
+    _access_token = None
+    _refresh_token = None
+    _expires_at = 0.0  # epoch seconds, comparable across workers
+    _inflight: asyncio.Future = None
+    token_fetches = 0
+
     @staticmethod
-    def fetch_oauth2_token():
-        global ACCESS_TOKEN, REFRESH_TOKEN, TOKEN_EXPIRY_TIME
+    def _read_store():
+        try:
+            with open(TOKEN_STORE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
 
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-        }
-        auth_token_response = requests.post(TOKEN_URL, data=data)
-
-        if auth_token_response.status_code == 200:
-            token_data = auth_token_response.json()
-            ACCESS_TOKEN = token_data['access_token']
-            REFRESH_TOKEN = token_data.get('refresh_token', None)
-            expires_in = token_data['expires_in']
-            TOKEN_EXPIRY_TIME = datetime.now() + timedelta(seconds=expires_in)
-        else:
-            raise HTTPException(status_code=500, detail="Failed to fetch OAuth token")
+    @staticmethod
+    def _write_store(token_data: dict):
+        temp_path = f"{TOKEN_STORE_PATH}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(token_data, f)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, TOKEN_STORE_PATH)
+
+    @staticmethod
+    def _lock_store():
+        """None when the store's directory can't be used; tokens then stay in this process"""
+        try:
+            lock_file = open(f"{TOKEN_STORE_PATH}.lock", "a")
+        except OSError as e:
+            print(f"Warning: OAuth token store unavailable, not sharing tokens across workers: {str(e)}")
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # blocks until other workers finish refreshing
+            except OSError as e:
+                print(f"Warning: could not lock the OAuth token store, not sharing tokens across workers: {str(e)}")
+                lock_file.close()
+                return None
+        return lock_file
 
     @staticmethod
-    def refresh_oauth2_token():
-        global ACCESS_TOKEN, REFRESH_TOKEN, TOKEN_EXPIRY_TIME
+    def _unlock_store(lock_file):
+        if lock_file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
 
-        if not REFRESH_TOKEN:
-            raise HTTPException(status_code=400, detail="Refresh token is missing. Please fetch a new access token.")
+    @classmethod
+    def _adopt(cls, token_data: dict):
+        cls._access_token = token_data["access_token"]
+        cls._refresh_token = token_data.get("refresh_token")
+        cls._expires_at = token_data["expires_at"]
 
-        data = {
-            "grant_type": "refresh_token",
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "refresh_token": REFRESH_TOKEN,
+    @classmethod
+    async def _request_token(cls):
+        """Use the refresh token when we have one, otherwise (or if it fails) client credentials"""
+        data = {"client_id": CLIENT_ID, "client_secret": CLIENT_SECRET}
+        if cls._refresh_token:
+            response = await FatSecretHTTP.request(
+                "POST", TOKEN_URL, data={**data, "grant_type": "refresh_token", "refresh_token": cls._refresh_token}
+            )
+            if response.status_code != 200:
+                print("Failed to refresh OAuth token, fetching a new one...")
+                response = await FatSecretHTTP.request("POST", TOKEN_URL, data={**data, "grant_type": "client_credentials"})
+        else:
+            response = await FatSecretHTTP.request("POST", TOKEN_URL, data={**data, "grant_type": "client_credentials"})
+
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Failed to fetch OAuth token")
+
+        cls.token_fetches += 1
+        token_data = response.json()
+        return {
+            "access_token": token_data["access_token"],
+            "refresh_token": token_data.get("refresh_token", cls._refresh_token),
+            "expires_at": time.time() + token_data["expires_in"],
         }
 
-        refresh_token_response = requests.post(TOKEN_URL, data=data)
+    @classmethod
+    async def _refresh(cls):
+        lock_file = await asyncio.to_thread(cls._lock_store)
+        try:
+            if lock_file is None:
+                # No shared store: the single-flight refresh still keeps this process to one fetch
+                cls._adopt(await cls._request_token())
+                return
+
+            # Another worker may have refreshed while we waited for the lock
+            try:
+                stored = await asyncio.to_thread(cls._read_store)
+            except OSError as e:
+                print(f"Could not read OAuth token store: {str(e)}")
+                stored = None
+            if stored and stored.get("expires_at", 0) - TOKEN_REFRESH_MARGIN_SECONDS > time.time():
+                cls._adopt(stored)
+                return
 
-        if refresh_token_response.status_code == 200:
-            token_data = refresh_token_response.json()
-            ACCESS_TOKEN = token_data['access_token']
-            REFRESH_TOKEN = token_data.get('refresh_token', REFRESH_TOKEN)
-            expires_in = token_data['expires_in']
-            TOKEN_EXPIRY_TIME = datetime.now() + timedelta(seconds=expires_in)
-        else:
-            raise HTTPException(status_code=500, detail="Failed to refresh OAuth token")
+            token_data = await cls._request_token()
+            cls._adopt(token_data)
+            try:
+                await asyncio.to_thread(cls._write_store, token_data)
+            except OSError as e:
+                print(f"Could not persist OAuth token: {str(e)}")
+        finally:
+            await asyncio.to_thread(cls._unlock_store, lock_file)
 
     @staticmethod
-    def get_access_token():
-        try:
-            print("Getting access token...")
-            if not ACCESS_TOKEN or datetime.now() > TOKEN_EXPIRY_TIME:
-                print("Access token expired, refreshing...")
-
-                # If no access token, fetch a new one; otherwise, refresh the existing token
-                if not ACCESS_TOKEN:
-                    FatSecretAuthorization.fetch_oauth2_token()
-                else:
-                    FatSecretAuthorization.refresh_oauth2_token()
-            access_token = ACCESS_TOKEN
-            print(f"Token obtained: {access_token[:10]}...")
-            return access_token
-        except Exception as e:
-            print(f"Error getting access token: {str(e)}")
-            raise
+    def _log_background_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background OAuth token refresh failed: {str(task.exception())}")
+
+    @classmethod
+    def _start_refresh(cls):
+        """Single-flight: every caller shares the refresh that is already running"""
+        if cls._inflight is None or cls._inflight.done():
+            cls._inflight = asyncio.ensure_future(cls._refresh())
+            cls._inflight.add_done_callback(cls._log_background_failure)
+        return cls._inflight
+
+    @classmethod
+    async def get_access_token(cls):
+        now = time.time()
+        if not cls._access_token or now >= cls._expires_at:
+            # No usable token: wait for the (shared) refresh
+            await asyncio.shield(cls._start_refresh())
+        elif now >= cls._expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            # Still valid: keep serving it and refresh ahead of expiry in the background
+            cls._start_refresh()
+        return cls._access_token
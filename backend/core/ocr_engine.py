@@ -0,0 +1,153 @@
+"""OCR execution engine that runs the pytesseract preprocessing passes in a process pool."""
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import pytesseract
+from PIL import Image, ImageFilter
+
+NUTRITION_KEYWORDS = ["calories", "protein", "carbohydrate", "fat", "sodium", "serving", "nutrition facts"]
+
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", os.cpu_count() or 2))
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", 4_000_000))  # Images are downscaled to at most this many pixels
+OCR_EARLY_EXIT_KEYWORDS = int(os.getenv("OCR_EARLY_EXIT_KEYWORDS", 3))
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", 30))
+
+# Preprocessing variants run concurrently: (variant name, tesseract config)
+OCR_PASSES = [
+    ("grayscale", r'--oem 3 --psm 6 -l eng --dpi 300'),  # PSM 6: Assume a single uniform block of text
+    ("grayscale", r'--oem 3 --psm 4 -l eng --dpi 300'),  # PSM 4: Assume a single column of text
+    ("threshold", r'--oem 3 --psm 6 -l eng --dpi 300'),  # Thresholding for better contrast
+    ("upscaled", r'--oem 3 --psm 1 -l eng --dpi 300'),   # PSM 1: Auto page segmentation on an upscaled image
+]
+# Only used when every pass above came back empty
+OCR_FALLBACK_PASS = ("sharpened", r'--oem 3 --psm 12 -l eng --dpi 300')  # PSM 12: Sparse text with OSD
+
+
+def count_nutrition_keywords(text: str) -> int:
+    """Count how many nutrition label keywords appear in the text"""
+    text = text.lower()
+    return sum(1 for keyword in NUTRITION_KEYWORDS if keyword in text)
+
+
+def _load_capped_image(image_content: bytes):
+    """Open the image and downscale it so it never exceeds OCR_MAX_PIXELS"""
+    image = Image.open(BytesIO(image_content))
+    width, height = image.size
+    if width * height > OCR_MAX_PIXELS:
+        scale = math.sqrt(OCR_MAX_PIXELS / (width * height))
+        image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+    return image
+
+
+def _preprocess(image, variant: str):
+    gray_image = image.convert('L')
+
+    if variant == "grayscale":
+        return gray_image
+    if variant == "threshold":
+        threshold = 150
+        return gray_image.point(lambda x: 0 if x < threshold else 255, '1')
+    if variant == "upscaled":
+        # Upscale for better detail, but never past the pixel cap
+        width, height = image.size
+        scale = min(2.0, math.sqrt(OCR_MAX_PIXELS / (width * height)))
+        if scale <= 1.05:
+            return gray_image
+        scaled_img = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+        return scaled_img.convert('L')
+    if variant == "sharpened":
+        sharpened = gray_image.filter(ImageFilter.SHARPEN)
+        return sharpened.filter(ImageFilter.SHARPEN)  # Double sharpen
+    raise ValueError(f"Unknown OCR variant: {variant}")
+
+
+def run_ocr_pass(image_content: bytes, variant: str, config: str) -> str:
+    """Runs in a worker process: decode, preprocess and OCR a single variant"""
+    image = _load_capped_image(image_content)
+    return pytesseract.image_to_string(_preprocess(image, variant), config=config)
+
+
+def combine_ocr_results(results):
+    """Join all results, drop duplicate lines and put the longest (most complete) lines first"""
+    all_lines = set()
+    for result in results:
+        for line in result.split('\n'):
+            clean_line = line.strip()
+            if clean_line and len(clean_line) > 1:  # Ignore single characters
+                all_lines.add(clean_line)
+
+    sorted_lines = sorted(all_lines, key=len, reverse=True)
+    return '\n'.join(sorted_lines)
+
+
+class OCREngine:
+    _pool: ProcessPoolExecutor = None
+
+    @classmethod
+    def _get_pool(cls):
+        if cls._pool is None:
+            cls._pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS)
+        return cls._pool
+
+    @classmethod
+    def shutdown(cls):
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=False, cancel_futures=True)
+            cls._pool = None
+
+    @classmethod
+    async def _run_passes(cls, image_content: bytes, passes):
+        """Run passes in parallel and stop waiting once one looks like a nutrition label"""
+        loop = asyncio.get_running_loop()
+        pool = cls._get_pool()
+        pending = {
+            loop.run_in_executor(pool, run_ocr_pass, image_content, variant, config)
+            for variant, config in passes
+        }
+        results = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=OCR_TIMEOUT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"OCR passes timed out after {OCR_TIMEOUT_SECONDS}s")
+                    break
+                for future in done:
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool):
+                        raise error
+                    if error is not None:
+                        print(f"OCR pass failed: {str(error)}")
+                        continue
+                    text = future.result()
+                    if text.strip():
+                        results.append(text)
+                        if count_nutrition_keywords(text) >= OCR_EARLY_EXIT_KEYWORDS:
+                            return results
+            return results
+        finally:
+            # Passes that have not started yet are dropped; running ones finish in the background
+            for future in pending:
+                future.cancel()
+
+    @classmethod
+    async def extract_text(cls, image_content: bytes):
+        """Extract text from an image with enhanced preprocessing for better OCR results"""
+        try:
+            results = await cls._run_passes(image_content, OCR_PASSES)
+            if results:
+                return {"success": True, "text": combine_ocr_results(results)}
+
+            # If all methods failed, try one more approach with very aggressive preprocessing
+            last_attempt = await cls._run_passes(image_content, [OCR_FALLBACK_PASS])
+            if last_attempt:
+                return {"success": True, "text": last_attempt[0]}
+            return {"success": False, "message": "No text detected in the image"}
+        except BrokenProcessPool as e:
+            # A crashed worker poisons the pool; start a fresh one for the next request
+            print(f"OCR process pool broken, restarting: {str(e)}")
+            cls.shutdown()
+            raise
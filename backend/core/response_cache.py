@@ -0,0 +1,44 @@
+"""Cross-user cache of chat answers keyed on the normalized question and the prompt's profile summary."""
+import hashlib
+import os
+import re
+
+from .cache import TTLCache
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 24 * 60 * 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", 10000))
+
+# Generated answers shared by users whose prompts carry the same profile summary
+response_cache = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+# Intent labels depend only on the message, so they are shared by every user
+intent_cache = TTLCache(INTENT_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+
+_PUNCTUATION = re.compile(r"[^\w\s/]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", question).strip()
+
+
+def profile_fingerprint(profile_summary: str) -> str:
+    """
+    Hash of the exact profile summary injected into the chat prompt.
+    Only users whose prompts carry identical profile values share answers, so a cached answer
+    never contains another user's numbers.
+    """
+    return hashlib.sha1(_WHITESPACE.sub(" ", profile_summary).strip().encode("utf-8")).hexdigest()
+
+
+def response_cache_key(question: str, profile_summary: str) -> str:
+    return f"{profile_fingerprint(profile_summary)}:{normalize_question(question)}"
+
+
+def get_cache_metrics():
+    return {
+        "response_cache": response_cache.stats(),
+        "intent_cache": intent_cache.stats(),
+    }
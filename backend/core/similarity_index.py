@@ -0,0 +1,306 @@
+"""Incremental per-user TF-IDF index used to find similar past chat questions."""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from ..db.database import conversation_history_collection
+
+SIMILARITY_LOOKBACK_DAYS = int(os.getenv("SIMILARITY_LOOKBACK_DAYS", 30))
+SIMILARITY_INDEX_MAX_USERS = int(os.getenv("SIMILARITY_INDEX_MAX_USERS", 1000))
+SIMILARITY_INDEX_MAX_DOCS = int(os.getenv("SIMILARITY_INDEX_MAX_DOCS", 2000))  # per user
+# With several workers, conversations stored by another process reach this one's index within this interval
+SIMILARITY_INDEX_SYNC_SECONDS = float(os.getenv("SIMILARITY_INDEX_SYNC_SECONDS", 30))
+SIMILARITY_INDEX_DIR = os.getenv(
+    "SIMILARITY_INDEX_DIR",
+    os.path.join(tempfile.gettempdir(), "360fitness_similarity_index")
+)
+
+# Same tokenization as TfidfVectorizer(stop_words='english')
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS]
+
+
+def to_epoch(timestamp: datetime) -> float:
+    """Conversation timestamps are stored as naive UTC datetimes"""
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def lookback_cutoff() -> float:
+    return to_epoch(datetime.utcnow() - timedelta(days=SIMILARITY_LOOKBACK_DAYS))
+
+
+class UserSimilarityIndex:
+    """
+    Sparse TF-IDF vectors for one user's past questions, kept in an inverted index.
+    Document vectors are weighted with the idf at insertion time and fully re-weighted once as many
+    documents have been added as the index held at the last re-weight, so a lookup is a single
+    sparse dot product instead of a refit.
+    Only term counts and conversation ids are kept; the text stays in MongoDB.
+    """
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.docs = {}  # doc_id -> {"conversation_id", "timestamp", "counts"} in timestamp order
+        self.doc_freq = {}  # term -> number of docs containing it
+        self.postings = {}  # term -> {doc_id: l2-normalized tf-idf weight}
+        self.next_doc_id = 0
+        self.weighted_at = 0  # corpus size at the last full re-weight
+        self.added_since_reweight = 0
+        self.last_timestamp = 0.0
+
+    def _idf(self, term: str) -> float:
+        # Smoothed idf, matching TfidfVectorizer's default
+        n_docs = len(self.docs)
+        return math.log((1 + n_docs) / (1 + self.doc_freq.get(term, 0))) + 1
+
+    def _weights(self, counts):
+        weights = {term: count * self._idf(term) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if not norm:
+            return {}
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def _index_doc(self, doc_id, counts):
+        for term, weight in self._weights(counts).items():
+            self.postings.setdefault(term, {})[doc_id] = weight
+
+    def add(self, conversation_id: str, timestamp: float, message: str = None, counts=None):
+        counts = counts if counts is not None else dict(Counter(tokenize(message)))
+        doc_id = self.next_doc_id
+        self.next_doc_id += 1
+        self.docs[doc_id] = {"conversation_id": conversation_id, "timestamp": timestamp, "counts": counts}
+        for term in counts:
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+        self._index_doc(doc_id, counts)
+        self.last_timestamp = max(self.last_timestamp, timestamp)
+        self.added_since_reweight += 1
+
+        while len(self.docs) > SIMILARITY_INDEX_MAX_DOCS:
+            self._remove(next(iter(self.docs)))
+
+        # Counted in additions, not corpus size, so a full index (capped at MAX_DOCS) keeps re-weighting
+        if self.added_since_reweight >= max(self.weighted_at, 8):
+            self.reweight()
+
+    def _remove(self, doc_id):
+        doc = self.docs.pop(doc_id)
+        for term in doc["counts"]:
+            self.doc_freq[term] -= 1
+            if self.doc_freq[term] <= 0:
+                del self.doc_freq[term]
+            term_postings = self.postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(doc_id, None)
+                if not term_postings:
+                    del self.postings[term]
+
+    def prune(self, cutoff: float):
+        """Drop conversations older than the lookback window (docs are kept oldest first)"""
+        while self.docs:
+            oldest_id = next(iter(self.docs))
+            if self.docs[oldest_id]["timestamp"] >= cutoff:
+                break
+            self._remove(oldest_id)
+
+    def reweight(self):
+        self.postings = {}
+        for doc_id, doc in self.docs.items():
+            self._index_doc(doc_id, doc["counts"])
+        self.weighted_at = len(self.docs)
+        self.added_since_reweight = 0
+
+    def query(self, question: str):
+        """Return (doc, cosine similarity) of the most similar past question, or None; doc holds its conversation id"""
+        query_weights = self._weights(Counter(tokenize(question)))
+        if not query_weights:
+            return None
+
+        scores = defaultdict(float)
+        for term, query_weight in query_weights.items():
+            for doc_id, doc_weight in self.postings.get(term, {}).items():
+                scores[doc_id] += query_weight * doc_weight
+        if not scores:
+            return None
+
+        best_id = max(scores, key=scores.get)
+        return self.docs[best_id], scores[best_id]
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "last_timestamp": self.last_timestamp,
+            "docs": list(self.docs.values()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(data["user_id"])
+        for doc in data.get("docs", []):
+            index.add(doc["conversation_id"], doc["timestamp"], counts=doc["counts"])
+        index.reweight()
+        index.last_timestamp = max(index.last_timestamp, data.get("last_timestamp", 0.0))
+        return index
+
+
+class SimilarityIndexStore:
+    """
+    LRU of per-user indexes, persisted to SIMILARITY_INDEX_DIR so they survive restarts.
+    MongoDB is the source of truth: indexes only grow by catching up on conversations newer than
+    their last_timestamp, so conversations stored by other workers are picked up as well.
+    """
+    _indexes = OrderedDict()
+    _loading = {}
+    _syncing = {}  # user_id -> catch-up in flight, shared by concurrent lookups
+    _synced_at = {}  # user_id -> loop time of the last catch-up
+    _stale = set()  # users with a conversation stored by this process since the last catch-up
+    _dirty = set()
+
+    @staticmethod
+    def _path(user_id: str) -> str:
+        file_name = hashlib.sha1(user_id.encode("utf-8")).hexdigest() + ".json"
+        return os.path.join(SIMILARITY_INDEX_DIR, file_name)
+
+    @classmethod
+    def _read_from_disk(cls, user_id: str):
+        path = cls._path(user_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if any("conversation_id" not in doc for doc in data.get("docs", [])):
+                # Older files held the chat text itself; drop them and rebuild from MongoDB
+                os.remove(path)
+                return None
+            return UserSimilarityIndex.from_dict(data)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading similarity index for {user_id}: {str(e)}")
+            return None
+
+    @classmethod
+    def _write_to_disk(cls, data):
+        path = cls._path(data["user_id"])
+        try:
+            os.makedirs(SIMILARITY_INDEX_DIR, mode=0o700, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            # Readable by the service user only, like the FatSecret token store
+            with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error persisting similarity index for {data['user_id']}: {str(e)}")
+
+    @classmethod
+    async def _catch_up(cls, index: UserSimilarityIndex):
+        """Add the conversations stored since the index's last_timestamp"""
+        user_id = index.user_id
+        cls._stale.discard(user_id)
+        cls._synced_at[user_id] = asyncio.get_running_loop().time()
+        since = max(index.last_timestamp, lookback_cutoff())
+        # Newest first so a long gap keeps the most recent conversations, then added oldest first
+        cursor = conversation_history_collection.find(
+            {"user_id": user_id, "timestamp": {"$gt": datetime.utcfromtimestamp(since)}},
+            {"message": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(SIMILARITY_INDEX_MAX_DOCS)
+        conversations = await cursor.to_list(length=SIMILARITY_INDEX_MAX_DOCS)
+        for conv in reversed(conversations):
+            index.add(str(conv["_id"]), to_epoch(conv["timestamp"]), message=conv["message"])
+        if conversations:
+            cls._dirty.add(user_id)
+
+    @classmethod
+    async def _sync(cls, index: UserSimilarityIndex):
+        user_id = index.user_id
+        if user_id not in cls._syncing:
+            cls._syncing[user_id] = asyncio.ensure_future(cls._catch_up(index))
+        try:
+            await asyncio.shield(cls._syncing[user_id])
+        finally:
+            cls._syncing.pop(user_id, None)
+
+    @classmethod
+    async def _load(cls, user_id: str):
+        index = await asyncio.to_thread(cls._read_from_disk, user_id)
+        if index is None:
+            index = UserSimilarityIndex(user_id)
+
+        # Catch up on conversations stored since the index was last persisted
+        await cls._catch_up(index)
+        return index
+
+    @classmethod
+    async def get_index(cls, user_id: str) -> UserSimilarityIndex:
+        if user_id in cls._indexes:
+            cls._indexes.move_to_end(user_id)
+            return cls._indexes[user_id]
+
+        # Concurrent first requests for the same user share a single load
+        if user_id not in cls._loading:
+            cls._loading[user_id] = asyncio.ensure_future(cls._load(user_id))
+        try:
+            index = await asyncio.shield(cls._loading[user_id])
+        finally:
+            cls._loading.pop(user_id, None)
+
+        cls._indexes[user_id] = index
+        cls._indexes.move_to_end(user_id)
+        cls._evict()
+        return index
+
+    @classmethod
+    def _evict(cls):
+        while len(cls._indexes) > SIMILARITY_INDEX_MAX_USERS:
+            user_id, index = cls._indexes.popitem(last=False)
+            cls._stale.discard(user_id)
+            cls._synced_at.pop(user_id, None)
+            if user_id in cls._dirty:
+                cls._dirty.discard(user_id)
+                asyncio.get_running_loop().run_in_executor(None, cls._write_to_disk, index.to_dict())
+
+    @classmethod
+    def record(cls, user_id: str):
+        """A conversation was stored for the user; their index catches up on the next lookup"""
+        if user_id in cls._indexes:
+            cls._stale.add(user_id)
+
+    @classmethod
+    async def find_similar(cls, user_id: str, question: str, min_history: int = 3):
+        index = await cls.get_index(user_id)
+        synced_at = cls._synced_at.get(user_id, 0.0)
+        if user_id in cls._stale or asyncio.get_running_loop().time() - synced_at >= SIMILARITY_INDEX_SYNC_SECONDS:
+            await cls._sync(index)
+        index.prune(lookback_cutoff())
+        if len(index.docs) < min_history:
+            # Not enough data to make meaningful comparisons
+            return None
+        match = index.query(question)
+        if match is None:
+            return None
+
+        doc, score = match
+        conversation = await conversation_history_collection.find_one(
+            {"_id": ObjectId(doc["conversation_id"])}, {"message": 1, "response": 1}
+        )
+        if conversation is None:
+            return None
+        return {"message": conversation["message"], "response": conversation["response"], "timestamp": doc["timestamp"]}, score
+
+    @classmethod
+    async def flush(cls):
+        """Persist every modified index (called on shutdown)"""
+        dirty = [cls._indexes[user_id].to_dict() for user_id in cls._dirty if user_id in cls._indexes]
+        cls._dirty.clear()
+        for data in dirty:
+            await asyncio.to_thread(cls._write_to_disk, data)
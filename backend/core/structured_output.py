@@ -0,0 +1,222 @@
+"""JSON-mode Gemini calls validated against Pydantic models, with repair retries inside a latency budget."""
+import asyncio
+import os
+import re
+
+import google.generativeai as genai
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+from .llm_gateway import LLMGateway, LLMTimeoutError, DEFAULT_MODEL, LLM_TIMEOUT_SECONDS
+
+# Total time one structured call may spend, repairs included
+STRUCTURED_OUTPUT_BUDGET_SECONDS = float(os.getenv("STRUCTURED_OUTPUT_BUDGET_SECONDS", 45))
+STRUCTURED_OUTPUT_MAX_ATTEMPTS = int(os.getenv("STRUCTURED_OUTPUT_MAX_ATTEMPTS", 3))
+# Don't start a repair with less time left than this
+MIN_REPAIR_SECONDS = 3
+# How much of a broken response is echoed back in the repair prompt
+MAX_REPAIR_ECHO_CHARS = 6000
+
+_FENCED_BLOCK = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.IGNORECASE | re.DOTALL)
+
+_GEMINI_TYPES = {"string": "STRING", "number": "NUMBER", "integer": "INTEGER", "boolean": "BOOLEAN"}
+
+
+class StructuredOutputError(Exception):
+    """Raised when no valid response was produced within the attempts and latency budget."""
+
+
+class StructuredOutputTimeoutError(StructuredOutputError):
+    """The Gemini call itself timed out; unlike an invalid response, a later retry may succeed."""
+
+
+def strip_code_fences(text: str) -> str:
+    """The JSON inside a markdown code block, wherever the block is in the response"""
+    match = _FENCED_BLOCK.search(text)
+    return match.group(1) if match else text.strip()
+
+
+def _generation_config_fields():
+    config_class = getattr(genai.types, "GenerationConfig", None)
+    fields = set()
+    for klass in getattr(config_class, "__mro__", []):
+        fields.update(getattr(klass, "__annotations__", {}))
+    return fields
+
+
+# Older SDKs (e.g. 0.3.x) have no JSON mode; prompts and validation still apply there
+_SDK_CONFIG_FIELDS = _generation_config_fields()
+SUPPORTS_JSON_MODE = "response_mime_type" in _SDK_CONFIG_FIELDS
+SUPPORTS_RESPONSE_SCHEMA = "response_schema" in _SDK_CONFIG_FIELDS
+
+
+def _convert_schema(schema: dict, defs: dict):
+    """Pydantic JSON schema -> the OpenAPI subset Gemini accepts (no $ref, no free-form objects)"""
+    if "$ref" in schema:
+        return _convert_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        if len(options) != 1:
+            raise TypeError("Unions are not supported")
+        converted = _convert_schema(options[0], defs)
+        converted["nullable"] = True
+        return converted
+
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        properties = schema.get("properties")
+        if not properties:
+            raise TypeError("Objects without fixed properties are not supported")
+        converted = {
+            "type": "OBJECT",
+            "properties": {name: _convert_schema(value, defs) for name, value in properties.items()},
+        }
+        if schema.get("required"):
+            converted["required"] = schema["required"]
+        return converted
+    if schema_type == "array":
+        return {"type": "ARRAY", "items": _convert_schema(schema.get("items", {}), defs)}
+    if schema_type in _GEMINI_TYPES:
+        converted = {"type": _GEMINI_TYPES[schema_type]}
+        if "enum" in schema:
+            converted["enum"] = schema["enum"]
+        return converted
+    raise TypeError(f"Unsupported schema type: {schema_type}")
+
+
+class StructuredOutput:
+    _adapters = {}  # model -> TypeAdapter, built once per model
+    _schemas = {}  # model -> Gemini response schema, or None when it can't be expressed
+    _metrics = {}  # name -> counters
+
+    @classmethod
+    def _adapter(cls, model):
+        if model not in cls._adapters:
+            cls._adapters[model] = TypeAdapter(model)
+        return cls._adapters[model]
+
+    @classmethod
+    def _response_schema(cls, model):
+        if model not in cls._schemas:
+            json_schema = cls._adapter(model).json_schema()
+            try:
+                cls._schemas[model] = _convert_schema(json_schema, json_schema.get("$defs", {}))
+            except (TypeError, KeyError) as e:
+                print(f"No response schema for {getattr(model, '__name__', model)}: {str(e)}")
+                cls._schemas[model] = None
+        return cls._schemas[model]
+
+    @classmethod
+    def _generation_config(cls, model):
+        if not SUPPORTS_JSON_MODE:
+            return None
+        config = {"response_mime_type": "application/json"}
+        schema = cls._response_schema(model) if SUPPORTS_RESPONSE_SCHEMA else None
+        if schema is not None:
+            config["response_schema"] = schema
+        return config
+
+    @classmethod
+    def _counters(cls, name: str):
+        if name not in cls._metrics:
+            cls._metrics[name] = {"calls": 0, "attempts": 0, "parse_failures": 0, "repaired": 0, "failed": 0}
+        return cls._metrics[name]
+
+    @classmethod
+    def _record_failure(cls, name: str, error: str):
+        counters = cls._counters(name)
+        counters["parse_failures"] += 1
+        rate = counters["parse_failures"] / counters["attempts"]
+        print(f"Structured output parse failure for {name} ({rate:.1%} of {counters['attempts']} attempts): {error}")
+
+    @classmethod
+    def _repair_prompt(cls, model, response_text: str, error: str) -> str:
+        return f"""
+        Your previous response could not be used because it was not valid JSON for the required structure.
+
+        Errors:
+        {error}
+
+        Previous response:
+        {response_text[:MAX_REPAIR_ECHO_CHARS]}
+
+        Required JSON schema:
+        {orjson.dumps(cls._adapter(model).json_schema()).decode()}
+
+        Return ONLY the corrected JSON object, with no additional text, explanations or code fences.
+        """
+
+    @classmethod
+    async def generate(cls, contents, model, name: str = None, model_name: str = DEFAULT_MODEL,
+                       budget_seconds: float = None, max_attempts: int = None):
+        """
+        Generate and validate a response as `model` (a Pydantic model or type).
+        Invalid responses are repaired with a text-only follow-up prompt while attempts and budget remain.
+        """
+        name = name or getattr(model, "__name__", str(model))
+        budget_seconds = budget_seconds or STRUCTURED_OUTPUT_BUDGET_SECONDS
+        max_attempts = max_attempts or STRUCTURED_OUTPUT_MAX_ATTEMPTS
+        adapter = cls._adapter(model)
+        generation_config = cls._generation_config(model)
+        kwargs = {"generation_config": generation_config} if generation_config else {}
+
+        counters = cls._counters(name)
+        counters["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget_seconds
+        last_error = None
+
+        for attempt in range(max_attempts):
+            remaining = deadline - loop.time()
+            if attempt and remaining < MIN_REPAIR_SECONDS:
+                break
+            counters["attempts"] += 1
+            try:
+                response = await LLMGateway.generate_content(
+                    contents, model_name=model_name, timeout=min(remaining, LLM_TIMEOUT_SECONDS), **kwargs
+                )
+            except LLMTimeoutError as e:
+                # The budget is spent either way; callers only have to handle StructuredOutputError
+                counters["failed"] += 1
+                raise StructuredOutputTimeoutError(f"Gemini API timed out: {str(e)}")
+            try:
+                response_text = response.text
+            except ValueError as e:
+                # Blocked or empty candidates have no text; repairing them won't help
+                cls._record_failure(name, str(e))
+                counters["failed"] += 1
+                raise StructuredOutputError(f"Empty response from Gemini API: {str(e)}")
+
+            try:
+                result = adapter.validate_json(strip_code_fences(response_text))
+            except ValidationError as e:
+                last_error = str(e)
+                cls._record_failure(name, last_error)
+                contents = cls._repair_prompt(model, response_text, last_error)
+                continue
+
+            if attempt:
+                counters["repaired"] += 1
+            return result
+
+        counters["failed"] += 1
+        raise StructuredOutputError(f"Invalid AI response format: {last_error}")
+
+    @classmethod
+    def get_metrics(cls):
+        metrics = {}
+        for name, counters in cls._metrics.items():
+            metrics[name] = {
+                **counters,
+                "parse_failure_rate": round(counters["parse_failures"] / counters["attempts"], 4) if counters["attempts"] else 0.0,
+            }
+        return {
+            "json_mode": SUPPORTS_JSON_MODE,
+            "response_schema": SUPPORTS_RESPONSE_SCHEMA,
+            "calls": metrics,
+        }
+
+
+async def generate_structured(contents, model, name: str = None, **kwargs):
+    """Module-level shortcut used by the services and routers"""
+    return await StructuredOutput.generate(contents, model, name=name, **kwargs)
@@ -0,0 +1,31 @@
+import asyncio
+from collections import defaultdict
+
+from .database import meal_diary_collection, exercise_diary_collection, weight_diary_collection
+from ..services.rollupService import refresh_daily_rollups
+
+# Run from the repository root: python -m backend.db.backfill_daily_rollups
+
+async def backfill_daily_rollups():
+    try:
+        # Every (user, date) that has at least one diary
+        dates_by_user = defaultdict(set)
+        for collection in [meal_diary_collection, exercise_diary_collection, weight_diary_collection]:
+            async for diary in collection.find({}, {"_id": 0, "user_id": 1, "date": 1}):
+                dates_by_user[diary["user_id"]].add(diary["date"])
+
+        total = 0
+        for user_id, dates in dates_by_user.items():
+            dates = sorted(dates)
+            # Batches keep each $in and bulk write small
+            for i in range(0, len(dates), 100):
+                rollups = await refresh_daily_rollups(user_id, dates[i:i + 100])
+                total += len(rollups)
+
+        print(f"Backfilled {total} daily rollups for {len(dates_by_user)} users")
+    except Exception as e:
+        print(f"Error during backfill: {e}")
+
+# Run the backfill
+if __name__ == "__main__":
+    asyncio.run(backfill_daily_rollups())
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import statistics
+import time
+from datetime import date
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from .database import push_meal_log
+
+# Compares the old find/insert/update/find add_meal_log path with the single upsert path.
+# Run from the repository root: python -m backend.db.benchmark_meal_log_upsert
+# Uses a throwaway collection, the real meal_diary is never touched.
+
+CONCURRENCY = int(os.getenv("BENCHMARK_CONCURRENCY", 50))
+ROUNDS = int(os.getenv("BENCHMARK_ROUNDS", 20))
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands sent to the server (one per round trip)"""
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in ("hello", "isMaster", "ping", "endSessions"):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def sample_meal_log(user_id, meal_log_date):
+    return {
+        "user_id": user_id,
+        "meal_type": "breakfast",
+        "food_id": "35718",
+        "food_name": "Banana",
+        "quantity_consumed": 1.0,
+        "food_description": "Per 100g - Calories: 89kcal | Fat: 0.33g | Carbs: 22.84g | Protein: 1.09g",
+        "calories_per_serving": 89.0,
+        "fat_per_serving": 0.33,
+        "carbs_per_serving": 22.84,
+        "protein_per_serving": 1.09,
+        "meal_log_date": meal_log_date,
+        "total_calories": 89.0,
+        "total_fat": 0.33,
+        "total_carbs": 22.84,
+        "total_protein": 1.09
+    }
+
+
+async def old_add_meal_log(collection, user_id, meal_log_date, meal_type, meal_log_dict):
+    """The previous add_meal_log write path"""
+    existing_meal_diary = await collection.find_one({"user_id": user_id, "date": meal_log_date})
+    if not existing_meal_diary:
+        await collection.insert_one({
+            "user_id": user_id,
+            "date": meal_log_date,
+            "breakfast": [],
+            "lunch": [],
+            "dinner": [],
+            "snacks": [],
+            "daily_nutrition_summary": {"total_calories": 0, "total_fat": 0, "total_carbs": 0, "total_protein": 0}
+        })
+    await collection.update_one(
+        {"user_id": user_id, "date": meal_log_date},
+        {
+            "$push": {meal_type: meal_log_dict},
+            "$inc": {
+                "daily_nutrition_summary.total_calories": meal_log_dict["total_calories"],
+                "daily_nutrition_summary.total_fat": meal_log_dict["total_fat"],
+                "daily_nutrition_summary.total_carbs": meal_log_dict["total_carbs"],
+                "daily_nutrition_summary.total_protein": meal_log_dict["total_protein"]
+            }
+        }
+    )
+    return await collection.find_one({"user_id": user_id, "date": meal_log_date})
+
+
+async def new_add_meal_log(collection, user_id, meal_log_date, meal_type, meal_log_dict):
+    return await push_meal_log(user_id, meal_log_date, meal_type, meal_log_dict, collection=collection)
+
+
+async def run(name, write_path, collection, counter):
+    latencies = []
+    errors = 0
+    commands_before = counter.count
+
+    async def timed(user_id, meal_log_date):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await write_path(collection, user_id, meal_log_date, "breakfast", sample_meal_log(user_id, meal_log_date))
+        except Exception:
+            errors += 1  # e.g. DuplicateKeyError when two first-of-day inserts race
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    for round_number in range(ROUNDS):
+        # Every request in a round targets the same user/date, and the first of them creates the diary
+        user_id = f"benchmark-{name}-{round_number}"
+        meal_log_date = date.today().isoformat()
+        await asyncio.gather(*(timed(user_id, meal_log_date) for _ in range(CONCURRENCY)))
+
+    requests = ROUNDS * CONCURRENCY
+    round_trips = counter.count - commands_before
+    diaries = await collection.count_documents({"user_id": {"$regex": f"^benchmark-{name}-"}})
+    logged = await collection.aggregate([
+        {"$match": {"user_id": {"$regex": f"^benchmark-{name}-"}}},
+        {"$group": {"_id": None, "count": {"$sum": {"$size": "$breakfast"}}}}
+    ]).to_list(length=1)
+
+    latencies.sort()
+    print(f"\n{name} path ({requests} requests, {CONCURRENCY} concurrent per user/date)")
+    print(f"  round trips per request: {round_trips / requests:.2f}")
+    print(f"  p50: {statistics.median(latencies):.2f} ms")
+    print(f"  p99: {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms")
+    print(f"  failed requests: {errors}")
+    print(f"  diaries: {diaries}, meal logs stored: {logged[0]['count'] if logged else 0}")
+
+
+async def benchmark_meal_log_upsert():
+    # Load environment variables
+    load_dotenv()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI"), event_listeners=[counter])
+    db = client['360DegreeFitness']
+    collection = db['meal_diary_benchmark']
+
+    try:
+        await collection.drop()
+        await collection.create_index([("user_id", 1), ("date", 1)], unique=True, name="user_id_date_unique")
+
+        await run("old", old_add_meal_log, collection, counter)
+        await run("new", new_add_meal_log, collection, counter)
+    except Exception as e:
+        print(f"Error during benchmark: {e}")
+    finally:
+        await collection.drop()
+        client.close()
+
+# Run the benchmark
+if __name__ == "__main__":
+    asyncio.run(benchmark_meal_log_upsert())
@@ -3,6 +3,8 @@ from datetime import datetime
 from dotenv import load_dotenv
 from mongoengine import Document, StringField, DateTimeField
 from motor.motor_asyncio import AsyncIOMotorClient  # Use AsyncIO MongoDB client
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from decimal import Decimal
 import json
 from bson import ObjectId
@@ -30,6 +32,11 @@ exercise_diary_collection = db["exercise_diary"] # for storing users' exercise d
 weight_diary_collection = db["weight_diary"] # for storing users' weight diary and weight logs
 nutrition_goals_collection = db["nutrition_goals"]
 fitness_plans_collection = db.get_collection("fitness_plans")
+food_cache_collection = db["food_cache"] # cached FatSecret search/food responses
+food_catalog_collection = db["food_catalog"] # every food we've seen, keyed by FatSecret food_id
+daily_rollups_collection = db["daily_rollups"] # per (user, date) intake, burn, weight and caloric balance
+plan_jobs_collection = db["plan_jobs"] # queued/running/finished fitness plan generations
+plan_templates_collection = db["plan_templates"] # validated plans keyed by a quantized profile fingerprint
 
 # Decimal handling
 class DecimalEncoder(json.JSONEncoder):
@@ -58,15 +65,174 @@ async def log_profile_change(user_id, change_data):
 
 
 # CRUD operations for meal diary
-async def get_meal(user_id, date=None, start_date=None, end_date=None): # Used for retrieving meal logs within a date range.
+async def get_meal(user_id, date=None, start_date=None, end_date=None, limit=None, after=None, projection=None): # Used for retrieving meal logs within a date range.
+    """
+    Keyset pagination over the user_id_date_unique index: diaries come back in date order,
+    starting after the `after` date and at most `limit` of them.
+    """
     query = {"user_id": user_id}
     
     if date:
         query["date"] = date
     elif start_date and end_date:
         query["date"] = {"$gte": start_date, "$lte": end_date}
+
+    if after:
+        date_range = query.get("date")
+        if isinstance(date_range, dict):
+            date_range["$gt"] = after
+        elif date_range is None:
+            query["date"] = {"$gt": after}
+        elif date_range <= after:
+            return []
     
-    return await meal_diary_collection.find(query).to_list(length=None)
+    cursor = meal_diary_collection.find(query, projection).sort("date", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(length=limit)
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner", "snacks"]
+
+async def push_meal_log(user_id, meal_log_date, meal_type, meal_log_dict, collection=None): # Used for adding a meal log.
+    """
+    Append a meal log and bump the daily summary in one round trip, creating the day's diary if needed.
+    Returns the updated diary.
+    """
+    collection = meal_diary_collection if collection is None else collection
+    query = {"user_id": user_id, "date": meal_log_date}
+    update = {
+        # The pushed meal type and the $inc'd summary are created by the update itself
+        "$setOnInsert": {other_type: [] for other_type in MEAL_TYPES if other_type != meal_type},
+        "$push": {meal_type: meal_log_dict},
+        "$inc": {
+            "daily_nutrition_summary.total_calories": meal_log_dict["total_calories"],
+            "daily_nutrition_summary.total_fat": meal_log_dict["total_fat"],
+            "daily_nutrition_summary.total_carbs": meal_log_dict["total_carbs"],
+            "daily_nutrition_summary.total_protein": meal_log_dict["total_protein"]
+        }
+    }
+    try:
+        return await collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # Another request created the diary first; the retry matches it instead of inserting
+        return await collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+
+async def bulk_upsert_diaries(collection, updates_by_key): # Used by the bulk logging endpoints.
+    """
+    updates_by_key maps (user_id, date) -> update document; each day becomes one upsert in a single bulk_write.
+    Returns {(user_id, date): error message} for the days that could not be written.
+    """
+    keys = list(updates_by_key)
+    failed = {}
+    for attempt in range(2):
+        if not keys:
+            break
+        operations = [
+            UpdateOne({"user_id": user_id, "date": log_date}, updates_by_key[(user_id, log_date)], upsert=True)
+            for user_id, log_date in keys
+        ]
+        try:
+            await collection.bulk_write(operations, ordered=False)
+            return failed
+        except BulkWriteError as e:
+            retry_keys = []
+            for error in e.details.get("writeErrors", []):
+                key = keys[error["index"]]
+                # Concurrent first-of-day upserts race on user_id_date_unique; the retry matches instead
+                if error.get("code") == 11000 and attempt == 0:
+                    retry_keys.append(key)
+                else:
+                    failed[key] = error.get("errmsg", "Write failed")
+            keys = retry_keys
+    return failed
+
+def build_meal_logs_update(meal_logs): # Used for adding many meal logs to one day.
+    logs_by_type = {}
+    for meal_log in meal_logs:
+        logs_by_type.setdefault(meal_log["meal_type"], []).append(meal_log)
+    update = {
+        "$push": {meal_type: {"$each": logs} for meal_type, logs in logs_by_type.items()},
+        "$inc": {
+            "daily_nutrition_summary.total_calories": sum(log["total_calories"] for log in meal_logs),
+            "daily_nutrition_summary.total_fat": sum(log["total_fat"] for log in meal_logs),
+            "daily_nutrition_summary.total_carbs": sum(log["total_carbs"] for log in meal_logs),
+            "daily_nutrition_summary.total_protein": sum(log["total_protein"] for log in meal_logs)
+        }
+    }
+    # MongoDB rejects an empty operator, which this is when the batch covers every meal type
+    missing_meal_types = {meal_type: [] for meal_type in MEAL_TYPES if meal_type not in logs_by_type}
+    if missing_meal_types:
+        update["$setOnInsert"] = missing_meal_types
+    return update
+
+# Write operations for exercise diary
+def build_exercise_logs_update(exercise_log_dicts): # Used for adding many exercise logs to one day.
+    return {
+        "$push": {"exercises": {"$each": exercise_log_dicts}},
+        "$inc": {
+            "daily_exercise_summary.total_calories_burnt": float(sum(log["calories_burnt"] for log in exercise_log_dicts)),
+            "daily_exercise_summary.total_duration": sum(log["duration_minutes"] for log in exercise_log_dicts)
+        }
+    }
+
+async def push_exercise_logs(user_id, exercise_log_date, exercise_log_dicts, collection=None): # Used for adding exercise logs.
+    """
+    Append exercise logs and $inc the daily summary in one upsert, so concurrent logs can't lose updates.
+    Returns the updated diary.
+    """
+    collection = exercise_diary_collection if collection is None else collection
+    query = {"user_id": user_id, "date": exercise_log_date}
+    update = build_exercise_logs_update(exercise_log_dicts)
+    try:
+        return await collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # Another request created the diary first; the retry matches it instead of inserting
+        return await collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+
+# Delete-by-id for diary entries: a projected read of the one entry, then an atomic $pull + negative $inc
+async def _pull_diary_entry(collection, user_id, log_date, array_field, entry_id, summary_increments):
+    """
+    summary_increments maps a summary field to the entry field it was built from.
+    Returns the updated diary, or None if the entry doesn't exist (or was removed concurrently).
+    """
+    if summary_increments:
+        diary = await collection.find_one(
+            {"user_id": user_id, "date": log_date, f"{array_field}.entry_id": entry_id},
+            {array_field: {"$elemMatch": {"entry_id": entry_id}}}
+        )
+        if not diary or not diary.get(array_field):
+            return None
+        entry = diary[array_field][0]
+        update = {
+            "$pull": {array_field: {"entry_id": entry_id}},
+            "$inc": {summary_field: -entry.get(entry_field, 0) for summary_field, entry_field in summary_increments.items()}
+        }
+    else:
+        update = {"$pull": {array_field: {"entry_id": entry_id}}}
+
+    # The entry_id in the filter ties the $inc to the $pull actually happening
+    return await collection.find_one_and_update(
+        {"user_id": user_id, "date": log_date, f"{array_field}.entry_id": entry_id},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+
+async def pull_meal_log(user_id, meal_log_date, meal_type, entry_id): # Used for deleting a meal log by id.
+    return await _pull_diary_entry(meal_diary_collection, user_id, meal_log_date, meal_type, entry_id, {
+        "daily_nutrition_summary.total_calories": "total_calories",
+        "daily_nutrition_summary.total_fat": "total_fat",
+        "daily_nutrition_summary.total_carbs": "total_carbs",
+        "daily_nutrition_summary.total_protein": "total_protein"
+    })
+
+async def pull_exercise_log(user_id, exercise_log_date, entry_id): # Used for deleting an exercise log by id.
+    return await _pull_diary_entry(exercise_diary_collection, user_id, exercise_log_date, "exercises", entry_id, {
+        "daily_exercise_summary.total_calories_burnt": "calories_burnt",
+        "daily_exercise_summary.total_duration": "duration_minutes"
+    })
+
+async def pull_weight_log(user_id, weight_log_date, entry_id): # Used for deleting a weight log by id.
+    return await _pull_diary_entry(weight_diary_collection, user_id, weight_log_date, "weights", entry_id, None)
 
 async def update_meal_log(log_id, update_data): # Used for updating a meal log.
     update_data['updated_at'] = datetime.utcnow()
@@ -163,6 +329,57 @@ async def setup_meal_diary_indexes():
     except Exception as e:
         print(f"Error setting up meal diary indexes: {e}")
 
+async def setup_daily_rollups_indexes():
+    """Create indexes for daily rollups collection"""
+    try:
+        # Create a compound index on user_id and date
+        await daily_rollups_collection.create_index(
+            [("user_id", 1), ("date", 1)],
+            unique=True,
+            name="user_id_date_unique"  # Give it a specific name
+        )
+    except Exception as e:
+        print(f"Error setting up daily rollups indexes: {e}")
+
+async def setup_food_cache_indexes():
+    """Create the TTL index that expires cached FatSecret responses"""
+    try:
+        await food_cache_collection.create_index(
+            "expires_at",
+            expireAfterSeconds=0,
+            name="expires_at_ttl"
+        )
+    except Exception as e:
+        print(f"Error setting up food cache indexes: {e}")
+
+async def setup_plan_jobs_indexes():
+    """Create indexes for plan jobs collection"""
+    try:
+        # At most one queued job per user, so repeated profile saves collapse into it
+        await plan_jobs_collection.create_index(
+            "user_id",
+            unique=True,
+            partialFilterExpression={"status": "queued"},
+            name="user_id_queued_unique"
+        )
+        # Workers claim the oldest claimable job
+        await plan_jobs_collection.create_index([("status", 1), ("created_at", 1)], name="status_created_at")
+        # Finished jobs are only kept around for status polling
+        await plan_jobs_collection.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+    except Exception as e:
+        print(f"Error setting up plan jobs indexes: {e}")
+
+async def setup_plan_templates_indexes():
+    """Create the TTL index that ages out plan templates"""
+    try:
+        await plan_templates_collection.create_index(
+            "expires_at",
+            expireAfterSeconds=0,
+            name="expires_at_ttl"
+        )
+    except Exception as e:
+        print(f"Error setting up plan templates indexes: {e}")
+
 # This function runs when your app starts (called from app.py)
 # It ensures your database indexes are set up
 async def init_db():
@@ -172,5 +389,9 @@ async def init_db():
         await setup_exercise_diary_indexes()
         await setup_weight_diary_indexes()
         await setup_nutrition_goals_indexes()
+        await setup_food_cache_indexes()
+        await setup_daily_rollups_indexes()
+        await setup_plan_jobs_indexes()
+        await setup_plan_templates_indexes()
     except Exception as e:
         print(f"Error setting up database indexes: {e}")
\ No newline at end of file
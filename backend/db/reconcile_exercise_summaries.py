@@ -0,0 +1,57 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+# Recomputes daily_exercise_summary from the exercises list for every diary whose summary drifted.
+# Usage: python reconcile_exercise_summaries.py [--dry-run]
+
+# Summary as the server would compute it from the exercises array
+RECOMPUTED_SUMMARY = {
+    "total_calories_burnt": {"$toDouble": {"$sum": {"$ifNull": ["$exercises.calories_burnt", []]}}},
+    "total_duration": {"$sum": {"$ifNull": ["$exercises.duration_minutes", []]}}
+}
+
+async def reconcile_exercise_summaries(dry_run=False):
+    # Load environment variables
+    load_dotenv()
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI"))
+    db = client['360DegreeFitness']
+    exercise_diary_collection = db['exercise_diary']
+
+    try:
+        # Only touch documents whose stored summary differs from the recomputed one
+        drifted = {
+            "$expr": {
+                "$or": [
+                    {"$ne": [{"$ifNull": ["$daily_exercise_summary.total_calories_burnt", None]},
+                             RECOMPUTED_SUMMARY["total_calories_burnt"]]},
+                    {"$ne": [{"$ifNull": ["$daily_exercise_summary.total_duration", None]},
+                             RECOMPUTED_SUMMARY["total_duration"]]}
+                ]
+            }
+        }
+
+        drifted_count = await exercise_diary_collection.count_documents(drifted)
+        print(f"Found {drifted_count} exercise diaries with a drifted summary")
+        if dry_run or drifted_count == 0:
+            return
+
+        # Pipeline update: the recompute runs on the server, no documents are shipped to the client
+        result = await exercise_diary_collection.update_many(
+            drifted,
+            [{"$set": {"daily_exercise_summary": RECOMPUTED_SUMMARY}}]
+        )
+        print(f"Updated {result.modified_count} documents")
+
+    except Exception as e:
+        print(f"Error during reconciliation: {e}")
+    finally:
+        client.close()
+
+# Run the reconciliation
+if __name__ == "__main__":
+    asyncio.run(reconcile_exercise_summaries(dry_run="--dry-run" in sys.argv))
@@ -0,0 +1,48 @@
+import asyncio
+
+from .database import fitness_plans_collection, profiles_collection
+from ..services.planService import validate_generated_plan
+from ..services.planTemplateService import PlanTemplateCache, profile_fingerprint, template_key
+
+# Seeds plan_templates from the plans users already have, so the first user of each
+# profile archetype is served without a Gemini call.
+# Run from the repository root: python -m backend.db.warm_plan_templates
+
+async def warm_plan_templates():
+    try:
+        scanned = 0
+        stored = 0
+        skipped = 0
+        seen = set()
+
+        async for fitness_plan in fitness_plans_collection.find({}):
+            scanned += 1
+            # Plans are stored with the user_id as an ObjectId, profiles with the string
+            user_profile = await profiles_collection.find_one({"user_id": str(fitness_plan["user_id"])})
+            if not user_profile:
+                skipped += 1
+                continue
+
+            key = template_key(profile_fingerprint(user_profile))
+            if key in seen:
+                continue
+
+            try:
+                validate_generated_plan(fitness_plan)
+            except (ValueError, TypeError) as e:
+                # Leave the archetype open so a later valid plan can seed it
+                print(f"Skipping invalid plan {fitness_plan['_id']}: {e}")
+                skipped += 1
+                continue
+            seen.add(key)
+
+            if await PlanTemplateCache.store(user_profile, fitness_plan):
+                stored += 1
+
+        print(f"Scanned {scanned} fitness plans: {stored} new templates, {len(seen)} archetypes, {skipped} skipped")
+    except Exception as e:
+        print(f"Error warming plan templates: {e}")
+
+# Run the warm-up
+if __name__ == "__main__":
+    asyncio.run(warm_plan_templates())
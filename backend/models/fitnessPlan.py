@@ -29,4 +29,36 @@ class FitnessPlan(BaseModel):
     plan_duration: str #Duration of the fitness plan
     user_meal_plan: MealPlan #User's 1 week meal plan
     user_workout_plan: WorkoutPlan #User's 1 week exercise plan
-    user_sleep_and_lifestyle_suggestions: SleepAndLifestyleSuggestions
\ No newline at end of file
+    user_sleep_and_lifestyle_suggestions: SleepAndLifestyleSuggestions
+
+# Shapes of the plans Gemini generates (validated before a plan is saved)
+class MealPlanDay(BaseModel):
+    breakfast: str
+    lunch: str
+    dinner: str
+    snack: str
+
+class GeneratedMealPlan(BaseModel):
+    day_1: MealPlanDay
+    day_2: MealPlanDay
+    day_3: MealPlanDay
+    day_4: MealPlanDay
+    day_5: MealPlanDay
+    day_6: MealPlanDay
+    day_7: MealPlanDay
+
+class GeneratedFitnessPlan(BaseModel):
+    plan_duration: str
+    meal_plan: GeneratedMealPlan
+    workout_plan: WorkoutPlan
+    sleep_and_lifestyle_suggestions: SleepAndLifestyleSuggestions
+
+# Single sections, for regenerating part of a stored plan
+class MealPlanSection(BaseModel):
+    meal_plan: GeneratedMealPlan
+
+class WorkoutPlanSection(BaseModel):
+    workout_plan: WorkoutPlan
+
+class SleepAndLifestyleSection(BaseModel):
+    sleep_and_lifestyle_suggestions: SleepAndLifestyleSuggestions
@@ -0,0 +1,71 @@
+import re
+
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Optional, Union
+
+# Shapes of the nutrition Gemini reads from food and nutrition label photos
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_amount(value):
+    """Amounts as printed on labels ("10g", "160 mg", "1,200 kcal", "<1g") -> float, None if there is no number"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER.search(value.replace(",", ""))
+        return float(match.group()) if match else None
+    return value
+
+
+class NutritionLabelInfo(BaseModel):
+    food_name: Optional[str] = None
+    serving_size: Optional[str] = None
+    calories: Optional[float] = None
+    total_fat: Optional[float] = None  # g
+    saturated_fat: Optional[float] = None  # g
+    trans_fat: Optional[float] = None  # g
+    cholesterol: Optional[float] = None  # mg
+    sodium: Optional[float] = None  # mg
+    total_carbohydrates: Optional[float] = None  # g
+    dietary_fiber: Optional[float] = None  # g
+    sugars: Optional[float] = None  # g
+    protein: Optional[float] = None  # g
+    vitamins_minerals: Optional[Dict[str, Union[str, float]]] = None  # e.g. {"Calcium": "20%"} or {"Iron": 8}
+
+    @field_validator(
+        "calories", "total_fat", "saturated_fat", "trans_fat", "cholesterol", "sodium",
+        "total_carbohydrates", "dietary_fiber", "sugars", "protein", mode="before"
+    )
+    @classmethod
+    def strip_units(cls, value):
+        return parse_amount(value)
+
+class FoodItemNutrition(BaseModel):
+    food_name: str
+    portion_size: Optional[str] = None
+    calories: Optional[float] = None
+    protein: Optional[float] = None
+    carbohydrates: Optional[float] = None
+    fat: Optional[float] = None
+
+    @field_validator("calories", "protein", "carbohydrates", "fat", mode="before")
+    @classmethod
+    def strip_units(cls, value):
+        return parse_amount(value)
+
+class TotalNutrition(BaseModel):
+    calories: Optional[float] = None
+    protein: Optional[float] = None
+    carbohydrates: Optional[float] = None
+    fat: Optional[float] = None
+
+    @field_validator("calories", "protein", "carbohydrates", "fat", mode="before")
+    @classmethod
+    def strip_units(cls, value):
+        return parse_amount(value)
+
+class FoodImageAnalysis(BaseModel):
+    meal_description: Optional[str] = None
+    food_items: List[FoodItemNutrition] = []
+    total_nutrition: Optional[TotalNutrition] = None
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Dict, Any
 from pydantic import BaseModel
 from datetime import date
 
@@ -11,4 +11,13 @@ class UserExerciseLogger(BaseModel):
 class UserExerciseDiary(BaseModel):
     user_id: str
     date: date
-    exercises: List[UserExerciseLogger] = []
\ No newline at end of file
+    exercises: List[UserExerciseLogger] = []
+
+class UserExerciseLogEntry(UserExerciseLogger):
+    # A single exercise with its owner and date, used by bulk ingest
+    user_id: str
+    date: date
+
+class UserExerciseLogBatch(BaseModel):
+    # Items are validated one by one against UserExerciseLogEntry so one bad item doesn't reject the batch
+    exercise_logs: List[Dict[str, Any]]
@@ -1,4 +1,4 @@
-from typing import Literal, List
+from typing import Literal, List, Dict, Any
 from pydantic import BaseModel, condecimal, computed_field
 from datetime import date
 
@@ -55,3 +55,7 @@ class UserMealDiary(BaseModel):
         "total_carbs": 0,
         "total_protein": 0
     }
+
+class UserMealLogBatch(BaseModel):
+    # Items are validated one by one against UserMealLogger so one bad item doesn't reject the batch
+    meal_logs: List[Dict[str, Any]]
@@ -1,75 +1,75 @@
-import httpx
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from datetime import date
 
-from ..db.database import meal_diary_collection, exercise_diary_collection
+from ..services.rollupService import get_daily_rollup, get_rollup_range, MAX_ROLLUP_RANGE_DAYS
 
 #  get calories consumed from the Meal Logger
 #  get calories burnt from the Exercise Logger
 #  calculate caloric balance or surplus or deficit
+#  all three are precomputed per (user, date) in daily_rollups when the diaries change,
+#  together with a snapshot of the nutrition goals
 
 calorie_tracker_router = APIRouter()
 
-# assumption
-NUTRITION_GOAL_API_URL = "http://localhost:8000/v1/360_degree_fitness/calculate_nutritional_goals/{user_id}"
+
+def format_balance(rollup):
+    goals = rollup.get("nutrition_goals")
+    return {
+        "date": rollup["date"],
+        "daily_calories_requirement": int(goals["total_calories_goal"]) if goals else None,
+        "total_calories_intake": rollup["total_calories_intake"],
+        "total_calories_burnt": rollup["total_calories_burnt"],
+        "macros": {
+            "total_fat": rollup["total_fat"],
+            "total_carbs": rollup["total_carbs"],
+            "total_protein": rollup["total_protein"]
+        },
+        "weight_in_kg": rollup.get("weight_in_kg"),
+        "caloric_balance": rollup["caloric_balance"]
+    }
+
 
 @calorie_tracker_router.get("/v1/360_degree_fitness/calorie_intake_vs_burnt")
 async def calorie_intake_vs_burnt(user_id: str, date: date):
     try:
         date_str = date.isoformat()
 
-        # Log the input date and the formatted date string for debugging
-        print(f"Received Date: {date}, Date String: {date_str}")
-
-        # Step 1: Get Calories Consumed
-        user_meal_diary = await meal_diary_collection.find_one({"user_id": user_id, "date": date_str})
-
-        if not user_meal_diary:
-            return JSONResponse(status_code=404,
-                                content={"message": "Meal diary not found for this user on the given date"})
-
-        total_calories_consumed = user_meal_diary.get("daily_nutrition_summary", {}).get("total_calories", 0)
-
-        # Step 2: Get Calories Burnt
-        user_exercise_diary = await exercise_diary_collection.find_one({"user_id": user_id, "date": date_str})
+        # Step 1: Single indexed read of the precomputed rollup (rebuilt from the diaries when missing or behind)
+        rollup = await get_daily_rollup(user_id, date_str)
 
-        if not user_exercise_diary:
+        if not rollup["has_meal_diary"] and not rollup["has_exercise_diary"]:
             return JSONResponse(status_code=404,
-                                content={"message": "Exercise diary not found for this user on the given date"})
+                                content={"message": "No meal or exercise diary found for this user on the given date"})
 
-        total_calories_burnt = user_exercise_diary.get("daily_exercise_summary", {}).get("total_calories_burnt", 0)
+        # Step 2: The nutrition goal snapshot comes with the rollup
+        if not rollup.get("nutrition_goals"):
+            return JSONResponse(status_code=500, content={"message": "Error fetching nutrition goals: User profile not found"})
 
-        # Step 3: Fetch User's Daily Caloric Requirement from Nutrition Goals API
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(NUTRITION_GOAL_API_URL.format(user_id=user_id))
-                response.raise_for_status()  # Raise an error for non-2xx responses
-                nutrition_goals = response.json()
-                daily_calories_requirement = int(nutrition_goals["total_calories_goal"])
+        # Step 3: Return the result
+        return {
+            "user_id": user_id,
+            **format_balance(rollup)
+        }
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"message": f"Error fetching data: {str(e)}"})
 
-        except httpx.RequestError as e:
-            return JSONResponse(status_code=500, content={"message": f"Error fetching nutrition goals: {str(e)}"})
-        except KeyError:
-            return JSONResponse(status_code=500, content={"message": "Error: Missing daily_calories_goal in the response"})
 
-        # Step 4: Calculate Caloric Balance
-        calories_diff = total_calories_consumed - total_calories_burnt
-        if calories_diff > 0:
-            caloric_balance = {"status": "surplus", "calories_diff": calories_diff}
-        elif calories_diff < 0:
-            caloric_balance = {"status": "deficit", "calories_diff": abs(calories_diff)}
-        else:
-            caloric_balance = {"status": "balanced", "calories_diff": 0}
+@calorie_tracker_router.get("/v1/360_degree_fitness/calorie_balance_range")
+async def calorie_balance_range(user_id: str, start_date: date, end_date: date):
+    if end_date < start_date:
+        return JSONResponse(status_code=400, content={"message": "end_date must not be before start_date"})
+    if (end_date - start_date).days >= MAX_ROLLUP_RANGE_DAYS:
+        return JSONResponse(status_code=400, content={"message": f"Range cannot exceed {MAX_ROLLUP_RANGE_DAYS} days"})
 
-        # Step 5: Return the result
+    try:
+        # Range scan over daily_rollups; days without any diary are simply absent
+        rollups = await get_rollup_range(user_id, start_date.isoformat(), end_date.isoformat())
         return {
             "user_id": user_id,
-            "date": date_str,
-            "daily_calories_requirement": daily_calories_requirement,
-            "total_calories_intake": total_calories_consumed,
-            "total_calories_burnt": total_calories_burnt,
-            "caloric_balance": caloric_balance
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "days": [format_balance(rollup) for rollup in rollups]
         }
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Error fetching data: {str(e)}"})
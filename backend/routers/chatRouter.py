@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import orjson
 from pydantic import BaseModel
 from typing import List, Optional, Literal, Union
@@ -7,7 +7,15 @@ import google.generativeai as genai
 import os
 import json
 from dotenv import load_dotenv
-from ..db.database import profiles_collection, key_recommendations_collection, conversation_history_collection, meal_diary_collection, fitness_plans_collection
+from ..db.database import profiles_collection, key_recommendations_collection, conversation_history_collection, meal_diary_collection
+from ..core.llm_gateway import LLMGateway, generate_content, stream_content
+from ..core.structured_output import StructuredOutput, StructuredOutputError, generate_structured
+from ..core.ocr_engine import OCREngine, count_nutrition_keywords
+from ..core.similarity_index import SimilarityIndexStore
+from ..core.intent_classifier import classify_intent, INTENT_CONFIDENCE_THRESHOLD, CALORIES_TODAY, CALORIES_DATE
+from ..core.response_cache import response_cache, intent_cache, response_cache_key, normalize_question, get_cache_metrics
+from ..services.planService import create_fitness_plan, get_fitness_plan, FitnessPlanError
+from ..models.foodImage import NutritionLabelInfo, FoodImageAnalysis
 from datetime import datetime, timedelta, date
 import re
 from rapidfuzz import fuzz
@@ -18,13 +26,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
 import calendar
 from enum import Enum
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import pytesseract
-from PIL import Image
 import base64
-import httpx
 
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
@@ -39,9 +41,6 @@ genai.configure(api_key=gemini_api_key)
 # No need for a separate client - we'll use the standard genai module
 chat_router = APIRouter()
 
-# Get the backend service URL from environment variable, default to localhost for development
-BACKEND_SERVICE_URL = os.getenv('BACKEND_SERVICE_URL', 'http://localhost:8000')
-
 class ChatMessage(BaseModel):
     user_id: str
     message: str
@@ -270,11 +269,16 @@ async def find_similar_question(user_id, question, threshold=80):
 
     return best_match
 
+async def save_conversation(conversation: dict):
+    """Store a conversation and let the user's similarity index pick it up"""
+    await conversation_history_collection.insert_one(conversation)
+    SimilarityIndexStore.record(conversation["user_id"])
+
 async def store_conversation(user_id: str, message: str, response: str):
     # Always generate a new conversation_id
     conversation_id = str(ObjectId())
     
-    await conversation_history_collection.insert_one({
+    await save_conversation({
         "user_id": user_id,
         "conversation_id": conversation_id,
         "message": message,
@@ -482,9 +486,9 @@ def is_calorie_query(message: str, user_id: str = None) -> bool:
     
     return (has_calorie_keyword and (has_time_keyword or has_question_word)) or is_followup
 
-# Add this function to classify user intent using Gemini
+# Add this function to classify user intent (local tiers first, Gemini as fallback)
 async def classify_user_intent(message: str):
-    """Use Gemini to classify the user's intent"""
+    """Classify the user's intent locally, consulting Gemini only when the local tier is unsure"""
     try:
         # First check for simple date follow-up patterns before calling Gemini
         message_lower = message.lower()
@@ -516,15 +520,33 @@ async def classify_user_intent(message: str):
                         return {
                             "intent": QueryIntent.CALORIES_DATE,
                             "date": date_obj,
-                            "explanation": f"User is asking about calories on {date_obj.isoformat()}"
+                            "explanation": f"User is asking about calories on {date_obj.isoformat()}",
+                            "source": "pattern"
                         }
                 except (ValueError, IndexError) as e:
                     print(f"DEBUG: Error parsing date: {str(e)}")
                     pass
         
-        # If not a simple date pattern, use Gemini
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        # Then the local keyword/regex (and optionally trained) classifier
+        local_intent = classify_intent(message)
+        if local_intent["confidence"] >= INTENT_CONFIDENCE_THRESHOLD:
+            intent = getattr(QueryIntent, local_intent["intent"], QueryIntent.UNKNOWN)
+            return {
+                "intent": intent,
+                "date": parse_date_from_message(message) if intent == QueryIntent.CALORIES_DATE else None,
+                "explanation": local_intent["explanation"],
+                "confidence": local_intent["confidence"],
+                "source": "local"
+            }
+        
+        # Intent labels without a date are shared across users
+        intent_cache_key = normalize_question(message)
+        cached_intent = intent_cache.get(intent_cache_key)
+        if cached_intent is not None:
+            # Tagged so cache hits aren't stored as fresh Gemini labels for the intent model
+            return {**cached_intent, "source": "cache"}
         
+        # If the local classifier is not confident enough, use Gemini
         prompt = f"""
         Classify the following user message into exactly ONE of these categories:
         - CALORIES_TODAY: User is asking about calories consumed today
@@ -544,7 +566,7 @@ async def classify_user_intent(message: str):
         Example: {{"intent": "CALORIES_TODAY", "date": null, "explanation": "User is asking about today's calorie intake"}}
         """
         
-        response = model.generate_content(prompt)
+        response = await generate_content(prompt)
         if not response or not response.text:
             return {"intent": QueryIntent.UNKNOWN, "date": None}
         
@@ -564,11 +586,15 @@ async def classify_user_intent(message: str):
                     # If date format is invalid, default to today
                     parsed_date = date.today()
             
-            return {
+            intent_data = {
                 "intent": getattr(QueryIntent, intent, QueryIntent.UNKNOWN),
                 "date": parsed_date,
-                "explanation": result.get("explanation", "")
+                "explanation": result.get("explanation", ""),
+                "source": "gemini"
             }
+            if parsed_date is None:
+                intent_cache.set(intent_cache_key, intent_data)
+            return intent_data
         except json.JSONDecodeError:
             return {"intent": QueryIntent.UNKNOWN, "date": None}
             
@@ -580,45 +606,17 @@ async def classify_user_intent(message: str):
 async def find_similar_questions(user_id: str, current_question: str, threshold: float = 0.7):
     """Find similar questions that the user has asked before and got satisfactory responses"""
     
-    # Get user's conversation history from the last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    past_conversations = await conversation_history_collection.find({
-        "user_id": user_id,
-        "timestamp": {"$gte": thirty_days_ago},
-        # You could add a field to track if the response was helpful
-        # "was_helpful": True
-    }).to_list(length=100)
-    
-    if not past_conversations or len(past_conversations) < 3:
-        # Not enough data to make meaningful comparisons
+    # Look up the user's incremental TF-IDF index (conversations from the last 30 days)
+    match = await SimilarityIndexStore.find_similar(user_id, current_question)
+    if not match:
         return None
     
-    # Extract questions and responses
-    past_questions = [conv["message"] for conv in past_conversations]
-    past_responses = [conv["response"] for conv in past_conversations]
-    
-    # Create a list of all questions including the current one
-    all_questions = past_questions + [current_question]
-    
-    # Use TF-IDF to vectorize the questions
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(all_questions)
-    
-    # Calculate similarity between current question and past questions
-    current_vector = tfidf_matrix[-1]
-    past_vectors = tfidf_matrix[:-1]
-    
-    # Calculate cosine similarity
-    similarities = cosine_similarity(current_vector, past_vectors)[0]
-    
-    # Find the most similar question above the threshold
-    max_sim_idx = np.argmax(similarities)
-    if similarities[max_sim_idx] >= threshold:
+    past_conversation, similarity_score = match
+    if similarity_score >= threshold:
         return {
-            "similar_question": past_questions[max_sim_idx],
-            "previous_response": past_responses[max_sim_idx],
-            "similarity_score": similarities[max_sim_idx]
+            "similar_question": past_conversation["message"],
+            "previous_response": past_conversation["response"],
+            "similarity_score": similarity_score
         }
     
     return None
@@ -680,244 +678,291 @@ async def provide_chat_feedback(feedback: ChatFeedback):
             content={"message": f"Error recording feedback: {str(e)}"}
         )
 
-# Modify the chat_with_ai function to use similar past questions
-@chat_router.post("/v1/360_degree_fitness/chat", response_model=ChatResponse)
-async def chat_with_ai(chat_message: ChatMessage):
-    try:
-        # Get user profile
-        user_profile = await profiles_collection.find_one({"user_id": chat_message.user_id})
-        print(f"User profile found: {bool(user_profile)}")  # Debug log
+def build_profile_summary(fitness_profile: dict) -> str:
+    """The profile section of the chat prompt; the response cache is keyed on exactly this text"""
+    return f"""
+        User Profile:
+        - Age: {fitness_profile.get('user_basic_details', {}).get('age', 'N/A')} years
+        - Gender: {fitness_profile.get('user_basic_details', {}).get('gender', 'N/A')}
+        - Height: {fitness_profile.get('user_basic_details', {}).get('height_in_cm', 'N/A')} cm
+        - Weight: {fitness_profile.get('user_basic_details', {}).get('weight_in_kg', 'N/A')} kg
+        - Activity Level: {fitness_profile.get('user_habits_assessment', {}).get('activity_level', 'N/A')}
+        - Diet Preference: {fitness_profile.get('user_habits_assessment', {}).get('diet_preference', 'N/A')}
+        - Fitness Goals: {fitness_profile.get('user_fitness_goals', 'N/A')}
+        - Health Conditions: {', '.join(fitness_profile.get('user_health_details', {}).get('existing_conditions', [])) or 'None'}
+    """
 
-        if is_fitness_plan_request(chat_message.message):
-            try:
-                print(f"Attempting to handle fitness plan request for user: {chat_message.user_id}")
-                
-                # First try to retrieve existing plan
-                fitness_plan = await fitness_plans_collection.find_one({"user_id": chat_message.user_id})
-                print(f"Existing plan found: {bool(fitness_plan)}")  # Debug log
-
-                if not fitness_plan:
-                    print("No existing plan found, creating new plan...")
-                    # Create new plan using the fitness plan endpoint
-                    async with httpx.AsyncClient() as client:
-                        create_url = f"{BACKEND_SERVICE_URL}/v1/360_degree_fitness/create_fitness_plan/{chat_message.user_id}"
-                        print(f"Calling create plan endpoint: {create_url}")
-                        
-                        create_response = await client.post(create_url)
-                        print(f"Create plan response status: {create_response.status_code}")
-                        
-                        if create_response.status_code == 200:
-                            fitness_plan = create_response.json()["fitness_plan"]
-                            print("New plan created successfully")
-                        else:
-                            print(f"Failed to create plan: {create_response.text}")
-                            raise Exception(f"Failed to create fitness plan: {create_response.text}")
-
-                if fitness_plan:
-                    # Format the plan for display
-                    formatted_plan = {
-                        "type": "fitness_plan_table",
-                        "content": {
-                            "Meal Plan": fitness_plan["meal_plan"],
-                            "Workout Plan": fitness_plan["workout_plan"],
-                            "Lifestyle Suggestions": fitness_plan["sleep_and_lifestyle_suggestions"]
-                        }
+def may_share_response(message: str) -> bool:
+    """
+    Answers to anything that may be about the user's own diary are never stored in or served
+    from the cross-user cache. Checked before intent classification, so it errs on the side of skipping.
+    """
+    if is_calorie_query(message) or re.search(r'\d{1,2}[/\-]\d{1,2}', message):
+        return False
+    return classify_intent(message)["intent"] not in (CALORIES_TODAY, CALORIES_DATE)
+
+async def prepare_chat(chat_message: ChatMessage):
+    """
+    Everything before generation: returns a ChatResponse when the question is answered without
+    Gemini (fitness plan, similar question, cache, meal diary), otherwise the prompt and context
+    needed to generate and store the answer.
+    """
+    # Get user profile
+    user_profile = await profiles_collection.find_one({"user_id": chat_message.user_id})
+    print(f"User profile found: {bool(user_profile)}")  # Debug log
+
+    if is_fitness_plan_request(chat_message.message):
+        try:
+            print(f"Attempting to handle fitness plan request for user: {chat_message.user_id}")
+            
+            # First try to retrieve existing plan
+            fitness_plan = await get_fitness_plan(chat_message.user_id)
+            print(f"Existing plan found: {bool(fitness_plan)}")  # Debug log
+
+            if not fitness_plan:
+                print("No existing plan found, creating new plan...")
+                # Create new plan in-process with the plan service
+                try:
+                    fitness_plan = (await create_fitness_plan(chat_message.user_id))["fitness_plan"]
+                    print("New plan created successfully")
+                except FitnessPlanError as e:
+                    print(f"Failed to create plan: {e.message}")
+                    raise Exception(f"Failed to create fitness plan: {e.message}")
+
+            if fitness_plan:
+                # Format the plan for display
+                formatted_plan = {
+                    "type": "fitness_plan_table",
+                    "content": {
+                        "Meal Plan": fitness_plan["meal_plan"],
+                        "Workout Plan": fitness_plan["workout_plan"],
+                        "Lifestyle Suggestions": fitness_plan["sleep_and_lifestyle_suggestions"]
                     }
+                }
 
-                    return ChatResponse(
-                        response="Here's your personalized fitness plan:",
-                        data=formatted_plan,
-                        conversation_id=str(ObjectId())
-                    )
-                else:
-                    raise Exception("No fitness plan available")
-
-            except Exception as e:
-                print(f"Error in fitness plan handling: {str(e)}")
-                # Provide a more informative response using profile data
-                if user_profile:
-                    return ChatResponse(
-                        response=(
-                            f"I apologize, but I'm having trouble accessing your fitness plan. "
-                            f"However, based on your profile, I can see that:\n\n"
-                            f"• Your current activity level is: {user_profile['user_habits_assessment']['activity_level']}\n"
-                            f"• Your fitness goal is: {user_profile['user_fitness_goals']}\n"
-                            f"• Your diet preference is: {user_profile['user_habits_assessment']['diet_preference']}\n\n"
-                            f"Would you like me to create a new fitness plan for you? Just say 'create new fitness plan'."
-                        ),
-                        conversation_id=str(ObjectId())
-                    )
-                else:
-                    return ChatResponse(
-                        response="I'm having trouble accessing your profile and fitness plan. Please ensure your profile is complete and try again.",
-                        conversation_id=str(ObjectId())
-                    )
-
-        # Generate conversation_id at the start
-        conversation_id = str(ObjectId())
+                return ChatResponse(
+                    response="Here's your personalized fitness plan:",
+                    data=formatted_plan,
+                    conversation_id=str(ObjectId())
+                )
+            else:
+                raise Exception("No fitness plan available")
+
+        except Exception as e:
+            print(f"Error in fitness plan handling: {str(e)}")
+            # Provide a more informative response using profile data
+            if user_profile:
+                return ChatResponse(
+                    response=(
+                        f"I apologize, but I'm having trouble accessing your fitness plan. "
+                        f"However, based on your profile, I can see that:\n\n"
+                        f"• Your current activity level is: {user_profile['user_habits_assessment']['activity_level']}\n"
+                        f"• Your fitness goal is: {user_profile['user_fitness_goals']}\n"
+                        f"• Your diet preference is: {user_profile['user_habits_assessment']['diet_preference']}\n\n"
+                        f"Would you like me to create a new fitness plan for you? Just say 'create new fitness plan'."
+                    ),
+                    conversation_id=str(ObjectId())
+                )
+            else:
+                return ChatResponse(
+                    response="I'm having trouble accessing your profile and fitness plan. Please ensure your profile is complete and try again.",
+                    conversation_id=str(ObjectId())
+                )
+
+    # Generate conversation_id at the start
+    conversation_id = str(ObjectId())
+    
+    # Define retrieval instructions early
+    retrieval_instructions = (
+        "Want to view this conversation later? "
+        f"Save this conversation ID: {conversation_id}\n"
+        "You can retrieve your chat history by visiting:\n"
+        f"- JSON format: /v1/360_degree_fitness/chat/history/{conversation_id}?format=json\n"
+        f"- PDF format: /v1/360_degree_fitness/chat/history/{conversation_id}?format=pdf"
+    )
+    
+    # Before calling Gemini, check if we have a similar question with a good response
+    similar_question = await find_similar_questions(chat_message.user_id, chat_message.message)
+    
+    if similar_question and similar_question["similarity_score"] > 0.85:
+        # We found a very similar question with a good response
+        # Use the previous response directly
+        response_text = similar_question["previous_response"]
+        
+        # Store the conversation
+        await save_conversation({
+            "user_id": chat_message.user_id,
+            "conversation_id": conversation_id,
+            "message": chat_message.message,
+            "response": response_text,
+            "timestamp": datetime.utcnow(),
+            "used_previous_response": True,
+            "similar_question": similar_question["similar_question"]
+        })
         
-        # Define retrieval instructions early
-        retrieval_instructions = (
-            "Want to view this conversation later? "
-            f"Save this conversation ID: {conversation_id}\n"
-            "You can retrieve your chat history by visiting:\n"
-            f"- JSON format: /v1/360_degree_fitness/chat/history/{conversation_id}?format=json\n"
-            f"- PDF format: /v1/360_degree_fitness/chat/history/{conversation_id}?format=pdf"
+        return ChatResponse(
+            response=response_text,
+            sources=["Previous Conversation"],
+            conversation_id=conversation_id,
+            retrieval_instructions=retrieval_instructions
         )
+    
+    # Cross-user cache: a hit skips both intent classification and generation.
+    # The key covers the exact profile values the prompt would contain.
+    profile_summary = build_profile_summary(user_profile or {})
+    cache_key = response_cache_key(chat_message.message, profile_summary)
+    shareable = may_share_response(chat_message.message)
+    cached_response = response_cache.get(cache_key) if shareable else None
+    if cached_response is not None:
+        await save_conversation({
+            "user_id": chat_message.user_id,
+            "conversation_id": conversation_id,
+            "message": chat_message.message,
+            "response": cached_response,
+            "timestamp": datetime.utcnow(),
+            "used_cached_response": True
+        })
         
-        # Before calling Gemini, check if we have a similar question with a good response
-        similar_question = await find_similar_questions(chat_message.user_id, chat_message.message)
+        return ChatResponse(
+            response=cached_response,
+            sources=["Fitness Profile"],
+            conversation_id=conversation_id,
+            retrieval_instructions=retrieval_instructions
+        )
+    
+    # If no similar question found or similarity score is low, classify the user's intent
+    intent_data = await classify_user_intent(chat_message.message)
+    intent = intent_data["intent"]
+    
+    # Debug logging
+    print(f"Classified intent: {intent}, Date: {intent_data.get('date')}, Explanation: {intent_data.get('explanation')}")
+    
+    # Handle calorie-related queries
+    if intent in [QueryIntent.CALORIES_TODAY, QueryIntent.CALORIES_DATE]:
+        # Determine the date to query
+        query_date = intent_data["date"] if intent == QueryIntent.CALORIES_DATE else date.today()
         
-        if similar_question and similar_question["similarity_score"] > 0.85:
-            # We found a very similar question with a good response
-            # Use the previous response directly
-            response_text = similar_question["previous_response"]
-            
-            # Store the conversation
-            await conversation_history_collection.insert_one({
-                "user_id": chat_message.user_id,
-                "conversation_id": conversation_id,
-                "message": chat_message.message,
-                "response": response_text,
-                "timestamp": datetime.utcnow(),
-                "used_previous_response": True,
-                "similar_question": similar_question["similar_question"]
-            })
-            
-            return ChatResponse(
-                response=response_text,
-                sources=["Previous Conversation"],
-                conversation_id=conversation_id,
-                retrieval_instructions=retrieval_instructions
-            )
+        # Debug logging
+        print(f"Querying meal data for date: {query_date}")
         
-        # If no similar question found or similarity score is low, continue with Gemini
-        # Classify the user's intent using Gemini
-        intent_data = await classify_user_intent(chat_message.message)
-        intent = intent_data["intent"]
+        # Get meal data for the requested date
+        meal_data = await get_user_meal_data(chat_message.user_id, query_date)
         
         # Debug logging
-        print(f"Classified intent: {intent}, Date: {intent_data.get('date')}, Explanation: {intent_data.get('explanation')}")
+        print(f"Meal data found: {bool(meal_data)}")
+        if meal_data:
+            print(f"Nutrition summary: {meal_data.get('daily_nutrition_summary', {})}")
+        
+        # Format date for display
+        formatted_date = query_date.strftime("%B %d, %Y")
+        if query_date == date.today():
+            date_display = "today"
+        elif query_date == date.today() - timedelta(days=1):
+            date_display = "yesterday"
+        else:
+            date_display = f"on {formatted_date}"
         
-        # Handle calorie-related queries
-        if intent in [QueryIntent.CALORIES_TODAY, QueryIntent.CALORIES_DATE]:
-            # Determine the date to query
-            query_date = intent_data["date"] if intent == QueryIntent.CALORIES_DATE else date.today()
-            
-            # Debug logging
-            print(f"Querying meal data for date: {query_date}")
-            
-            # Get meal data for the requested date
-            meal_data = await get_user_meal_data(chat_message.user_id, query_date)
-            
-            # Debug logging
-            print(f"Meal data found: {bool(meal_data)}")
-            if meal_data:
-                print(f"Nutrition summary: {meal_data.get('daily_nutrition_summary', {})}")
-            
-            # Format date for display
-            formatted_date = query_date.strftime("%B %d, %Y")
-            if query_date == date.today():
-                date_display = "today"
-            elif query_date == date.today() - timedelta(days=1):
-                date_display = "yesterday"
-            else:
-                date_display = f"on {formatted_date}"
-            
-            if not meal_data:
-                # No meal data found for the requested date
-                response_text = (
-                    f"I don't see any meals logged {date_display}. "
-                    "Please log your meals in the Food Diary section to track your calorie intake."
-                )
-            else:
-                # Extract nutrition summary from meal data
-                nutrition_summary = meal_data.get("daily_nutrition_summary", {})
-                total_calories = nutrition_summary.get("total_calories", 0)
-                total_fat = nutrition_summary.get("total_fat", 0)
-                total_carbs = nutrition_summary.get("total_carbs", 0)
-                total_protein = nutrition_summary.get("total_protein", 0)
-                
-                # Create a response with the nutrition information
-                response_text = (
-                    f"Based on your meal diary {date_display}, you've consumed:\n\n"
-                    f"• Total Calories: {total_calories} kcal\n"
-                    f"• Total Fat: {total_fat}g\n"
-                    f"• Total Carbs: {total_carbs}g\n"
-                    f"• Total Protein: {total_protein}g\n\n"
-                    f"You can view more details in the Food Diary section."
-                )
-            
-            # Store the conversation
-            await conversation_history_collection.insert_one({
-                "user_id": chat_message.user_id,
-                "conversation_id": conversation_id,
-                "message": chat_message.message,
-                "response": response_text,
-                "timestamp": datetime.utcnow()
-            })
+        if not meal_data:
+            # No meal data found for the requested date
+            response_text = (
+                f"I don't see any meals logged {date_display}. "
+                "Please log your meals in the Food Diary section to track your calorie intake."
+            )
+        else:
+            # Extract nutrition summary from meal data
+            nutrition_summary = meal_data.get("daily_nutrition_summary", {})
+            total_calories = nutrition_summary.get("total_calories", 0)
+            total_fat = nutrition_summary.get("total_fat", 0)
+            total_carbs = nutrition_summary.get("total_carbs", 0)
+            total_protein = nutrition_summary.get("total_protein", 0)
             
-            return ChatResponse(
-                response=response_text,
-                sources=["Meal Diary"],
-                conversation_id=conversation_id,
-                retrieval_instructions=retrieval_instructions
+            # Create a response with the nutrition information
+            response_text = (
+                f"Based on your meal diary {date_display}, you've consumed:\n\n"
+                f"• Total Calories: {total_calories} kcal\n"
+                f"• Total Fat: {total_fat}g\n"
+                f"• Total Carbs: {total_carbs}g\n"
+                f"• Total Protein: {total_protein}g\n\n"
+                f"You can view more details in the Food Diary section."
             )
         
-        # For all other query types, use the AI model
-        fitness_profile = await profiles_collection.find_one({"user_id": chat_message.user_id})
+        # Store the conversation (the intent label also feeds the local intent model)
+        await save_conversation({
+            "user_id": chat_message.user_id,
+            "conversation_id": conversation_id,
+            "message": chat_message.message,
+            "response": response_text,
+            "timestamp": datetime.utcnow(),
+            "intent": intent.name,
+            "intent_source": intent_data.get("source")
+        })
         
-        # If profile doesn't exist, still try to answer the question
-        if not fitness_profile:
-            fitness_profile = {}  # Use empty profile instead of raising exception
+        return ChatResponse(
+            response=response_text,
+            sources=["Meal Diary"],
+            conversation_id=conversation_id,
+            retrieval_instructions=retrieval_instructions
+        )
+    
+    # For all other query types, use the AI model with the profile summary built above
+    prompt = f"""
+        You are a professional fitness and health advisor. Based on the following user profile, provide a helpful answer to the user's question:
+        {profile_summary}
         
-        # Generate profile summary for the AI model
-        profile_summary = f"""
-            User Profile:
-            - Age: {fitness_profile.get('user_basic_details', {}).get('age', 'N/A')} years
-            - Gender: {fitness_profile.get('user_basic_details', {}).get('gender', 'N/A')}
-            - Height: {fitness_profile.get('user_basic_details', {}).get('height_in_cm', 'N/A')} cm
-            - Weight: {fitness_profile.get('user_basic_details', {}).get('weight_in_kg', 'N/A')} kg
-            - Activity Level: {fitness_profile.get('user_habits_assessment', {}).get('activity_level', 'N/A')}
-            - Diet Preference: {fitness_profile.get('user_habits_assessment', {}).get('diet_preference', 'N/A')}
-            - Fitness Goals: {fitness_profile.get('user_fitness_goals', 'N/A')}
-            - Health Conditions: {', '.join(fitness_profile.get('user_health_details', {}).get('existing_conditions', [])) or 'None'}
-        """
+        User's Question: {chat_message.message}
+        
+        If the question is about a specific date like "2/25", interpret it as February 25th of the current year.
+        Keep your response concise and focused on the user's question.
+    """
+
+    return {
+        "prompt": prompt,
+        # Only answers generated for non-diary intents are shared with other users
+        "cache_key": cache_key if shareable else None,
+        "conversation_id": conversation_id,
+        "retrieval_instructions": retrieval_instructions,
+        "intent": intent,
+        "intent_source": intent_data.get("source")
+    }
+
+async def save_generated_chat(chat_message: ChatMessage, prepared: dict, generated_text: str):
+    """Cache and store a generated answer"""
+    # Personal calorie questions depend on the user's diary, never share those answers
+    if prepared["cache_key"] is not None:
+        response_cache.set(prepared["cache_key"], generated_text)
+    
+    # Store the conversation
+    await save_conversation({
+        "user_id": chat_message.user_id,
+        "conversation_id": prepared["conversation_id"],
+        "message": chat_message.message,
+        "response": generated_text,
+        "timestamp": datetime.utcnow(),
+        "intent": prepared["intent"].name,
+        "intent_source": prepared["intent_source"]
+    })
+
+# Modify the chat_with_ai function to use similar past questions
+@chat_router.post("/v1/360_degree_fitness/chat", response_model=ChatResponse)
+async def chat_with_ai(chat_message: ChatMessage):
+    try:
+        prepared = await prepare_chat(chat_message)
+        if isinstance(prepared, ChatResponse):
+            return prepared
         
         try:
-            # Generate response using Gemini AI
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = f"""
-                You are a professional fitness and health advisor. Based on the following user profile, provide a helpful answer to the user's question:
-                {profile_summary}
-                
-                User's Question: {chat_message.message}
-                
-                If the question is about a specific date like "2/25", interpret it as February 25th of the current year.
-                Keep your response concise and focused on the user's question.
-            """
-            
-            response = model.generate_content(prompt)
+            response = await generate_content(prepared["prompt"])
             if not response or not response.text:
                 raise Exception("Empty response from Gemini API")
             
             generated_text = response.text
-            
-            # Store the conversation
-            await conversation_history_collection.insert_one({
-                "user_id": chat_message.user_id,
-                "conversation_id": conversation_id,
-                "message": chat_message.message,
-                "response": generated_text,
-                "timestamp": datetime.utcnow()
-            })
+            await save_generated_chat(chat_message, prepared, generated_text)
             
             return ChatResponse(
                 response=generated_text,
                 sources=["Fitness Profile"],
-                conversation_id=conversation_id,
-                retrieval_instructions=retrieval_instructions
+                conversation_id=prepared["conversation_id"],
+                retrieval_instructions=prepared["retrieval_instructions"]
             )
             
         except Exception as api_error:
@@ -927,8 +972,8 @@ async def chat_with_ai(chat_message: ChatMessage):
             return ChatResponse(
                 response=fallback_response,
                 sources=["Fallback"],
-                conversation_id=conversation_id,
-                retrieval_instructions=retrieval_instructions
+                conversation_id=prepared["conversation_id"],
+                retrieval_instructions=prepared["retrieval_instructions"]
             )
             
     except Exception as e:
@@ -938,6 +983,55 @@ async def chat_with_ai(chat_message: ChatMessage):
             conversation_id=str(ObjectId())
         )
 
+def sse_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+# Streaming variant of /chat: Server-Sent Events "meta", then "token"s as Gemini produces them, then "done" (or "error")
+@chat_router.post("/v1/360_degree_fitness/chat/stream")
+async def chat_with_ai_stream(chat_message: ChatMessage):
+    async def events():
+        try:
+            prepared = await prepare_chat(chat_message)
+        except Exception as e:
+            print(f"General error in chat_with_ai_stream: {str(e)}")
+            yield sse_event("error", {"message": "I encountered an error processing your request. Please try again."})
+            return
+
+        # Answered without generation: the whole response goes out as a single token
+        if isinstance(prepared, ChatResponse):
+            yield sse_event("meta", {"conversation_id": prepared.conversation_id, "retrieval_instructions": prepared.retrieval_instructions})
+            yield sse_event("token", {"text": prepared.response})
+            yield sse_event("done", {"conversation_id": prepared.conversation_id, "sources": prepared.sources})
+            return
+
+        yield sse_event("meta", {"conversation_id": prepared["conversation_id"], "retrieval_instructions": prepared["retrieval_instructions"]})
+        chunks = []
+        try:
+            async for text in stream_content(prepared["prompt"]):
+                chunks.append(text)
+                yield sse_event("token", {"text": text})
+            if not chunks:
+                raise Exception("Empty response from Gemini API")
+        except Exception as api_error:
+            print(f"Gemini API Error: {str(api_error)}")
+            # Don't store failed conversations
+            yield sse_event("error", {"message": "I'm having trouble connecting to my knowledge base right now. Please try again in a moment."})
+            return
+
+        # The conversation is stored once, after the last token
+        try:
+            await save_generated_chat(chat_message, prepared, "".join(chunks))
+        except Exception as e:
+            print(f"Error storing streamed conversation: {str(e)}")
+        yield sse_event("done", {"conversation_id": prepared["conversation_id"], "sources": ["Fitness Profile"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @chat_router.get("/v1/360_degree_fitness/chat/history/{conversation_id}")
 async def get_chat_history(
     conversation_id: str,
@@ -1037,6 +1131,11 @@ async def get_chat_history(
             detail="Unsupported format. Available formats: json, pdf"
         )
     
+@chat_router.get("/v1/360_degree_fitness/chat/metrics")
+async def get_chat_metrics():
+    """Expose Gemini gateway queue-depth/latency counters, JSON parse-failure rates and chat cache hit rates"""
+    return {"llm_gateway": LLMGateway.get_metrics(), "structured_output": StructuredOutput.get_metrics(), **get_cache_metrics()}
+
 @chat_router.post("/v1/360_degree_fitness/process_food_image")
 async def process_food_image(
     image_file: UploadFile = File(...), 
@@ -1069,15 +1168,13 @@ async def process_food_image(
             # Try enhanced OCR first
             ocr_result = await enhanced_ocr(image_file)
             
-            if ocr_result["success"]:
+            # An error response means OCR failed; fall through to the food analysis
+            if not isinstance(ocr_result, JSONResponse) and ocr_result["success"]:
                 ocr_text = ocr_result["text"]
                 
                 if image_type == "auto":
-                    text = ocr_text.lower()
-                    nutrition_keywords = ["calories", "protein", "carbohydrate", "fat", "sodium", "serving", "nutrition facts"]
-                    
                     # Count how many nutrition keywords are found
-                    keyword_count = sum(1 for keyword in nutrition_keywords if keyword in text)
+                    keyword_count = count_nutrition_keywords(ocr_text)
                     
                     # If multiple nutrition keywords are found, it's likely a nutrition label
                     detected_type = "label" if keyword_count >= 2 else "food"
@@ -1101,8 +1198,6 @@ async def process_food_image(
             # If it's a label, also add cleaned text using Gemini
             if detected_type == "label":
                 # Use Gemini to clean and structure the OCR text
-                model = genai.GenerativeModel('gemini-1.5-flash')
-                
                 prompt = f"""
                 The following text was extracted from a food label using OCR, but it may contain errors or be poorly formatted:
                 
@@ -1118,7 +1213,7 @@ async def process_food_image(
                 Format the output as clean, readable text with appropriate sections.
                 """
                 
-                response = model.generate_content(prompt)
+                response = await generate_content(prompt)
                 result["cleaned_ocr_text"] = response.text
             
         return result
@@ -1137,8 +1232,6 @@ async def process_nutrition_label_with_gemini(image_content: bytes, mime_type: s
         base64_image = base64.b64encode(image_content).decode('utf-8')
         
         # Use Gemini to extract structured nutrition information
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         prompt = """
         This is a nutrition label. Please extract the following nutrition information:
         
@@ -1175,34 +1268,22 @@ async def process_nutrition_label_with_gemini(image_content: bytes, mime_type: s
         }
         """
         
-        # Create multipart request with image
-        response = model.generate_content([
-            prompt,
-            {
-                "mime_type": mime_type or "image/jpeg",
-                "data": base64_image
-            }
-        ])
-        
+        # Create multipart request with image, validated (and repaired if needed) against NutritionLabelInfo
         try:
-            # Parse the response to get nutrition information
-            response_text = response.text.strip()
-            
-            # Handle case where response might include markdown code blocks
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-                
-            nutrition_info = json.loads(response_text)
+            nutrition_info = await generate_structured([
+                prompt,
+                {
+                    "mime_type": mime_type or "image/jpeg",
+                    "data": base64_image
+                }
+            ], NutritionLabelInfo, name="nutrition_label")
             return {
                 "success": True, 
                 "image_type": "label",
-                "nutrition_info": nutrition_info
+                "nutrition_info": nutrition_info.model_dump()
             }
-        except Exception as parse_error:
+        except StructuredOutputError as parse_error:
             print(f"Error parsing Gemini response for nutrition label: {str(parse_error)}")
-            print(f"Response text: {response.text}")
             return {"success": False, "message": "Failed to extract nutrition information"}
     
     except Exception as e:
@@ -1216,8 +1297,6 @@ async def process_actual_food_with_gemini(image_content: bytes, mime_type: str):
         base64_image = base64.b64encode(image_content).decode('utf-8')
         
         # Use Gemini to identify food items and estimate nutrition
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         prompt = """
         This is an image of food. Please:
         
@@ -1253,34 +1332,22 @@ async def process_actual_food_with_gemini(image_content: bytes, mime_type: str):
         }
         """
         
-        # Create multipart request with image
-        response = model.generate_content([
-            prompt,
-            {
-                "mime_type": mime_type or "image/jpeg",
-                "data": base64_image
-            }
-        ])
-        
+        # Create multipart request with image, validated (and repaired if needed) against FoodImageAnalysis
         try:
-            # Parse the response to get food items and nutrition
-            response_text = response.text.strip()
-            
-            # Handle case where response might include markdown code blocks
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-                
-            food_analysis = json.loads(response_text)
+            food_analysis = await generate_structured([
+                prompt,
+                {
+                    "mime_type": mime_type or "image/jpeg",
+                    "data": base64_image
+                }
+            ], FoodImageAnalysis, name="food_image")
             return {
                 "success": True, 
                 "image_type": "food",
-                "food_analysis": food_analysis
+                "food_analysis": food_analysis.model_dump()
             }
-        except Exception as parse_error:
+        except StructuredOutputError as parse_error:
             print(f"Error parsing Gemini response for food image: {str(parse_error)}")
-            print(f"Response text: {response.text}")
             return {"success": False, "message": "Failed to analyze food image"}
     
     except Exception as e:
@@ -1292,73 +1359,10 @@ async def enhanced_ocr(image_file: UploadFile = File(...)):
     try:
         # Read the image file
         image_content = await image_file.read()
-        
-        # Use PIL to open the image
-        image = Image.open(BytesIO(image_content))
-        
-        # Convert to grayscale for better OCR
-        gray_image = image.convert('L')
-        
-        # Apply multiple preprocessing techniques and combine results
-        results = []
-        
-        # 1. Basic grayscale OCR
-        custom_config = r'--oem 3 --psm 6 -l eng --dpi 300'  # Page segmentation mode 6: Assume a single uniform block of text
-        basic_text = pytesseract.image_to_string(gray_image, config=custom_config)
-        if basic_text.strip():
-            results.append(basic_text)
-        
-        # 2. Try with different page segmentation mode
-        custom_config = r'--oem 3 --psm 4 -l eng --dpi 300'  # Page segmentation mode 4: Assume a single column of text
-        column_text = pytesseract.image_to_string(gray_image, config=custom_config)
-        if column_text.strip():
-            results.append(column_text)
-        
-        # 3. Try with thresholding for better contrast
-        threshold = 150
-        binary_image = gray_image.point(lambda x: 0 if x < threshold else 255, '1')
-        threshold_text = pytesseract.image_to_string(binary_image, config=r'--oem 3 --psm 6 -l eng --dpi 300')
-        if threshold_text.strip():
-            results.append(threshold_text)
-        
-        # 4. Try with different scaling
-        width, height = image.size
-        scaled_img = image.resize((width*2, height*2), Image.LANCZOS)  # Upscale for better detail
-        scaled_gray = scaled_img.convert('L')
-        scaled_text = pytesseract.image_to_string(scaled_gray, config=r'--oem 3 --psm 1 -l eng --dpi 300')  # PSM 1: Auto page segmentation
-        if scaled_text.strip():
-            results.append(scaled_text)
-        
-        # Combine and clean results
-        if results:
-            # Join all results and remove duplicate lines
-            all_lines = set()
-            for result in results:
-                lines = result.split('\n')
-                for line in lines:
-                    clean_line = line.strip()
-                    if clean_line and len(clean_line) > 1:  # Ignore single characters
-                        all_lines.add(clean_line)
-            
-            # Sort lines by length (longer lines first, as they're likely more complete)
-            sorted_lines = sorted(all_lines, key=len, reverse=True)
-            
-            # Join the lines back together
-            combined_text = '\n'.join(sorted_lines)
-            
-            return {"success": True, "text": combined_text}
-        else:
-            # If all methods failed, try one more approach with very aggressive preprocessing
-            from PIL import ImageFilter
-            sharpened = gray_image.filter(ImageFilter.SHARPEN)
-            sharpened = sharpened.filter(ImageFilter.SHARPEN)  # Double sharpen
-            last_attempt = pytesseract.image_to_string(sharpened, config=r'--oem 3 --psm 12 -l eng --dpi 300')  # PSM 12: Sparse text with OSD
-            
-            if last_attempt and last_attempt.strip():
-                return {"success": True, "text": last_attempt}
-            else:
-                return {"success": False, "message": "No text detected in the image"}
-            
+
+        # The preprocessing passes run in parallel on the OCR process pool, off the event loop
+        return await OCREngine.extract_text(image_content)
+
     except Exception as e:
         print(f"Enhanced OCR Error: {str(e)}")
         return JSONResponse(
@@ -1,6 +1,6 @@
 import json
 import os
-from datetime import date, datetime, timedelta
+from datetime import date
 from typing import Dict
 
 import httpx
@@ -8,9 +8,12 @@ from bson import ObjectId
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from pymongo.errors import PyMongoError
+from pydantic import ValidationError
 
-from ..models.userExerciseLogger import UserExerciseDiary
-from ..db.database import exercise_diary_collection
+from ..models.userExerciseLogger import UserExerciseDiary, UserExerciseLogger, UserExerciseLogEntry, UserExerciseLogBatch
+from ..db.database import exercise_diary_collection, push_exercise_logs, pull_exercise_log, bulk_upsert_diaries, build_exercise_logs_update
+from ..services.rollupService import touch_daily_rollups
+from ..services.diarySummaryService import get_exercise_summary, DEFAULT_SUMMARY_DAYS, MAX_SUMMARY_DAYS
 from fastapi import Query
 
 exercise_log_router = APIRouter()
@@ -92,69 +95,36 @@ def update_exercise_summary(exercise_diary):
     }
     return exercise_diary
 
+def to_exercise_log_dict(user_exercise_log):
+    # Convert exercise log to dict and handle Decimal and date values
+    # (only the exercise fields are stored, bulk entries also carry user_id and date)
+    exercise_log_dict = json.loads(json.dumps(UserExerciseLogger(**user_exercise_log.dict()).dict(), cls=CustomEncoder))
+
+    # Ensure that calories_burnt is converted to float before saving
+    exercise_log_dict['calories_burnt'] = float(exercise_log_dict.get('calories_burnt', 0))
+    # Stable id so the entry can be deleted without relying on its position
+    exercise_log_dict['entry_id'] = str(ObjectId())
+    return exercise_log_dict
+
 @exercise_log_router.post("/v1/360_degree_fitness/addExerciseLog")
 async def add_exercise_log(exercise_log_request: UserExerciseDiary):
     print("Inside add exercise Log function")
     user_id = exercise_log_request.user_id
     exercise_log_date = exercise_log_request.date.isoformat()
-    user_exercise_log = exercise_log_request.exercises[0] if exercise_log_request.exercises else None
 
-    if not user_id or not exercise_log_date or not user_exercise_log:
+    if not user_id or not exercise_log_date or not exercise_log_request.exercises:
         return JSONResponse(status_code=400, content={"message": "Missing required fields."})
 
     print(f"user_id is: {user_id}")
     print(f"exercise log date: {exercise_log_date}")
-    print(f"exercise log details: {user_exercise_log}")
+    print(f"exercise log details: {exercise_log_request.exercises}")
     try:
-        # Fetch the existing exercise diary from MongoDB
-        existing_exercise_diary = await exercise_diary_collection.find_one(
-            {"user_id": user_id, "date": exercise_log_date}
-        )
-
-        # If the exercise diary doesn't exist, create a new one
-        if not existing_exercise_diary:
-            exercise_diary_data = {
-                "user_id": user_id,
-                "date": exercise_log_date,
-                "exercises": [],
-                "daily_exercise_summary": {
-                    "total_calories_burnt": 0.0,
-                    "total_duration": 0
-                }
-            }
-            await exercise_diary_collection.insert_one(exercise_diary_data)
-            # Get the inserted document to work with it
-            existing_exercise_diary = exercise_diary_data
-
-        # Convert exercise log to dict and handle Decimal and date values
-        exercise_log_dict = json.loads(json.dumps(user_exercise_log.dict(), cls=CustomEncoder))
-
-        # Ensure that calories_burnt is converted to float before saving
-        exercise_log_dict['calories_burnt'] = float(exercise_log_dict.get('calories_burnt', 0))
+        exercise_log_dicts = [to_exercise_log_dict(user_exercise_log) for user_exercise_log in exercise_log_request.exercises]
 
-        # Step 4: Append the exercise log to the exercise diary's exercise list
-        update_result = await exercise_diary_collection.update_one(
-            {"user_id": user_id, "date": exercise_log_date},
-            {
-                "$push": {"exercises": exercise_log_dict}
-            }
-        )
-
-        # Step 5: After adding the exercise log, recalculate the daily exercise summary
-        updated_exercise_diary = await exercise_diary_collection.find_one(
-            {"user_id": user_id, "date": exercise_log_date}
-        )
+        # Append every exercise log and $inc the daily exercise summary in one atomic upsert
+        updated_exercise_diary = await push_exercise_logs(user_id, exercise_log_date, exercise_log_dicts)
 
-        # Call update_exercise_summary to recalculate totals
-        updated_exercise_diary = update_exercise_summary(updated_exercise_diary)
-
-        # Step 6: Update the exercise diary with the new daily summary
-        await exercise_diary_collection.update_one(
-            {"user_id": user_id, "date": exercise_log_date},
-            {
-                "$set": {"daily_exercise_summary": updated_exercise_diary["daily_exercise_summary"]}
-            }
-        )
+        await touch_daily_rollups(user_id, [exercise_log_date])
 
         # Serialize the MongoDB document before returning
         serialized_exercise_diary = json.loads(json.dumps(updated_exercise_diary, cls=CustomEncoder))
@@ -170,12 +140,80 @@ async def add_exercise_log(exercise_log_request: UserExerciseDiary):
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Internal Server Error: {str(e)}"})
 
+MAX_BULK_EXERCISE_LOGS = 500
+
+@exercise_log_router.post("/v1/360_degree_fitness/addExerciseLogsBulk")
+async def add_exercise_logs_bulk(exercise_log_batch: UserExerciseLogBatch):
+    """Log many exercises across dates (e.g. a wearable import); one upsert per (user, date) in a single bulk_write"""
+    if not exercise_log_batch.exercise_logs:
+        return JSONResponse(status_code=400, content={"message": "exercise_logs cannot be empty"})
+    if len(exercise_log_batch.exercise_logs) > MAX_BULK_EXERCISE_LOGS:
+        return JSONResponse(status_code=400, content={"message": f"At most {MAX_BULK_EXERCISE_LOGS} exercise logs per request"})
+
+    results = []
+    logs_by_day = {}  # (user_id, date) -> [(result index, exercise log dict)]
+    for index, raw_exercise_log in enumerate(exercise_log_batch.exercise_logs):
+        try:
+            exercise_log_entry = UserExerciseLogEntry(**raw_exercise_log)
+        except ValidationError as e:
+            results.append({"index": index, "status": "failed", "message": str(e)})
+            continue
+
+        exercise_log_dict = to_exercise_log_dict(exercise_log_entry)
+        results.append({"index": index, "status": "logged", "entry_id": exercise_log_dict["entry_id"]})
+        day = (exercise_log_entry.user_id, exercise_log_entry.date.isoformat())
+        logs_by_day.setdefault(day, []).append((index, exercise_log_dict))
+
+    try:
+        failed_days = await bulk_upsert_diaries(exercise_diary_collection, {
+            day: build_exercise_logs_update([exercise_log for _, exercise_log in day_logs])
+            for day, day_logs in logs_by_day.items()
+        })
+    except PyMongoError as e:
+        return JSONResponse(status_code=500, content={"message": f"Database error: {str(e)}"})
+
+    dates_by_user = {}
+    for day, day_logs in logs_by_day.items():
+        if day in failed_days:
+            for index, _ in day_logs:
+                results[index] = {"index": index, "status": "failed", "message": f"Database error: {failed_days[day]}"}
+            continue
+        dates_by_user.setdefault(day[0], []).append(day[1])
+
+    for user_id, dates in dates_by_user.items():
+        await touch_daily_rollups(user_id, dates)
+
+    logged = sum(1 for result in results if result["status"] == "logged")
+    return JSONResponse(status_code=200 if logged else 400, content={
+        "message": f"{logged} of {len(results)} exercise logs added",
+        "results": results
+    })
+
 @exercise_log_router.delete("/v1/360_degree_fitness/delete_exercise_log")
 async def delete_user_exercise_log(delete_exercise_request: Dict):
     try:
         user_id = delete_exercise_request.get("user_id")
         exercise_log_date = delete_exercise_request.get("date")
         exercise_type = delete_exercise_request.get("exercise_type")
+        entry_id = delete_exercise_request.get("entry_id")
+
+        if entry_id:
+            if not user_id or not exercise_log_date:
+                return JSONResponse(status_code=400, content={"message": "user_id, date, and entry_id are required"})
+
+            # Remove the entry and subtract its calories/duration in one atomic update
+            updated_exercise_diary = await pull_exercise_log(user_id, exercise_log_date, entry_id)
+            if not updated_exercise_diary:
+                return JSONResponse(status_code=404, content={"message": f"No exercise log {entry_id} found for {user_id} on {exercise_log_date}"})
+
+            await touch_daily_rollups(user_id, [exercise_log_date])
+
+            return JSONResponse(status_code=200, content={
+                "message": "Exercise log deleted successfully",
+                "exercise_diary": serialize_mongo_doc(updated_exercise_diary)
+            })
+
+        # Legacy entries without an entry_id are deleted by position
         index = int(delete_exercise_request.get("index"))
 
         if not user_id or not exercise_log_date or not exercise_type or index is None:
@@ -239,6 +277,8 @@ async def delete_user_exercise_log(delete_exercise_request: Dict):
         if update_result.modified_count == 0:
             return JSONResponse(status_code=500, content={"message": "Failed to update exercise diary"})
 
+        await touch_daily_rollups(user_id, [exercise_log_date])
+
         # Fetch the updated exercise diary (optional, if you want to return it)
         updated_exercise_diary = await exercise_diary_collection.find_one(
             {"user_id": user_id, "date": exercise_log_date}
@@ -330,67 +370,16 @@ async def calculate_calories_burnt(exercise_info_req: Dict):
 
 
 @exercise_log_router.get("/v1/360_degree_fitness/getWeeklyExerciseSummary")
-async def get_weekly_exercise_summary(user_id: str = Query(...)):
+async def get_weekly_exercise_summary(
+    user_id: str = Query(...),
+    days: int = Query(DEFAULT_SUMMARY_DAYS, ge=1, le=MAX_SUMMARY_DAYS)
+):
     try:
         if not user_id:
             return JSONResponse(status_code=400, content={"message": "User ID is required"})
 
-        today = datetime.today().date()
-        print(f"Today's date (UTC): {today}")
-
-        weekly_workouts = []
-        calories_burned = []
-        all_exercises = []
-
-        # Loop over the last 7 days
-        for i in range(6, -1, -1): # 6 to 0
-            log_date = (today - timedelta(days=i)).isoformat()
-            print(f"Fetching data for date: {log_date}")
-
-            diary = await exercise_diary_collection.find_one({"user_id": user_id, "date": log_date})
-
-            if diary:
-                summary = diary.get("daily_exercise_summary", {})
-                total_duration = int(summary.get("total_duration", 0))
-                total_calories = int(summary.get("total_calories_burnt", 0))
-
-                weekly_workouts.append(total_duration)
-                calories_burned.append(total_calories)
-
-                # Collect exercises with date info for sorting later
-                for exercise in diary.get("exercises", []):
-                    all_exercises.append({
-                        "date": diary["date"],
-                        "type": exercise.get("exercise_type", ""),
-                        "duration": int(exercise.get("duration_minutes", 0)),
-                        "calories": int(exercise.get("calories_burnt", 0))
-                    })
-            else:
-                weekly_workouts.append(0)
-                calories_burned.append(0)
-
-        # Sort all exercises by date descending
-        sorted_exercises = sorted(
-            all_exercises,
-            key=lambda x: x["date"],
-            reverse=True
-        )
-
-        # Pick last 3 workouts
-        last_workouts = [
-            {
-                "type": ex["type"],
-                "duration": ex["duration"],
-                "calories": ex["calories"]
-            }
-            for ex in sorted_exercises[:3]
-        ]
-
-        return {
-            "weeklyWorkouts": weekly_workouts,
-            "caloriesBurned": calories_burned,
-            "lastWorkouts": last_workouts
-        }
+        # One aggregation over the whole window instead of a lookup per day
+        return await get_exercise_summary(user_id, days)
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Internal server error: {str(e)}"})
@@ -0,0 +1,191 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Literal, Optional
+
+import orjson
+from bson import ObjectId
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from ..db.database import (
+    meal_diary_collection, exercise_diary_collection, weight_diary_collection,
+    conversation_history_collection, MEAL_TYPES
+)
+
+export_router = APIRouter()
+
+# Documents fetched per cursor round trip; memory stays bounded by this, not by the history length
+EXPORT_BATCH_SIZE = 200
+# Flush the response buffer once it grows past this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+DATASETS = ["meals", "exercises", "weights", "conversations"]
+
+# CSV columns for every dataset; each row fills the ones that apply to its record_type
+EXPORT_COLUMNS = [
+    "record_type", "date", "entry_id",
+    "meal_type", "food_id", "food_name", "quantity_consumed",
+    "total_calories", "total_fat", "total_carbs", "total_protein",
+    "exercise_type", "duration_minutes", "calories_burnt",
+    "weight_in_kg", "notes",
+    "conversation_id", "timestamp", "message", "response", "intent",
+]
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def _date_filter(user_id: str, start_date: Optional[date], end_date: Optional[date]):
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = start_date.isoformat()
+        if end_date:
+            query["date"]["$lte"] = end_date.isoformat()
+    return query
+
+
+async def _meal_rows(user_id, start_date, end_date):
+    projection = {"_id": 0, "date": 1, **{meal_type: 1 for meal_type in MEAL_TYPES}}
+    cursor = meal_diary_collection.find(_date_filter(user_id, start_date, end_date), projection)
+    async for diary in cursor.sort("date", 1).batch_size(EXPORT_BATCH_SIZE):
+        for meal_type in MEAL_TYPES:
+            for meal in diary.get(meal_type) or []:
+                yield {
+                    "record_type": "meal",
+                    "date": diary["date"],
+                    "entry_id": meal.get("entry_id"),
+                    "meal_type": meal_type,
+                    "food_id": meal.get("food_id"),
+                    "food_name": meal.get("food_name"),
+                    "quantity_consumed": meal.get("quantity_consumed"),
+                    "total_calories": meal.get("total_calories"),
+                    "total_fat": meal.get("total_fat"),
+                    "total_carbs": meal.get("total_carbs"),
+                    "total_protein": meal.get("total_protein"),
+                }
+
+
+async def _exercise_rows(user_id, start_date, end_date):
+    cursor = exercise_diary_collection.find(_date_filter(user_id, start_date, end_date), {"_id": 0, "date": 1, "exercises": 1})
+    async for diary in cursor.sort("date", 1).batch_size(EXPORT_BATCH_SIZE):
+        for exercise in diary.get("exercises") or []:
+            yield {
+                "record_type": "exercise",
+                "date": diary["date"],
+                "entry_id": exercise.get("entry_id"),
+                "exercise_type": exercise.get("exercise_type"),
+                "duration_minutes": exercise.get("duration_minutes"),
+                "calories_burnt": exercise.get("calories_burnt"),
+            }
+
+
+async def _weight_rows(user_id, start_date, end_date):
+    cursor = weight_diary_collection.find(_date_filter(user_id, start_date, end_date), {"_id": 0, "date": 1, "weights": 1})
+    async for diary in cursor.sort("date", 1).batch_size(EXPORT_BATCH_SIZE):
+        for weight in diary.get("weights") or []:
+            yield {
+                "record_type": "weight",
+                "date": diary["date"],
+                "entry_id": weight.get("entry_id"),
+                "weight_in_kg": weight.get("weight_in_kg"),
+                "notes": weight.get("notes"),
+            }
+
+
+async def _conversation_rows(user_id, start_date, end_date):
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        query["timestamp"] = {}
+        if start_date:
+            query["timestamp"]["$gte"] = datetime.combine(start_date, datetime.min.time())
+        if end_date:
+            query["timestamp"]["$lte"] = datetime.combine(end_date, datetime.max.time())
+    projection = {"_id": 0, "conversation_id": 1, "timestamp": 1, "message": 1, "response": 1, "intent": 1}
+    cursor = conversation_history_collection.find(query, projection)
+    async for conversation in cursor.sort("timestamp", 1).batch_size(EXPORT_BATCH_SIZE):
+        timestamp = conversation.get("timestamp")
+        yield {
+            "record_type": "conversation",
+            "date": timestamp.date().isoformat() if isinstance(timestamp, datetime) else None,
+            "conversation_id": conversation.get("conversation_id"),
+            "timestamp": timestamp,
+            "message": conversation.get("message"),
+            "response": conversation.get("response"),
+            "intent": conversation.get("intent"),
+        }
+
+
+ROW_SOURCES = {
+    "meals": _meal_rows,
+    "exercises": _exercise_rows,
+    "weights": _weight_rows,
+    "conversations": _conversation_rows,
+}
+
+
+async def _ndjson_stream(user_id, datasets, start_date, end_date):
+    buffer = bytearray()
+    for dataset in datasets:
+        async for row in ROW_SOURCES[dataset](user_id, start_date, end_date):
+            buffer += orjson.dumps(row, default=_default)
+            buffer += b"\n"
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _csv_stream(user_id, datasets, start_date, end_date):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for dataset in datasets:
+        async for row in ROW_SOURCES[dataset](user_id, start_date, end_date):
+            if isinstance(row.get("timestamp"), datetime):
+                row["timestamp"] = row["timestamp"].isoformat()
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+@export_router.get("/v1/360_degree_fitness/export/{user_id}")
+async def export_user_data(
+    user_id: str,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    datasets: str = Query(",".join(DATASETS), description="Comma separated: meals, exercises, weights, conversations"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """Stream the user's diary and chat history; bytes start flowing before the export finishes"""
+    requested = [dataset.strip() for dataset in datasets.split(",") if dataset.strip()]
+    invalid = [dataset for dataset in requested if dataset not in ROW_SOURCES]
+    if not requested or invalid:
+        return JSONResponse(status_code=400, content={"message": f"Invalid datasets: {', '.join(invalid) or datasets}"})
+    if start_date and end_date and end_date < start_date:
+        return JSONResponse(status_code=400, content={"message": "end_date must not be before start_date"})
+
+    if format == "csv":
+        stream, media_type = _csv_stream(user_id, requested, start_date, end_date), "text/csv"
+    else:
+        stream, media_type = _ndjson_stream(user_id, requested, start_date, end_date), "application/x-ndjson"
+
+    filename = f"360fitness_export_{user_id}_{date.today().isoformat()}.{format}"
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
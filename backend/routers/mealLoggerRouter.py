@@ -1,36 +1,41 @@
 import os
 from datetime import date
 from typing import Optional, Dict
-import requests
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
 from pymongo.errors import PyMongoError
+from pydantic import ValidationError
 import json
 from decimal import Decimal
 from bson import ObjectId
 
-from ..db.database import meal_diary_collection, get_meal, update_meal_log, delete_meal_log
-from ..models.userMealLogger import UserMealLogger
+from ..db.database import meal_diary_collection, get_meal, push_meal_log, pull_meal_log, update_meal_log, delete_meal_log, MEAL_TYPES, bulk_upsert_diaries, build_meal_logs_update
+from ..models.userMealLogger import UserMealLogger, UserMealLogBatch
 from ..core.oauth2 import FatSecretAuthorization
-from datetime import datetime, timedelta
+from ..core.fatsecret import FatSecretHTTP
+from ..core.food_cache import FoodCache, search_cache_key, food_cache_key
+from ..core.food_catalog import FoodCatalog, FOOD_CATALOG_MIN_RESULTS
+from ..services.rollupService import touch_daily_rollups
+from ..services.diarySummaryService import get_nutrition_summary, DEFAULT_SUMMARY_DAYS, MAX_SUMMARY_DAYS
 
 meal_log_router = APIRouter()
 
 
 class FatSecretAPI:  # Utility class for making requests to FatSecret API.
     BASE_URL = os.getenv("FATSECRET_BASE_URL")
-    HEADERS = {"Connection": "keep-alive"}
 
     @staticmethod
-    def make_request(endpoint, params):
-        access_token = FatSecretAuthorization.get_access_token()
+    async def make_request(endpoint, params):
+        access_token = await FatSecretAuthorization.get_access_token()
 
         headers = {
-            **FatSecretAPI.HEADERS,  # for unpacking dictionaries
             "Authorization": f"Bearer {access_token}",
         }
 
-        auth_response = requests.get(f"{FatSecretAPI.BASE_URL}/{endpoint}", params=params, headers=headers)
+        # Pooled keep-alive connections, timeouts and retry/backoff live in FatSecretHTTP
+        auth_response = await FatSecretHTTP.request(
+            "GET", f"{FatSecretAPI.BASE_URL}/{endpoint}", params=params, headers=headers
+        )
 
         if auth_response.status_code != 200:
             raise HTTPException(status_code=500, detail="Failed to fetch data from FatSecret API")
@@ -44,21 +49,37 @@ async def search_food_item_by_name(food_name: str):
         return JSONResponse(status_code=400, content={"message": "Food name cannot be empty."})
 
     try:
-        # Retrieve food details from external API (FatSecret)
-        food_data = FatSecretAPI.make_request(
-            endpoint="foods/search/v1",
-            params={
-                "search_expression": food_name,
-                "format": "json",
-                "page_number": 0,
-                "max_results": 10,
-                "oauth_token": FatSecretAuthorization.get_access_token()
-            }
+        # Answer from the local food catalog when it has enough matches
+        local_matches = FoodCatalog.search(food_name, limit=10)
+        if len(local_matches) >= FOOD_CATALOG_MIN_RESULTS:
+            return {"food_options": [
+                {
+                    "food_id": food["food_id"],
+                    "food_name": food["food_name"],
+                    "food_description": food.get("food_description", "")
+                }
+                for food in local_matches
+            ]}
+
+        # Retrieve food details from the cache, falling back to the external API (FatSecret)
+        food_data = await FoodCache.get_or_fetch(
+            search_cache_key(food_name),
+            lambda: FatSecretAPI.make_request(
+                endpoint="foods/search/v1",
+                params={
+                    "search_expression": food_name,
+                    "format": "json",
+                    "page_number": 0,
+                    "max_results": 10
+                }
+            )
         )
 
         if not food_data.get("foods") or len(food_data["foods"]["food"]) == 0:
             return JSONResponse(status_code=400, content={"message": "Food not found in external database."})
 
+        FoodCatalog.ingest_search_results(food_data["foods"]["food"])
+
         # Return the list of foods (id, name, description)
         food_list = [
             {
@@ -71,6 +92,9 @@ async def search_food_item_by_name(food_name: str):
 
         return {"food_options": food_list}
 
+    except HTTPException as e:
+        # Upstream failures keep their status and message
+        return JSONResponse(status_code=e.status_code, content={"message": e.detail})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Error searching food: {str(e)}"})
 
@@ -81,18 +105,35 @@ async def get_details_by_food_id(food_id: str):
         return JSONResponse(status_code=400, content={"message": "Food ID cannot be empty."})
 
     try:
-        food_data = FatSecretAPI.make_request(
-            endpoint="food/v4",
-            params={
-                "food_id": food_id,
-                "format": "json"}
+        food_data = await FoodCache.get_or_fetch(
+            food_cache_key(food_id),
+            lambda: FatSecretAPI.make_request(
+                endpoint="food/v4",
+                params={
+                    "food_id": food_id,
+                    "format": "json"}
+            )
         )
+        FoodCatalog.ingest_food_details(food_data)
         return JSONResponse(content=food_data)
 
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"message": e.detail})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": "Internal Server Error"})
 
 
+@meal_log_router.get("/v1/360_degree_fitness/autocomplete_food")
+async def autocomplete_food(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=25)):
+    """Typeahead suggestions served from the in-memory food catalog only"""
+    return {"suggestions": FoodCatalog.search(q, limit=limit)}
+
+
+@meal_log_router.get("/v1/360_degree_fitness/food_cache/metrics")
+async def get_food_cache_metrics():
+    return FoodCache.get_metrics()
+
+
 @meal_log_router.get("/v1/360_degree_fitness/getMyMealDiary")
 async def get_meal_diary(user_id: str, meal_date: date):
     try:
@@ -154,60 +195,20 @@ async def add_meal_log(user_meal_log: UserMealLogger):
     meal_type = user_meal_log.meal_type
 
     try:
-        # Step 1: Check if the meal diary already exists for the user and date
-        existing_meal_diary = await meal_diary_collection.find_one(
-            {"user_id": user_id, "date": meal_log_date}
-        )
-
-        # If the meal diary doesn't exist, create a new one
-        if not existing_meal_diary:
-            meal_diary_data = {
-                "user_id": user_id,
-                "date": meal_log_date,
-                "breakfast": [],
-                "lunch": [],
-                "dinner": [],
-                "snacks": [],
-                "daily_nutrition_summary": {
-                    "total_calories": 0,
-                    "total_fat": 0,
-                    "total_carbs": 0,
-                    "total_protein": 0
-                }
-            }
-            await meal_diary_collection.insert_one(meal_diary_data)
-
         # Convert meal log to dict and handle Decimal and date values
         meal_log_dict = json.loads(json.dumps(user_meal_log.dict(), cls=CustomEncoder))
-        
-        # Get the computed totals (these are calculated automatically)
-        total_calories = user_meal_log.total_calories
-        total_fat = user_meal_log.total_fat
-        total_carbs = user_meal_log.total_carbs
-        total_protein = user_meal_log.total_protein
+        # Stable id so the entry can be deleted without relying on its position
+        meal_log_dict["entry_id"] = str(ObjectId())
 
-        # Step 4: Append the meal log to a particular meal type
-        update_result = await meal_diary_collection.update_one(
-            {"user_id": user_id, "date": meal_log_date},
-            {
-                "$push": {meal_type: meal_log_dict},  # Use the updated dict
-                "$inc": {
-                    "daily_nutrition_summary.total_calories": total_calories,
-                    "daily_nutrition_summary.total_fat": total_fat,
-                    "daily_nutrition_summary.total_carbs": total_carbs,
-                    "daily_nutrition_summary.total_protein": total_protein
-                }
-            }
-        )
+        # Create-or-append in a single atomic round trip, returning the updated meal diary
+        updated_meal_diary = await push_meal_log(user_id, meal_log_date, meal_type, meal_log_dict)
 
         # Check if the update was successful
-        if update_result.modified_count == 0:
+        if updated_meal_diary is None:
             raise HTTPException(status_code=500, detail="Failed to update meal diary")
 
-        # Step 5: Return the updated meal diary with the new meal log
-        updated_meal_diary = await meal_diary_collection.find_one(
-            {"user_id": user_id, "date": meal_log_date}
-        )
+        FoodCatalog.ingest_meal_log(meal_log_dict)
+        await touch_daily_rollups(user_id, [meal_log_date])
 
         # Serialize the MongoDB document before returning
         serialized_meal_diary = serialize_mongo_doc(updated_meal_diary)
@@ -222,21 +223,104 @@ async def add_meal_log(user_meal_log: UserMealLogger):
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Internal Server Error: {str(e)}"})
 
+MAX_BULK_MEAL_LOGS = 500
+
+
+@meal_log_router.post("/v1/360_degree_fitness/add_meal_logs_bulk")
+async def add_meal_logs_bulk(meal_log_batch: UserMealLogBatch):
+    """Log many meal items across meal types and dates; one upsert per (user, date) in a single bulk_write"""
+    if not meal_log_batch.meal_logs:
+        return JSONResponse(status_code=400, content={"message": "meal_logs cannot be empty"})
+    if len(meal_log_batch.meal_logs) > MAX_BULK_MEAL_LOGS:
+        return JSONResponse(status_code=400, content={"message": f"At most {MAX_BULK_MEAL_LOGS} meal logs per request"})
+
+    results = []
+    logs_by_day = {}  # (user_id, date) -> [(result index, meal log dict)]
+    for index, raw_meal_log in enumerate(meal_log_batch.meal_logs):
+        try:
+            user_meal_log = UserMealLogger(**raw_meal_log)
+        except ValidationError as e:
+            results.append({"index": index, "status": "failed", "message": str(e)})
+            continue
+
+        # Convert meal log to dict and handle Decimal and date values
+        meal_log_dict = json.loads(json.dumps(user_meal_log.dict(), cls=CustomEncoder))
+        meal_log_dict["entry_id"] = str(ObjectId())
+        results.append({"index": index, "status": "logged", "entry_id": meal_log_dict["entry_id"]})
+        logs_by_day.setdefault((user_meal_log.user_id, meal_log_dict["meal_log_date"]), []).append((index, meal_log_dict))
+
+    try:
+        failed_days = await bulk_upsert_diaries(meal_diary_collection, {
+            day: build_meal_logs_update([meal_log for _, meal_log in day_logs])
+            for day, day_logs in logs_by_day.items()
+        })
+    except PyMongoError as e:
+        return JSONResponse(status_code=500, content={"message": f"Database error: {str(e)}"})
+
+    dates_by_user = {}
+    for day, day_logs in logs_by_day.items():
+        if day in failed_days:
+            for index, _ in day_logs:
+                results[index] = {"index": index, "status": "failed", "message": f"Database error: {failed_days[day]}"}
+            continue
+        for _, meal_log in day_logs:
+            FoodCatalog.ingest_meal_log(meal_log)
+        dates_by_user.setdefault(day[0], []).append(day[1])
+
+    for user_id, dates in dates_by_user.items():
+        await touch_daily_rollups(user_id, dates)
+
+    logged = sum(1 for result in results if result["status"] == "logged")
+    return JSONResponse(status_code=200 if logged else 400, content={
+        "message": f"{logged} of {len(results)} meal logs added",
+        "results": results
+    })
+
+# Diaries per page of get_meal_log: a month by default, never more than 100
+DEFAULT_MEAL_LOG_PAGE_SIZE = 31
+MAX_MEAL_LOG_PAGE_SIZE = 100
+MEAL_LOG_FIELDS = MEAL_TYPES + ["daily_nutrition_summary"]
+
 #  Get User Meal Log History API (GET /v1/360_degree_fitness/get_meal_log)
 @meal_log_router.get("/v1/360_degree_fitness/get_meal_log")
-async def get_user_meal_log(user_id: str, date: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_user_meal_log(
+    user_id: str,
+    date: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = Query(DEFAULT_MEAL_LOG_PAGE_SIZE, ge=1, le=MAX_MEAL_LOG_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description=f"Comma separated subset of: {', '.join(MEAL_LOG_FIELDS)}")
+):
     if not user_id:
         return JSONResponse(status_code=400, content={"message": "User Id is required"})
+
+    projection = None
+    if fields:
+        requested_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        invalid_fields = [field for field in requested_fields if field not in MEAL_LOG_FIELDS]
+        if invalid_fields:
+            return JSONResponse(status_code=400, content={"message": f"Invalid fields: {', '.join(invalid_fields)}"})
+        projection = {"user_id": 1, "date": 1, **{field: 1 for field in requested_fields}}
+
     try:
-        meal_logs = await get_meal(user_id, date, start_date, end_date)
+        # Always paged, so no request reads an unbounded range; one extra diary tells us whether there is a next page
+        meal_logs = await get_meal(user_id, date, start_date, end_date, limit=limit + 1, after=after, projection=projection)
 
         if not meal_logs:
             return JSONResponse(status_code=404, content={"message": "No meal logs found..."})
 
+        has_more = len(meal_logs) > limit
+        meal_logs = meal_logs[:limit]
+
         # Serialize the MongoDB documents before returning
         serialized_meal_logs = serialize_mongo_doc(meal_logs)
         
-        return JSONResponse(status_code=200, content={"message": "Meal retrieved successfully", "meal_logs": serialized_meal_logs})
+        return JSONResponse(status_code=200, content={
+            "message": "Meal retrieved successfully",
+            "meal_logs": serialized_meal_logs,
+            "next_cursor": meal_logs[-1]["date"] if has_more else None
+        })
     except PyMongoError as e:
         return JSONResponse(status_code=500, content={"message": f"Database error: {str(e)}"})
     except Exception as e:
@@ -291,8 +375,28 @@ async def delete_user_meal_log(delete_meal_request: Dict):
         user_id = delete_meal_request.get("user_id")
         meal_log_date = delete_meal_request.get("date")
         meal_type = delete_meal_request.get("meal_type")
+        entry_id = delete_meal_request.get("entry_id")
         index = delete_meal_request.get("index")
 
+        if entry_id:
+            if not user_id or not meal_log_date or not meal_type:
+                return JSONResponse(status_code=400, content={"message": "user_id, date, meal_type, and entry_id are required"})
+            if meal_type not in MEAL_TYPES:
+                return JSONResponse(status_code=400, content={"message": f"Invalid meal type: {meal_type}"})
+
+            #  Remove the entry and subtract its totals in one atomic update
+            updated_meal_diary = await pull_meal_log(user_id, meal_log_date, meal_type, entry_id)
+            if not updated_meal_diary:
+                return JSONResponse(status_code=404, content={"message": f"No meal log {entry_id} found for {user_id} on {meal_log_date}"})
+
+            await touch_daily_rollups(user_id, [meal_log_date])
+
+            return JSONResponse(status_code=200, content={
+                "message": "Meal log deleted successfully",
+                "meal_diary": serialize_mongo_doc(updated_meal_diary)
+            })
+
+        #  Legacy entries without an entry_id are deleted by position
         if not user_id or not meal_log_date or not meal_type or index is None:
             return JSONResponse(status_code=400, content={"message": "user_id, date, meal_type, and index are required"})
 
@@ -330,6 +434,8 @@ async def delete_user_meal_log(delete_meal_request: Dict):
         if update_result.modified_count == 0:
             return JSONResponse(status_code=500, content={"message": "Failed to update this meal diary"})
 
+        await touch_daily_rollups(user_id, [meal_log_date])
+
         # Fetch the updated meal diary (optional, if you want to return it)
         updated_meal_diary = await meal_diary_collection.find_one(
             {"user_id": user_id, "date": meal_log_date}
@@ -349,84 +455,16 @@ async def delete_user_meal_log(delete_meal_request: Dict):
 
 
 @meal_log_router.get("/v1/360_degree_fitness/getWeeklyNutritionSummary")
-async def get_weekly_nutrition_summary(user_id: str = Query(...)):
+async def get_weekly_nutrition_summary(
+    user_id: str = Query(...),
+    days: int = Query(DEFAULT_SUMMARY_DAYS, ge=1, le=MAX_SUMMARY_DAYS)
+):
     try:
         if not user_id:
             return JSONResponse(status_code=400, content={"message": "User ID is required"})
 
-        # Calculate the last 7 days
-        today = datetime.today().date()
-        print(f"Today's date (UTC): {today}")
-
-        daily_calories = []
-        total_macros = {"protein": 0, "carbs": 0, "fat": 0}
-        count = 0
-        all_meals = []
-
-        for i in range(6, -1, -1):  # last 7 days from oldest to newest
-            log_date = (today - timedelta(days=i)).isoformat()
-            print(f"Fetching data for date: {log_date}")
-
-            diary = await meal_diary_collection.find_one({
-                "user_id": user_id,
-                "date": log_date
-            })
-
-            if diary:
-                summary = diary.get("daily_nutrition_summary", {})
-                daily_calories.append(int(round(summary.get("total_calories", 0))))
-                total_macros["protein"] += summary.get("total_protein", 0)
-                total_macros["carbs"] += summary.get("total_carbs", 0)
-                total_macros["fat"] += summary.get("total_fat", 0)
-                count += 1
-
-                for meal_type in ["breakfast", "lunch", "dinner", "snacks"]:
-                    for meal in diary.get(meal_type, []):
-                        all_meals.append({
-                            "name": meal_type.capitalize(),
-                            "calories": int(round(meal.get("total_calories", 0))),
-                            "timestamp": meal.get("meal_log_date", diary.get("date"))
-                        })
-            else:
-                daily_calories.append(0)
-
-        # Avoid division by zero
-        if count > 0:
-            avg_macros = {
-                "protein": int(round(total_macros["protein"] / count)),
-                "carbs": int(round(total_macros["carbs"] / count)),
-                "fat": int(round(total_macros["fat"] / count)),
-            }
-        else:
-            avg_macros = {"protein": 0, "carbs": 0, "fat": 0}
-
-        # Last 3 meals
-        sorted_meals = sorted(all_meals, key=lambda m: m["timestamp"], reverse=True)
-
-        # Adding Last Breakfast, Lunch & Dinner
-        last_meals = {}
-        for meal in sorted_meals:
-            if meal["name"] not in last_meals:
-                last_meals[meal["name"]] = meal
-            # We will stop adding meals once we have Breakfast, Lunch, and Dinner
-            if len(last_meals) == 3:
-                break
-
-        # Return meals sorted as Breakfast, Lunch, Dinner if available
-        last_3_meals = [
-            last_meals.get("Breakfast", {}),
-            last_meals.get("Lunch", {}),
-            last_meals.get("Dinner", {})
-        ]
-
-        # Filter out any empty meals (in case one type is missing)
-        last_3_meals = [meal for meal in last_3_meals if meal]
-
-        return {
-            "dailyCalories": daily_calories,
-            "macros": avg_macros,
-            "meals": last_3_meals
-        }
+        # One aggregation over the whole window instead of a lookup per day
+        return await get_nutrition_summary(user_id, days)
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Internal Server Error: {str(e)}"})
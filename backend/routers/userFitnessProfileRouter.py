@@ -1,5 +1,3 @@
-import os
-from bson import ObjectId
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from pymongo.errors import PyMongoError
@@ -7,12 +5,12 @@ from ..db.database import update_latest_profile, log_profile_change
 from ..models.userFitnessProfile import UserFitnessProfile
 from ..models.userFitnessProfileUpdate import UserFitnessProfileUpdate
 from ..db.connection import get_fitness_profile_collection
+from ..services.profileService import is_profile_complete, check_profile_completion
+from ..services.planService import affected_plan_sections, create_fitness_plan, regenerate_plan_sections, get_fitness_plan
+from ..services.planJobService import PlanJobQueue
+from ..services.rollupService import refresh_goal_snapshots
 from decimal import Decimal
 import json
-import httpx
-
-# Get the backend service URL from environment variable, default to localhost for development
-BACKEND_SERVICE_URL = os.getenv('BACKEND_SERVICE_URL', 'http://localhost:8000')
 
 profile_router = APIRouter()
 
@@ -24,7 +22,11 @@ class DecimalEncoder(json.JSONEncoder):
 
 # create user fitness profile
 @profile_router.post("/v1/360_degree_fitness/create_fitness_profile")
-async def create_fitness_profile(user_profile: UserFitnessProfile):
+async def create_fitness_profile(user_profile: UserFitnessProfile, wait: bool = False):
+    """
+    The fitness plan is generated by the plan job queue; the response carries its plan_job_id.
+    With ?wait=true the plan is generated before responding and returned as fitness_plan, as it used to be.
+    """
     # Get collection inside the handler
     fitness_profiles_collection = get_fitness_profile_collection()
     
@@ -40,35 +42,30 @@ async def create_fitness_profile(user_profile: UserFitnessProfile):
         # Insert the profile
         result = await fitness_profiles_collection.insert_one(profile_dict)
         
-        # Check if the profile is complete
-        required_fields = [
-            "user_basic_details",
-            "user_initial_measurements",
-            "user_health_details",
-            "user_habits_assessment",
-            "user_routine_assessment",
-            "user_fitness_goals"
-        ]
-        
-        is_complete = all(field in profile_dict for field in required_fields)
-        
-        # If profile is complete, trigger fitness plan generation
-        if is_complete:
+        # If profile is complete, queue fitness plan generation (poll plan_job/{plan_job_id} for the result)
+        if is_profile_complete(profile_dict):
+            if wait:
+                try:
+                    fitness_plan = await create_fitness_plan(user_profile.user_id)
+                    return {
+                        "message": "User fitness profile created successfully and fitness plan generated!",
+                        "profile_id": str(result.inserted_id),
+                        "fitness_plan": fitness_plan
+                    }
+                except Exception as e:
+                    print(f"Error generating fitness plan: {str(e)}")
+                    # Continue even if plan generation fails
+                    return {"message": "User fitness profile created successfully!", "profile_id": str(result.inserted_id)}
             try:
-                async with httpx.AsyncClient() as client:
-                    # Call the create_fitness_plan endpoint using environment variable
-                    plan_response = await client.post(
-                        f"{BACKEND_SERVICE_URL}/v1/360_degree_fitness/create_fitness_plan/{user_profile.user_id}"
-                    )
-                    if plan_response.status_code == 200:
-                        return {
-                            "message": "User fitness profile created successfully and fitness plan generated!",
-                            "profile_id": str(result.inserted_id),
-                            "fitness_plan": plan_response.json()
-                        }
+                plan_job = await PlanJobQueue.enqueue(user_profile.user_id)
+                return {
+                    "message": "User fitness profile created successfully and fitness plan generation queued!",
+                    "profile_id": str(result.inserted_id),
+                    "plan_job_id": str(plan_job["_id"])
+                }
             except Exception as e:
-                print(f"Error generating fitness plan: {str(e)}")
-                # Continue even if plan generation fails
+                print(f"Error queueing fitness plan generation: {str(e)}")
+                # Continue even if plan generation can't be queued
                 pass
         
         return {"message": "User fitness profile created successfully!", "profile_id": str(result.inserted_id)}
@@ -100,51 +97,58 @@ async def get_fitness_profile(user_id: str):
 
 #edit user fitness profile
 @profile_router.put("/v1/360_degree_fitness/edit_fitness_profile/{user_id}")
-async def edit_fitness_profile(user_id: str, data: UserFitnessProfileUpdate):
+async def edit_fitness_profile(user_id: str, data: UserFitnessProfileUpdate, wait: bool = False):
+    """
+    Affected plan sections are regenerated by the plan job queue; the response carries its plan_job_id.
+    With ?wait=true they are regenerated before responding and the plan is returned as fitness_plan.
+    """
     try:
         # Convert the Pydantic model to a dictionary, excluding unset fields
         update_data = data.dict(exclude_unset=True)
         
+        # Keep the profile as it was before the edit to see which plan sections it affects
+        fitness_profiles_collection = get_fitness_profile_collection()
+        previous_profile = await fitness_profiles_collection.find_one({"user_id": user_id})
+        
         # Update the latest profile
         await update_latest_profile(user_id, update_data)
         
         # Log the changes
         await log_profile_change(user_id, update_data)
+
+        # Today's and later daily rollups carry the goals of the edited profile
+        await refresh_goal_snapshots(user_id)
         
         # Get the updated profile to check completeness
-        fitness_profiles_collection = get_fitness_profile_collection()
         updated_profile = await fitness_profiles_collection.find_one({"user_id": user_id})
         
-        if updated_profile:
-            # Check if the profile is complete
-            required_fields = [
-                "user_basic_details",
-                "user_initial_measurements",
-                "user_health_details",
-                "user_habits_assessment",
-                "user_routine_assessment",
-                "user_fitness_goals"
-            ]
-            
-            is_complete = all(field in updated_profile for field in required_fields)
-            
-            # If profile is complete, trigger fitness plan generation
-            if is_complete:
+        # If profile is complete, queue a regeneration of only the plan sections the edit affects;
+        # edits made while a job is still queued share that job
+        sections = affected_plan_sections(previous_profile, update_data)
+        if updated_profile and is_profile_complete(updated_profile) and sections:
+            if wait:
                 try:
-                    async with httpx.AsyncClient() as client:
-                        # Call the create_fitness_plan endpoint
-                        plan_response = await client.post(
-                            f"{BACKEND_SERVICE_URL}/v1/360_degree_fitness/create_fitness_plan/{user_id}"
-                        )
-                        if plan_response.status_code == 200:
-                            return {
-                                "message": "Profile updated successfully and fitness plan generated!",
-                                "fitness_plan": plan_response.json()
-                            }
+                    regenerated = await regenerate_plan_sections(user_id, sections)
+                    return {
+                        "message": "Profile updated successfully and fitness plan generated!",
+                        "fitness_plan": {"plan_id": regenerated["plan_id"], "fitness_plan": await get_fitness_plan(user_id)},
+                        "plan_sections": sections
+                    }
                 except Exception as e:
                     print(f"Error generating fitness plan: {str(e)}")
                     # Continue even if plan generation fails
-                    pass
+                    return {"status": "Profile updated successfully"}
+            try:
+                plan_job = await PlanJobQueue.enqueue(user_id, replace_existing=True, sections=sections)
+                return {
+                    "message": "Profile updated successfully and fitness plan generation queued!",
+                    "plan_job_id": str(plan_job["_id"]),
+                    "plan_sections": sections
+                }
+            except Exception as e:
+                print(f"Error queueing fitness plan generation: {str(e)}")
+                # Continue even if plan generation can't be queued
+                pass
         
         return {"status": "Profile updated successfully"}
     except Exception as e:
@@ -179,37 +183,8 @@ async def delete_fitness_profile(user_id: str):
 # is user fitness profile created & completed?
 @profile_router.get("/v1/360_degree_fitness/check_profile_completion/{user_id}")
 async def check_profile_complete(user_id: str):
-    # Get collection inside the handler
-    fitness_profiles_collection = get_fitness_profile_collection()
-
     try:
-        # Fetch User Profile from DB
-        user_profile = await fitness_profiles_collection.find_one({"user_id": user_id})
-        print("----User Profile----:", user_profile)
-
-        # If user profile doesn't exist then return False
-        if user_profile is None:
-            print("Profile does not exist.") # debug log
-            return {"profile_exists": False, "profile_complete": False}
-
-        # Check if the user profile contains all necessary fields
-        is_complete = True
-        required_fields = [
-            "user_basic_details",
-            "user_initial_measurements",
-            "user_health_details",
-            "user_habits_assessment",
-            "user_routine_assessment",
-            "user_fitness_goals"
-        ]
-
-        for field in required_fields:
-            if field not in user_profile:
-                is_complete = False
-                print(f"Missing field: {field}")  # debug log
-                break
-
-        return {"profile_exists": True, "profile_complete": is_complete,}
+        return await check_profile_completion(user_id)
     except PyMongoError as e:
         return JSONResponse(status_code=500, content={"message":f"Database error: {str(e)}"})
     except Exception as e:
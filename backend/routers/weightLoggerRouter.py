@@ -1,15 +1,16 @@
 import json
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import Dict
+from typing import Dict, Optional
 
 from bson import ObjectId
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from fastapi.responses import JSONResponse
 from pymongo.errors import PyMongoError
 
 from ..models.userWeightLogger import UserWeightLogger
-from ..db.database import weight_diary_collection, profiles_collection, changes_collection
+from ..db.database import weight_diary_collection, profiles_collection, changes_collection, pull_weight_log
+from ..services.rollupService import touch_daily_rollups
 
 weight_log_router = APIRouter()
 
@@ -86,6 +87,9 @@ async def add_weight_log(user_weight_log: UserWeightLogger):
 
         # Convert the model to a dictionary and handle date/time serialization
         weight_log_dict = json.loads(json.dumps(user_weight_log.dict(), cls=CustomEncoder))
+        # Stable ids so entries can be deleted without relying on their position
+        for weight_entry in weight_log_dict["weights"]:
+            weight_entry["entry_id"] = str(ObjectId())
         
         # Debug print
         print(f"Converted weight log: {weight_log_dict}")
@@ -103,6 +107,8 @@ async def add_weight_log(user_weight_log: UserWeightLogger):
         if update_result.modified_count == 0:
             return JSONResponse(status_code=500, content={"message": "Failed to add weight log"})
 
+        await touch_daily_rollups(user_id, [weight_log_date.isoformat()])
+
         # Fetch the updated weight diary
         updated_weight_diary = await weight_diary_collection.find_one(
             {"user_id": user_id, "date": weight_log_date.isoformat()}
@@ -186,8 +192,27 @@ async def delete_user_weight_log(delete_weight_request: Dict):
         # Getting the relevant data from the request
         user_id = delete_weight_request.get("user_id")
         weight_log_date = delete_weight_request.get("date")
+        entry_id = delete_weight_request.get("entry_id")
         index = delete_weight_request.get("index")
 
+        if entry_id:
+            if not user_id or not weight_log_date:
+                return JSONResponse(status_code=400, content={"message": "user_id, date, and entry_id are required"})
+
+            # $pull just this entry instead of rewriting the whole weights array
+            updated_weight_diary = await pull_weight_log(user_id, weight_log_date, entry_id)
+            if not updated_weight_diary:
+                return JSONResponse(status_code=404, content={"message": f"No weight log {entry_id} found for {user_id} on {weight_log_date}"})
+
+            await touch_daily_rollups(user_id, [weight_log_date])
+
+            return JSONResponse(status_code=200, content={
+                "message": "Weight log deleted successfully",
+                "weight_diary": serialize_mongo_doc(updated_weight_diary)
+            })
+
+        # Legacy entries without an entry_id are deleted by position
+
         if not user_id or not weight_log_date or index is None:
             return JSONResponse(status_code=400, content={"message": "user_id, date, and index are required"})
 
@@ -226,6 +251,8 @@ async def delete_user_weight_log(delete_weight_request: Dict):
         if update_result.modified_count == 0:
             return JSONResponse(status_code=500, content={"message": "Failed to delete weight log"})
 
+        await touch_daily_rollups(user_id, [weight_log_date])
+
         # Fetch the updated weight diary
         updated_weight_diary = await weight_diary_collection.find_one(
             {"user_id": user_id, "date": weight_log_date}
@@ -271,8 +298,18 @@ def get_date_range(time_range: str):
     return start_date.date(), end_date.date()  # Return both start and end date as date objects
 
 
+# Diaries per page of get_weight_logs; longer ranges are followed with next_cursor
+DEFAULT_WEIGHT_LOG_PAGE_SIZE = 31
+MAX_WEIGHT_LOG_PAGE_SIZE = 100
+
+
 @weight_log_router.get("/v1/360_degree_fitness/get_weight_logs")
-async def get_weight_logs(user_id: str, time_range: str):
+async def get_weight_logs(
+    user_id: str,
+    time_range: str,
+    limit: int = Query(DEFAULT_WEIGHT_LOG_PAGE_SIZE, ge=1, le=MAX_WEIGHT_LOG_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     # Validate time range input
     if time_range not in ["1d", "1w", "1m", "3m", "6m", "1y"]:
         return JSONResponse(status_code=400, content={"message": "Invalid time range"})
@@ -309,17 +346,28 @@ async def get_weight_logs(user_id: str, time_range: str):
         if starting_weight is None:
             return JSONResponse(status_code=404, content={"message": "No starting weight available"})
 
-        # Step 3: Get weight logs within the selected time range (start date to end date)
+        # Step 3: Get weight logs within the selected time range (start date to end date),
+        # one page of diaries at a time in date order over the user_id_date_unique index
+        date_filter = {"$gte": start_date_str, "$lte": end_date_str}
+        if after:
+            date_filter["$gt"] = after
+        diaries = await weight_diary_collection.find(
+            {"user_id": user_id, "date": date_filter},
+            {"_id": 0, "date": 1, "weights": 1}
+        ).sort("date", 1).limit(limit + 1).to_list(length=limit + 1)
+
+        has_more = len(diaries) > limit
+        diaries = diaries[:limit]
+
         weight_logs = []
-        async for diary in weight_diary_collection.find(
-                {"user_id": user_id, "date": {"$gte": start_date_str, "$lte": end_date_str}}
-        ):
+        for diary in diaries:
             if diary.get("weights"):
                 for weight_entry in diary["weights"]:
                     weight_log = {
                         "date": diary["date"],
                         "weight_in_kg": weight_entry.get("weight_in_kg"),
-                        "notes": weight_entry.get("notes", None)
+                        "notes": weight_entry.get("notes", None),
+                        "entry_id": weight_entry.get("entry_id")
                     }
                     weight_logs.append(weight_log)
 
@@ -328,7 +376,8 @@ async def get_weight_logs(user_id: str, time_range: str):
         return {
             "user_id": user_id,
             "starting_weight": starting_weight,
-                "weight_logs": weight_logs
+                "weight_logs": weight_logs,
+            "next_cursor": diaries[-1]["date"] if has_more else None
         }
 
     except PyMongoError as e:
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from ..db.database import meal_diary_collection, exercise_diary_collection
+
+# Dashboard windows: the last 7 days by default, up to a year
+DEFAULT_SUMMARY_DAYS = 7
+MAX_SUMMARY_DAYS = 366
+
+
+def summary_window(days: int):
+    """ISO dates for the last `days` days, oldest to newest, ending today"""
+    today = datetime.today().date()
+    return [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+
+
+async def get_nutrition_summary(user_id: str, days: int = DEFAULT_SUMMARY_DAYS):
+    """Daily calories, average macros and the last breakfast/lunch/dinner in one aggregation"""
+    window = summary_window(days)
+
+    pipeline = [
+        # Range scan on the user_id_date_unique index
+        {"$match": {"user_id": user_id, "date": {"$gte": window[0], "$lte": window[-1]}}},
+        {"$project": {
+            "_id": 0,
+            "date": 1,
+            "calories": {"$ifNull": ["$daily_nutrition_summary.total_calories", 0]},
+            "protein": {"$ifNull": ["$daily_nutrition_summary.total_protein", 0]},
+            "carbs": {"$ifNull": ["$daily_nutrition_summary.total_carbs", 0]},
+            "fat": {"$ifNull": ["$daily_nutrition_summary.total_fat", 0]},
+            # Only the latest item of each meal type leaves the server
+            "last_meals": [
+                {"name": meal_type.capitalize(), "meal": {"$arrayElemAt": [{"$ifNull": [f"${meal_type}", []]}, -1]}}
+                for meal_type in ["breakfast", "lunch", "dinner"]
+            ],
+        }},
+        {"$facet": {
+            "days": [{"$project": {"date": 1, "calories": 1}}],
+            "macros": [{"$group": {
+                "_id": None,
+                "protein": {"$avg": "$protein"},
+                "carbs": {"$avg": "$carbs"},
+                "fat": {"$avg": "$fat"},
+            }}],
+            "meals": [
+                {"$unwind": "$last_meals"},
+                {"$match": {"last_meals.meal": {"$exists": True}}},
+                {"$sort": {"date": -1}},
+                {"$group": {
+                    "_id": "$last_meals.name",
+                    "calories": {"$first": "$last_meals.meal.total_calories"},
+                    "timestamp": {"$first": {"$ifNull": ["$last_meals.meal.meal_log_date", "$date"]}},
+                }},
+            ],
+        }},
+    ]
+    result = await meal_diary_collection.aggregate(pipeline).to_list(length=1)
+    facets = result[0] if result else {"days": [], "macros": [], "meals": []}
+
+    calories_by_date = {day["date"]: day["calories"] for day in facets["days"]}
+    daily_calories = [int(round(calories_by_date.get(log_date, 0))) for log_date in window]
+
+    if facets["macros"]:
+        macros = facets["macros"][0]
+        avg_macros = {key: int(round(macros[key] or 0)) for key in ["protein", "carbs", "fat"]}
+    else:
+        avg_macros = {"protein": 0, "carbs": 0, "fat": 0}
+
+    # Return meals sorted as Breakfast, Lunch, Dinner if available
+    meals_by_name = {meal["_id"]: meal for meal in facets["meals"]}
+    last_meals = [
+        {
+            "name": name,
+            "calories": int(round(meals_by_name[name].get("calories") or 0)),
+            "timestamp": meals_by_name[name]["timestamp"]
+        }
+        for name in ["Breakfast", "Lunch", "Dinner"]
+        if name in meals_by_name
+    ]
+
+    return {
+        "dailyCalories": daily_calories,
+        "macros": avg_macros,
+        "meals": last_meals
+    }
+
+
+async def get_exercise_summary(user_id: str, days: int = DEFAULT_SUMMARY_DAYS):
+    """Daily duration/burn, window totals and the 3 most recent workouts in one aggregation"""
+    window = summary_window(days)
+
+    pipeline = [
+        # Range scan on the user_id_date_unique index
+        {"$match": {"user_id": user_id, "date": {"$gte": window[0], "$lte": window[-1]}}},
+        {"$project": {"_id": 0, "date": 1, "exercises": 1, "daily_exercise_summary": 1}},
+        {"$facet": {
+            "days": [{"$project": {
+                "date": 1,
+                "duration": {"$ifNull": ["$daily_exercise_summary.total_duration", 0]},
+                "calories": {"$ifNull": ["$daily_exercise_summary.total_calories_burnt", 0]},
+            }}],
+            "recent": [
+                # The 3 most recent workouts are always within the 3 most recent non-empty days
+                {"$match": {"exercises.0": {"$exists": True}}},
+                {"$sort": {"date": -1}},
+                {"$limit": 3},
+                {"$unwind": {"path": "$exercises", "includeArrayIndex": "position"}},
+                {"$sort": {"date": -1, "position": -1}},
+                {"$limit": 3},
+                {"$project": {
+                    "type": {"$ifNull": ["$exercises.exercise_type", ""]},
+                    "duration": {"$ifNull": ["$exercises.duration_minutes", 0]},
+                    "calories": {"$ifNull": ["$exercises.calories_burnt", 0]},
+                }},
+            ],
+        }},
+    ]
+    result = await exercise_diary_collection.aggregate(pipeline).to_list(length=1)
+    facets = result[0] if result else {"days": [], "recent": []}
+
+    days_by_date = {day["date"]: day for day in facets["days"]}
+    weekly_workouts = [int(days_by_date.get(log_date, {}).get("duration", 0)) for log_date in window]
+    calories_burned = [int(days_by_date.get(log_date, {}).get("calories", 0)) for log_date in window]
+
+    last_workouts = [
+        {
+            "type": workout["type"],
+            "duration": int(workout["duration"]),
+            "calories": int(workout["calories"])
+        }
+        for workout in facets["recent"]
+    ]
+
+    return {
+        "weeklyWorkouts": weekly_workouts,
+        "caloriesBurned": calories_burned,
+        "lastWorkouts": last_workouts,
+        "totalDuration": sum(weekly_workouts),
+        "totalCaloriesBurned": sum(calories_burned)
+    }
@@ -0,0 +1,80 @@
+from typing import Dict
+
+from ..db.database import nutrition_goals_collection
+from .profileService import get_profile, ProfileNotFoundError
+
+# Activity Level to Activity Factor mapping
+activity_level_factors = {
+    "Sedentary": 1.2,
+    "Lightly active": 1.375,
+    "Moderately active": 1.55,
+    "Very active": 1.725,
+    "Super active": 1.9
+}
+
+
+# BMR Calculator function
+def bmr_calculator(age: int, gender: str, weight_in_kg: float, height_in_cm: float) -> float:
+    if gender.lower() == "male":
+        # Harris-Benedict equation for men
+        bmr = 66.5 + (13.75 * weight_in_kg) + (5.003 * height_in_cm) - (6.75 * age)
+    elif gender.lower() == "female":
+        # Harris-Benedict equation for women
+        bmr = 655 + (9.563 * weight_in_kg) + (1.850 * height_in_cm) - (4.676 * age)
+    else:
+        raise ValueError("Invalid gender")
+    return bmr
+
+
+def nutritional_goals_calculator(age: int, gender: str, weight: float, height: float, activity_level: str) -> Dict[str, float]:
+    # Calculate BMR using the user's details
+    bmr = bmr_calculator(age, gender, weight, height)
+
+    # Get the activity level factor
+    activity_factor = activity_level_factors.get(activity_level)
+    if not activity_factor:
+        raise ValueError("Invalid activity level")
+
+    # Calculate TDEE/ daily calories required for the day
+    tdee = bmr * activity_factor
+
+    # Macronutrient Goals Calculation
+    protein_goal = weight  # 1g of protein per kg of body weight
+    fat_goal = (tdee * 0.25) / 9  # 25% of TDEE from fat (fat has 9 calories per gram)
+    carbs_goal = (tdee - (protein_goal * 4 + fat_goal * 9)) / 4  # Remaining calories from carbs (carbs have 4
+    # calories per gram)
+
+    return {
+        "total_calories_goal": round(tdee),
+        "total_fat_goal": round(fat_goal, 2),
+        "total_carbs_goal": round(carbs_goal, 2),
+        "total_protein_goal": round(protein_goal, 2)
+    }
+
+
+def goals_from_profile(user_details: dict) -> Dict[str, float]:
+    """The nutritional goals for a profile document, without touching the database"""
+    # Get details from user profile
+    weight = user_details['user_basic_details']['weight_in_kg']
+    height = user_details['user_basic_details']['height_in_cm']
+    age = user_details['user_basic_details']['age']
+    gender = user_details['user_basic_details']['gender'].lower()
+    activity_level = user_details['user_habits_assessment']['activity_level']
+
+    # Calculate the nutritional goals based on the user profile details
+    return nutritional_goals_calculator(age, gender, weight, height, activity_level)
+
+
+async def calculate_nutritional_goals(user_id: str) -> Dict[str, float]:
+    """Calculate the user's goals from their profile and save them to nutrition_goals"""
+    user_details = await get_profile(user_id)
+    if not user_details:
+        raise ProfileNotFoundError(user_id)
+
+    nutrition_goals = goals_from_profile(user_details)
+    await nutrition_goals_collection.update_one(
+        {"user_id": user_id},
+        {"$set": nutrition_goals},
+        upsert=True
+    )
+    return nutrition_goals
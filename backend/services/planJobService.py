@@ -0,0 +1,204 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from ..db.database import plan_jobs_collection
+from .planService import create_fitness_plan, regenerate_plan_sections, FitnessPlanError, ALL_SECTIONS
+
+PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", 2))
+# A running job whose lease expires (worker crashed or restarted) becomes claimable again
+PLAN_JOB_LEASE_SECONDS = float(os.getenv("PLAN_JOB_LEASE_SECONDS", 300))
+PLAN_JOB_MAX_ATTEMPTS = int(os.getenv("PLAN_JOB_MAX_ATTEMPTS", 3))
+# Idle workers poll this often for jobs enqueued by other processes
+PLAN_JOB_POLL_SECONDS = float(os.getenv("PLAN_JOB_POLL_SECONDS", 5))
+# Finished jobs stay readable by the status endpoint for this long
+PLAN_JOB_RETENTION_SECONDS = float(os.getenv("PLAN_JOB_RETENTION_SECONDS", 7 * 24 * 60 * 60))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def serialize_job(job: dict):
+    return {
+        "job_id": str(job["_id"]),
+        "user_id": job["user_id"],
+        "status": job["status"],
+        "replace_existing": job.get("replace_existing", False),
+        "sections": job.get("sections", []),
+        "attempts": job.get("attempts", 0),
+        "created_at": job["created_at"].isoformat(),
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }
+
+
+class PlanJobQueue:
+    _workers = []
+    _wakeup = None  # set by enqueue so an idle worker in this process starts right away
+
+    @classmethod
+    async def enqueue(cls, user_id: str, replace_existing: bool = False, sections=None):
+        """
+        Queue a plan generation, or return the user's job that is already waiting.
+        With `sections`, an existing plan only has those sections regenerated.
+        """
+        now = datetime.utcnow()
+        query = {"user_id": user_id, "status": QUEUED}
+        update = {
+            "$setOnInsert": {"created_at": now, "attempts": 0},
+            # A waiting create is upgraded when an edit asks to replace the plan
+            "$max": {"replace_existing": replace_existing},
+            "$set": {"updated_at": now},
+            # Edits that collapse into one job regenerate the union of their sections
+            "$addToSet": {"sections": {"$each": list(sections or [])}},
+        }
+        try:
+            job = await plan_jobs_collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Another save queued the job first; the retry matches it instead of inserting
+            job = await plan_jobs_collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+        if cls._wakeup is not None:
+            cls._wakeup.set()
+        return job
+
+    @classmethod
+    async def get_job(cls, job_id: str):
+        return await plan_jobs_collection.find_one({"_id": ObjectId(job_id)})
+
+    @classmethod
+    async def _claim(cls):
+        """Atomically move the oldest claimable job to running under a lease"""
+        now = datetime.utcnow()
+        return await plan_jobs_collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$lt": PLAN_JOB_MAX_ATTEMPTS}},
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "started_at": now,
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=PLAN_JOB_LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    async def _finish(cls, job, status: str, result=None, error=None):
+        now = datetime.utcnow()
+        await plan_jobs_collection.update_one(
+            {"_id": job["_id"], "status": RUNNING},
+            {
+                "$set": {
+                    "status": status,
+                    "result": result,
+                    "error": error,
+                    "finished_at": now,
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=PLAN_JOB_RETENTION_SECONDS),
+                },
+                "$unset": {"lease_expires_at": ""},
+            }
+        )
+
+    @classmethod
+    async def _retry_later(cls, job, error: str):
+        try:
+            await plan_jobs_collection.update_one(
+                {"_id": job["_id"], "status": RUNNING},
+                {"$set": {"status": QUEUED, "error": error, "updated_at": datetime.utcnow()}, "$unset": {"lease_expires_at": ""}}
+            )
+        except DuplicateKeyError:
+            # A newer save already queued a job for this user: hand it this job's work, then retire this one.
+            # A full replace has no section list, so it widens the queued job to every section.
+            sections = job.get("sections") or (ALL_SECTIONS if job.get("replace_existing") else [])
+            await plan_jobs_collection.update_one(
+                {"user_id": job["user_id"], "status": QUEUED},
+                {
+                    "$max": {"replace_existing": job.get("replace_existing", False)},
+                    "$set": {"updated_at": datetime.utcnow()},
+                    "$addToSet": {"sections": {"$each": list(sections)}},
+                }
+            )
+            await cls._finish(job, FAILED, error=f"Superseded by a newer job after: {error}")
+
+    @classmethod
+    async def _fail_expired(cls):
+        """Jobs whose lease ran out on their last attempt will never be claimed again"""
+        now = datetime.utcnow()
+        await plan_jobs_collection.update_many(
+            {"status": RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$gte": PLAN_JOB_MAX_ATTEMPTS}},
+            {
+                "$set": {
+                    "status": FAILED,
+                    "error": "Lease expired on the last attempt",
+                    "finished_at": now,
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=PLAN_JOB_RETENTION_SECONDS),
+                },
+                "$unset": {"lease_expires_at": ""},
+            }
+        )
+
+    @classmethod
+    async def _run(cls, job):
+        try:
+            if job.get("replace_existing") and job.get("sections"):
+                plan = await regenerate_plan_sections(job["user_id"], job["sections"])
+            else:
+                plan = await create_fitness_plan(job["user_id"], replace_existing=job.get("replace_existing", False))
+            await cls._finish(job, DONE, result={"plan_id": plan["plan_id"], "regenerated_sections": plan.get("regenerated_sections")})
+        except FitnessPlanError as e:
+            # Incomplete profile, plan already exists, invalid AI output: retrying won't help
+            await cls._finish(job, FAILED, error=e.message)
+        except Exception as e:
+            print(f"Error running plan job {job['_id']}: {str(e)}")
+            if job["attempts"] < PLAN_JOB_MAX_ATTEMPTS:
+                await cls._retry_later(job, str(e))
+            else:
+                await cls._finish(job, FAILED, error=str(e))
+
+    @classmethod
+    async def _worker(cls):
+        while True:
+            try:
+                job = await cls._claim()
+                if job is not None:
+                    await cls._run(job)
+                    continue
+                await cls._fail_expired()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print(f"Plan job worker database error: {str(e)}")
+
+            # Nothing to do: sleep until an enqueue in this process or the next poll
+            cls._wakeup.clear()
+            try:
+                await asyncio.wait_for(cls._wakeup.wait(), timeout=PLAN_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    @classmethod
+    def start(cls):
+        if cls._workers:
+            return
+        cls._wakeup = asyncio.Event()
+        cls._workers = [asyncio.create_task(cls._worker()) for _ in range(PLAN_JOB_WORKERS)]
+
+    @classmethod
+    async def stop(cls):
+        """Running jobs are abandoned and picked up again once their lease expires"""
+        for worker in cls._workers:
+            worker.cancel()
+        await asyncio.gather(*cls._workers, return_exceptions=True)
+        cls._workers = []
@@ -0,0 +1,307 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from bson import ObjectId
+
+from ..db.database import profiles_collection
+from ..db.connection import get_fitness_plan_collection
+from ..core.structured_output import generate_structured, StructuredOutputError, StructuredOutputTimeoutError
+from ..models.fitnessPlan import (
+    GeneratedFitnessPlan, MealPlanSection, WorkoutPlanSection, SleepAndLifestyleSection
+)
+from .profileService import check_profile_completion, is_profile_complete
+from .planTemplateService import PlanTemplateCache
+
+
+class FitnessPlanError(Exception):
+    """Plan creation failure that maps onto an HTTP status code and message"""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+PLAN_SECTIONS = ["meal_plan", "workout_plan", "sleep_and_lifestyle_suggestions"]
+
+# Profile field -> plan sections it influences (a list covers the whole group); fields that never
+# reach the prompt map to nothing. Used to regenerate only the affected sections after a profile edit.
+ALL_SECTIONS = PLAN_SECTIONS
+PLAN_SECTION_DEPENDENCIES = {
+    "user_basic_details": {
+        "age": ["meal_plan", "workout_plan"],
+        "weight_in_kg": ["meal_plan", "workout_plan"],
+        "height_in_cm": ["meal_plan", "workout_plan"],
+        "gender": ["meal_plan", "workout_plan"],
+        "weight_goal_in_kg": ["meal_plan", "workout_plan"],
+    },
+    "user_initial_measurements": [],
+    "user_health_details": {
+        "family_history": ["meal_plan", "sleep_and_lifestyle_suggestions"],
+        "existing_conditions": ALL_SECTIONS,
+        "habitual_consumption": ["meal_plan", "sleep_and_lifestyle_suggestions"],
+        "current_medications": [],
+        "current_supplements": ["meal_plan"],
+    },
+    "user_habits_assessment": {
+        "daily_water_intake_in_liter": ["sleep_and_lifestyle_suggestions"],
+        "weekly_workout_frequency": ["workout_plan"],
+        "diet_preference": ["meal_plan"],
+        "uncomfortable_foods": ["meal_plan"],
+        "activity_level": ["meal_plan", "workout_plan"],
+    },
+    "user_routine_assessment": [],
+    "user_fitness_goals": ALL_SECTIONS,
+}
+
+SECTION_STRUCTURES = {
+    "meal_plan": """"meal_plan": {{
+            "day_1": {{
+                "breakfast": "specific meal with portions",
+                "lunch": "specific meal with portions",
+                "dinner": "specific meal with portions",
+                "snack": "specific snack with portions"
+            }},
+            "day_2": {{same structure as day_1}},
+            "day_3": {{same structure as day_1}},
+            "day_4": {{same structure as day_1}},
+            "day_5": {{same structure as day_1}},
+            "day_6": {{same structure as day_1}},
+            "day_7": {{same structure as day_1}}
+        }}""",
+    "workout_plan": """"workout_plan": {{
+            "day_1": "detailed workout with duration and intensity",
+            "day_2": "detailed workout with duration and intensity",
+            "day_3": "detailed workout with duration and intensity",
+            "day_4": "detailed workout with duration and intensity",
+            "day_5": "detailed workout with duration and intensity",
+            "day_6": "detailed workout with duration and intensity",
+            "day_7": "detailed workout with duration and intensity"
+        }}""",
+    "sleep_and_lifestyle_suggestions": """"sleep_and_lifestyle_suggestions": {{
+            "sleep_duration": "7-9 hours",
+            "sleep_tips": "3-4 specific sleep improvement tips",
+            "stress_management": "3-4 specific stress management techniques"
+        }}""",
+}
+
+
+def _profile_context(user_profile: dict) -> str:
+    # Extract profile details with safe gets
+    basic_details = user_profile.get('user_basic_details', {})
+    health_details = user_profile.get('user_health_details', {})
+    habits = user_profile.get('user_habits_assessment', {})
+    fitness_goals = user_profile.get('user_fitness_goals', '')
+
+    return f"""
+    User Profile:
+    - Age: {basic_details.get('age')} years
+    - Weight: {basic_details.get('weight_in_kg')} kg
+    - Height: {basic_details.get('height_in_cm')} cm
+    - Gender: {basic_details.get('gender')}
+    - Weight Goal: {basic_details.get('weight_goal_in_kg')} kg
+    - Activity Level: {habits.get('activity_level')}
+    - Diet Preference: {habits.get('diet_preference')}
+    - Health Conditions: {', '.join(health_details.get('existing_conditions', []))}
+    - Fitness Goal: {fitness_goals}
+    - Weekly Workout Frequency: {habits.get('weekly_workout_frequency')} times
+    - Daily Water Intake: {habits.get('daily_water_intake_in_liter')}
+    - Dietary Restrictions: {', '.join(habits.get('uncomfortable_foods', []))}
+
+    Additional Health Context:
+    - Family History: {', '.join(health_details.get('family_history', []))}
+    - Current Supplements: {', '.join(health_details.get('current_supplements', []))}
+    - Habitual Consumption: {', '.join(health_details.get('habitual_consumption', []))}
+    """
+
+
+def _considerations(user_profile: dict, sections) -> str:
+    health_details = user_profile.get('user_health_details', {})
+    habits = user_profile.get('user_habits_assessment', {})
+    fitness_goals = user_profile.get('user_fitness_goals', '')
+
+    considerations = []
+    if "meal_plan" in sections:
+        considerations.append(f"This user is {habits.get('diet_preference', 'No preference')}, ensure ALL meals follow this restriction")
+    if "workout_plan" in sections:
+        considerations.append(f"Their fitness goal is {fitness_goals}, focus workouts on this goal")
+    considerations.append(f"Account for their {habits.get('activity_level', 'moderate')} activity level")
+    considerations.append(f"Consider their health conditions: {', '.join(health_details.get('existing_conditions', []))}")
+    if "meal_plan" in sections:
+        considerations.append("Include specific portion sizes in all meal descriptions")
+    if "workout_plan" in sections:
+        considerations.append("Include duration and intensity in all workout descriptions")
+        considerations.append(f"Ensure workouts match their current frequency of {habits.get('weekly_workout_frequency')} times per week")
+    if "meal_plan" in sections or "sleep_and_lifestyle_suggestions" in sections:
+        considerations.append(f"Account for their habitual consumption of {', '.join(health_details.get('habitual_consumption', []))}")
+    return "\n".join(f"    {number}. {consideration}" for number, consideration in enumerate(considerations, start=1))
+
+
+def build_plan_prompt(user_profile: dict, sections=None) -> str:
+    """The full 7-day plan prompt, or a smaller one covering only `sections`"""
+    sections = [section for section in PLAN_SECTIONS if section in (sections or PLAN_SECTIONS)]
+    full_plan = len(sections) == len(PLAN_SECTIONS)
+
+    structure = ",\n        ".join(SECTION_STRUCTURES[section] for section in sections).format()
+    if full_plan:
+        task = "Create a personalized 7-day fitness plan for a user with the following profile:"
+        structure = '"plan_duration": "7 days",\n        ' + structure
+    else:
+        task = f"Update part of a personalized 7-day fitness plan ({', '.join(sections)}) for a user with the following profile:"
+
+    return f"""
+    You are a professional fitness trainer and nutritionist. {task}
+    {_profile_context(user_profile)}
+    Return ONLY a JSON object with EXACTLY this structure (no additional text or explanations):
+    {{
+        {structure}
+    }}
+
+    Important Considerations:
+{_considerations(user_profile, sections)}
+    """
+
+
+PLAN_SECTION_MODELS = {
+    "meal_plan": MealPlanSection,
+    "workout_plan": WorkoutPlanSection,
+    "sleep_and_lifestyle_suggestions": SleepAndLifestyleSection,
+}
+
+
+def validate_generated_plan(generated_plan: dict):
+    """Raise ValueError (a pydantic ValidationError) when the plan is missing a section, day or meal"""
+    GeneratedFitnessPlan.model_validate(generated_plan)
+
+
+async def get_fitness_plan(user_id: str):
+    """Plans are stored with the user_id as an ObjectId"""
+    fitness_plans_collection = get_fitness_plan_collection()
+    fitness_plan = await fitness_plans_collection.find_one({"user_id": ObjectId(user_id)})
+    if fitness_plan is not None:
+        # Convert ObjectId to string for proper serialization
+        fitness_plan['user_id'] = str(fitness_plan['user_id'])
+        fitness_plan['_id'] = str(fitness_plan['_id'])
+    return fitness_plan
+
+
+async def create_fitness_plan(user_id: str, replace_existing: bool = False):
+    """Generate and save a 7-day plan, returns {"plan_id", "fitness_plan"} or raises FitnessPlanError"""
+    profile_status = await check_profile_completion(user_id)
+    if not profile_status['profile_exists']:
+        raise FitnessPlanError(400, "Fitness Profile does not exist, cannot create fitness plan")
+    if not profile_status['profile_complete']:
+        raise FitnessPlanError(400, "Profile is incomplete, cannot create fitness plan")
+
+    # Get user's profile data for personalization - using string user_id
+    user_profile = await profiles_collection.find_one({"user_id": user_id})
+    if not user_profile:
+        raise FitnessPlanError(404, "User profile not found")
+
+    # Check for an existing plan before spending a Gemini call on a new one
+    fitness_plans_collection = get_fitness_plan_collection()
+    existing_fitness_plan = await fitness_plans_collection.find_one({"user_id": ObjectId(user_id)}, {"_id": 1})
+    if existing_fitness_plan and not replace_existing:
+        raise FitnessPlanError(400, "Fitness plan already exists for this user.")
+
+    # Users with the same quantized profile share a template plan, served without an LLM call
+    generated_plan = await PlanTemplateCache.get_plan(user_profile)
+    if generated_plan is None:
+        # Generate plan using Gemini, validated (and repaired if needed) against GeneratedFitnessPlan
+        try:
+            generated_plan = await generate_structured(build_plan_prompt(user_profile), GeneratedFitnessPlan, name="fitness_plan")
+        except StructuredOutputTimeoutError:
+            raise  # not a FitnessPlanError, so the plan job retries it
+        except StructuredOutputError as e:
+            raise FitnessPlanError(500, f"Error generating fitness plan: {str(e)}")
+        generated_plan = generated_plan.model_dump()
+
+        await PlanTemplateCache.store(user_profile, generated_plan)
+
+    # Add the user_id to the plan
+    generated_plan["user_id"] = ObjectId(user_id)
+
+    # Save the generated plan, replacing the previous one in place after a profile edit
+    if existing_fitness_plan:
+        await fitness_plans_collection.replace_one({"_id": existing_fitness_plan["_id"]}, generated_plan)
+        plan_id = existing_fitness_plan["_id"]
+    else:
+        result = await fitness_plans_collection.insert_one(generated_plan)
+        plan_id = result.inserted_id
+
+    # Convert ObjectIds to strings for response
+    generated_plan['user_id'] = str(generated_plan['user_id'])
+    generated_plan['_id'] = str(plan_id)
+
+    return {"plan_id": str(plan_id), "fitness_plan": generated_plan}
+
+
+def _normalize(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def affected_plan_sections(previous_profile: dict, update_data: dict):
+    """Plan sections whose inputs differ between the stored profile and a profile edit"""
+    # No plan can have been generated from a missing or incomplete profile yet
+    if not previous_profile or not is_profile_complete(previous_profile):
+        return list(PLAN_SECTIONS)
+
+    affected = set()
+    for group, value in update_data.items():
+        if group not in PLAN_SECTION_DEPENDENCIES:
+            continue
+        dependencies = PLAN_SECTION_DEPENDENCIES[group]
+        previous_value = previous_profile.get(group)
+        if isinstance(dependencies, list):
+            if _normalize(value) != _normalize(previous_value):
+                affected.update(dependencies)
+            continue
+        previous_value = previous_value or {}
+        for field, field_value in (value or {}).items():
+            if _normalize(field_value) != _normalize(previous_value.get(field)):
+                # Fields missing from the map are assumed to affect the whole plan
+                affected.update(dependencies.get(field, PLAN_SECTIONS))
+    return [section for section in PLAN_SECTIONS if section in affected]
+
+
+async def _generate_section(user_profile: dict, section: str):
+    try:
+        generated = await generate_structured(build_plan_prompt(user_profile, [section]), PLAN_SECTION_MODELS[section], name=section)
+    except StructuredOutputTimeoutError:
+        raise  # not a FitnessPlanError, so the plan job retries it
+    except StructuredOutputError as e:
+        raise FitnessPlanError(500, f"Error regenerating {section}: {str(e)}")
+    return generated.model_dump()[section]
+
+
+async def regenerate_plan_sections(user_id: str, sections):
+    """
+    Regenerate only `sections` of the stored plan, one small prompt per section run concurrently,
+    and $set them into the plan. Falls back to a full plan when the user has none yet.
+    """
+    sections = [section for section in PLAN_SECTIONS if section in sections]
+    fitness_plans_collection = get_fitness_plan_collection()
+    existing_fitness_plan = await fitness_plans_collection.find_one({"user_id": ObjectId(user_id)}, {"_id": 1})
+    if not existing_fitness_plan or len(sections) == len(PLAN_SECTIONS):
+        return await create_fitness_plan(user_id, replace_existing=True)
+    if not sections:
+        return {"plan_id": str(existing_fitness_plan["_id"]), "regenerated_sections": []}
+
+    user_profile = await profiles_collection.find_one({"user_id": user_id})
+    if not user_profile:
+        raise FitnessPlanError(404, "User profile not found")
+
+    generated_sections = await asyncio.gather(*(_generate_section(user_profile, section) for section in sections))
+
+    # Merge into the stored plan; sections that didn't change are left untouched
+    await fitness_plans_collection.update_one(
+        {"_id": existing_fitness_plan["_id"]},
+        {"$set": {**dict(zip(sections, generated_sections)), "updated_at": datetime.utcnow()}}
+    )
+    return {"plan_id": str(existing_fitness_plan["_id"]), "regenerated_sections": sections}
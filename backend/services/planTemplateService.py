@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+
+import orjson
+from pymongo.errors import PyMongoError
+
+from ..core.cache import TTLCache
+from ..db.database import plan_templates_collection
+from .nutritionGoalService import nutritional_goals_calculator
+
+PLAN_TEMPLATES_ENABLED = os.getenv("PLAN_TEMPLATES_ENABLED", "true").lower() == "true"
+PLAN_TEMPLATE_MAX_ENTRIES = int(os.getenv("PLAN_TEMPLATE_MAX_ENTRIES", 1000))
+# Templates age out so prompt and model changes reach new plans
+PLAN_TEMPLATE_TTL_SECONDS = float(os.getenv("PLAN_TEMPLATE_TTL_SECONDS", 30 * 24 * 60 * 60))
+
+# Width of the bands numeric profile fields are quantized into
+AGE_BAND_YEARS = 10
+WEIGHT_BAND_KG = 10
+HEIGHT_BAND_CM = 10
+# Portions are scaled by the user's TDEE relative to the template's, within these bounds
+MIN_PORTION_SCALE = 0.75
+MAX_PORTION_SCALE = 1.25
+
+TEMPLATE_FIELDS = ["plan_duration", "meal_plan", "workout_plan", "sleep_and_lifestyle_suggestions"]
+
+_PORTION = re.compile(r"(\d+(?:\.\d+)?)(\s*)(grams|gram|g|ml|oz|cups|cup|tbsp|tsp|slices|slice|pieces|piece)\b", re.IGNORECASE)
+
+
+def _band(value, width):
+    try:
+        return int(float(value) // width * width)
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalized_list(values):
+    return sorted({value.strip().lower() for value in values or [] if value and value.strip()})
+
+
+def profile_fingerprint(user_profile: dict):
+    """The plan-relevant profile inputs, with numeric fields quantized into bands"""
+    basic_details = user_profile.get("user_basic_details", {})
+    health_details = user_profile.get("user_health_details", {})
+    habits = user_profile.get("user_habits_assessment", {})
+
+    weight = basic_details.get("weight_in_kg")
+    weight_goal = basic_details.get("weight_goal_in_kg")
+    try:
+        weight_change = float(weight_goal) - float(weight)
+        direction = "lose" if weight_change < -2 else "gain" if weight_change > 2 else "maintain"
+    except (TypeError, ValueError):
+        direction = None
+
+    try:
+        workout_frequency = int(round(float(habits.get("weekly_workout_frequency"))))
+    except (TypeError, ValueError):
+        workout_frequency = None
+
+    return {
+        "gender": basic_details.get("gender"),
+        "age_band": _band(basic_details.get("age"), AGE_BAND_YEARS),
+        "weight_band": _band(weight, WEIGHT_BAND_KG),
+        "height_band": _band(basic_details.get("height_in_cm"), HEIGHT_BAND_CM),
+        "weight_direction": direction,
+        "activity_level": habits.get("activity_level"),
+        "diet_preference": habits.get("diet_preference"),
+        "weekly_workout_frequency": workout_frequency,
+        "fitness_goal": user_profile.get("user_fitness_goals"),
+        # Safety-relevant free text has to match exactly
+        "existing_conditions": _normalized_list(health_details.get("existing_conditions")),
+        "uncomfortable_foods": _normalized_list(habits.get("uncomfortable_foods")),
+        "habitual_consumption": _normalized_list(health_details.get("habitual_consumption")),
+    }
+
+
+def template_key(fingerprint: dict) -> str:
+    return "plan:v1:" + hashlib.sha1(orjson.dumps(fingerprint, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def profile_tdee(user_profile: dict):
+    basic_details = user_profile.get("user_basic_details", {})
+    habits = user_profile.get("user_habits_assessment", {})
+    try:
+        return nutritional_goals_calculator(
+            int(basic_details["age"]),
+            basic_details["gender"],
+            float(basic_details["weight_in_kg"]),
+            float(basic_details["height_in_cm"]),
+            habits.get("activity_level")
+        )["total_calories_goal"]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _scale_portion(match, scale: float):
+    amount = float(match.group(1)) * scale
+    unit = match.group(3)
+    if unit.lower() in ("g", "gram", "grams", "ml"):
+        amount = max(5, round(amount / 5) * 5)
+    else:
+        amount = max(0.25, round(amount * 4) / 4)
+    return f"{amount:g}{match.group(2)}{unit}"
+
+
+def personalize_plan(plan: dict, template_tdee, user_tdee):
+    """Copy of the template plan with meal portions scaled to the user's energy needs"""
+    plan = copy.deepcopy(plan)
+    if not template_tdee or not user_tdee:
+        return plan
+    scale = min(MAX_PORTION_SCALE, max(MIN_PORTION_SCALE, user_tdee / template_tdee))
+    if abs(scale - 1) < 0.05:
+        return plan
+
+    for day_plan in plan.get("meal_plan", {}).values():
+        for meal, description in day_plan.items():
+            if isinstance(description, str):
+                day_plan[meal] = _PORTION.sub(lambda match: _scale_portion(match, scale), description)
+    return plan
+
+
+class PlanTemplateCache:
+    _memory = TTLCache(PLAN_TEMPLATE_MAX_ENTRIES, PLAN_TEMPLATE_TTL_SECONDS)
+    memory_hits = 0
+    mongo_hits = 0
+    misses = 0
+    stores = 0
+
+    @classmethod
+    async def _read(cls, key: str):
+        template = cls._memory.get(key)
+        if template is not None:
+            cls.memory_hits += 1
+            return template
+        try:
+            template = await plan_templates_collection.find_one({"_id": key}, {"plan": 1, "reference_tdee": 1})
+        except PyMongoError as e:
+            print(f"Plan template read failed: {str(e)}")
+            return None
+        if template is not None:
+            cls.mongo_hits += 1
+            cls._memory.set(key, template)
+        return template
+
+    @classmethod
+    async def get_plan(cls, user_profile: dict):
+        """A personalized copy of the matching template plan, or None on a miss"""
+        if not PLAN_TEMPLATES_ENABLED:
+            return None
+        template = await cls._read(template_key(profile_fingerprint(user_profile)))
+        if template is None:
+            cls.misses += 1
+            return None
+        return personalize_plan(template["plan"], template.get("reference_tdee"), profile_tdee(user_profile))
+
+    @classmethod
+    async def store(cls, user_profile: dict, plan: dict):
+        """Save a validated plan as the template for this profile's fingerprint (the first one wins)"""
+        if not PLAN_TEMPLATES_ENABLED:
+            return False
+        fingerprint = profile_fingerprint(user_profile)
+        key = template_key(fingerprint)
+        now = datetime.utcnow()
+        template = {
+            "_id": key,
+            "plan": {field: copy.deepcopy(plan[field]) for field in TEMPLATE_FIELDS if field in plan},
+            "reference_tdee": profile_tdee(user_profile),
+        }
+        try:
+            result = await plan_templates_collection.update_one(
+                {"_id": key},
+                {"$setOnInsert": {
+                    "plan": template["plan"],
+                    "reference_tdee": template["reference_tdee"],
+                    "fingerprint": fingerprint,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=PLAN_TEMPLATE_TTL_SECONDS),
+                }},
+                upsert=True
+            )
+        except PyMongoError as e:
+            print(f"Plan template write failed: {str(e)}")
+            return False
+        if result.upserted_id is None:
+            return False
+        cls.stores += 1
+        cls._memory.set(key, template)
+        return True
+
+    @classmethod
+    def get_metrics(cls):
+        lookups = cls.memory_hits + cls.mongo_hits + cls.misses
+        hits = cls.memory_hits + cls.mongo_hits
+        return {
+            "enabled": PLAN_TEMPLATES_ENABLED,
+            "lookups": lookups,
+            "memory_hits": cls.memory_hits,
+            "mongo_hits": cls.mongo_hits,
+            "misses": cls.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": cls.stores,
+            "memory": cls._memory.stats(),
+        }
@@ -0,0 +1,40 @@
+from ..db.connection import get_fitness_profile_collection
+
+# A profile needs every section before a fitness plan can be generated
+REQUIRED_PROFILE_FIELDS = [
+    "user_basic_details",
+    "user_initial_measurements",
+    "user_health_details",
+    "user_habits_assessment",
+    "user_routine_assessment",
+    "user_fitness_goals"
+]
+
+
+class ProfileNotFoundError(Exception):
+    def __init__(self, user_id: str):
+        super().__init__("User profile not found")
+        self.user_id = user_id
+
+
+def is_profile_complete(user_profile: dict) -> bool:
+    for field in REQUIRED_PROFILE_FIELDS:
+        if field not in user_profile:
+            print(f"Missing field: {field}")  # debug log
+            return False
+    return True
+
+
+async def get_profile(user_id: str):
+    fitness_profiles_collection = get_fitness_profile_collection()
+    return await fitness_profiles_collection.find_one({"user_id": user_id})
+
+
+async def check_profile_completion(user_id: str):
+    """Is the user's fitness profile created & completed?"""
+    user_profile = await get_profile(user_id)
+    if user_profile is None:
+        print("Profile does not exist.")  # debug log
+        return {"profile_exists": False, "profile_complete": False}
+
+    return {"profile_exists": True, "profile_complete": is_profile_complete(user_profile)}
@@ -0,0 +1,212 @@
+import asyncio
+from datetime import date, datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from ..db.database import (
+    daily_rollups_collection, meal_diary_collection, exercise_diary_collection,
+    weight_diary_collection, bulk_upsert_diaries
+)
+from .nutritionGoalService import goals_from_profile
+from .profileService import get_profile
+
+# Longest range a single balance query may cover
+MAX_ROLLUP_RANGE_DAYS = 366
+
+
+def caloric_balance(calories_diff: float):
+    if calories_diff > 0:
+        return {"status": "surplus", "calories_diff": calories_diff}
+    elif calories_diff < 0:
+        return {"status": "deficit", "calories_diff": abs(calories_diff)}
+    return {"status": "balanced", "calories_diff": 0}
+
+
+async def get_current_goals(user_id: str):
+    """The user's nutrition goals from their profile as it is now, snapshotted into each rollup"""
+    user_profile = await get_profile(user_id)
+    if not user_profile:
+        return None
+    try:
+        return goals_from_profile(user_profile)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"No nutrition goals for {user_id}: {str(e)}")
+        return None
+
+
+def build_rollup(user_id: str, date_str: str, meal_diary, exercise_diary, weight_diary, goals, version: int):
+    nutrition = (meal_diary or {}).get("daily_nutrition_summary", {})
+    exercise = (exercise_diary or {}).get("daily_exercise_summary", {})
+    weights = (weight_diary or {}).get("weights") or []
+
+    total_calories_intake = nutrition.get("total_calories", 0)
+    total_calories_burnt = exercise.get("total_calories_burnt", 0)
+    calories_diff = total_calories_intake - total_calories_burnt
+
+    return {
+        "user_id": user_id,
+        "date": date_str,
+        "has_meal_diary": meal_diary is not None,
+        "has_exercise_diary": exercise_diary is not None,
+        "total_calories_intake": total_calories_intake,
+        "total_fat": nutrition.get("total_fat", 0),
+        "total_carbs": nutrition.get("total_carbs", 0),
+        "total_protein": nutrition.get("total_protein", 0),
+        "total_calories_burnt": total_calories_burnt,
+        "total_exercise_duration": exercise.get("total_duration", 0),
+        "weight_in_kg": weights[-1].get("weight_in_kg") if weights else None,
+        "nutrition_goals": goals,
+        "caloric_balance": caloric_balance(calories_diff),
+        # The diary_version this rollup reflects; behind diary_version means a write hasn't landed yet
+        "built_version": version,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+async def refresh_daily_rollups(user_id: str, dates):
+    """Recompute the rollups for several dates with one read per diary and one bulk write"""
+    dates = sorted(set(dates))
+    if not dates:
+        return []
+    date_filter = {"user_id": user_id, "date": {"$in": dates}}
+
+    # Versions are read before the diaries, so a write racing this refresh leaves the rollup marked behind
+    existing_rollups = await daily_rollups_collection.find(date_filter, {"date": 1, "diary_version": 1}).to_list(length=None)
+    meal_diaries, exercise_diaries, weight_diaries, goals = await asyncio.gather(
+        meal_diary_collection.find(date_filter, {"date": 1, "daily_nutrition_summary": 1}).to_list(length=None),
+        exercise_diary_collection.find(date_filter, {"date": 1, "daily_exercise_summary": 1}).to_list(length=None),
+        weight_diary_collection.find(date_filter, {"date": 1, "weights": {"$slice": -1}}).to_list(length=None),
+        get_current_goals(user_id),
+    )
+    versions_by_date = {rollup["date"]: rollup.get("diary_version", 0) for rollup in existing_rollups}
+    meals_by_date = {diary["date"]: diary for diary in meal_diaries}
+    exercises_by_date = {diary["date"]: diary for diary in exercise_diaries}
+    weights_by_date = {diary["date"]: diary for diary in weight_diaries}
+
+    rollups = [
+        build_rollup(
+            user_id, date_str, meals_by_date.get(date_str), exercises_by_date.get(date_str),
+            weights_by_date.get(date_str), goals, versions_by_date.get(date_str, 0)
+        )
+        for date_str in dates
+    ]
+    operations = [
+        UpdateOne(
+            # Never overwrite a rollup already built from newer diaries
+            {"user_id": user_id, "date": rollup["date"], "built_version": {"$not": {"$gt": rollup["built_version"]}}},
+            {"$set": rollup, "$setOnInsert": {"created_at": rollup["updated_at"]}},
+            upsert=True
+        )
+        for rollup in rollups
+        # Don't store empty days, but keep rollups that exist or whose diaries still exist
+        if rollup["date"] in versions_by_date or rollup["date"] in meals_by_date
+        or rollup["date"] in exercises_by_date or rollup["date"] in weights_by_date
+    ]
+    if operations:
+        try:
+            await daily_rollups_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A newer build won the race: its filter miss turns into a duplicate upsert, which is fine
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    return rollups
+
+
+class RollupRefresher:
+    """
+    Diary writes schedule their rollup refresh here instead of awaiting it.
+    One task per user drains that user's dirty dates, so a burst of writes collapses into few refreshes.
+    Readers don't depend on it: touch_daily_rollups marks the days behind in MongoDB first.
+    """
+    _pending_dates = {}  # user_id -> dates written since the user's task last read them
+    _tasks = {}  # user_id -> running refresh task; keeps it referenced until it finishes
+
+    @classmethod
+    def schedule(cls, user_id: str, dates):
+        cls._pending_dates.setdefault(user_id, set()).update(dates)
+        if user_id not in cls._tasks:
+            cls._tasks[user_id] = asyncio.create_task(cls._drain(user_id))
+
+    @classmethod
+    async def _drain(cls, user_id: str):
+        try:
+            # Dates scheduled while a refresh is in flight are picked up by the next loop
+            while cls._pending_dates.get(user_id):
+                dates = cls._pending_dates.pop(user_id)
+                try:
+                    await refresh_daily_rollups(user_id, dates)
+                except Exception as e:
+                    # The rollups stay marked behind, so the next read rebuilds them
+                    print(f"Error refreshing daily rollups for {user_id}: {str(e)}")
+        finally:
+            cls._tasks.pop(user_id, None)
+
+    @classmethod
+    async def flush(cls):
+        """Finish the pending refreshes on shutdown"""
+        if cls._tasks:
+            await asyncio.gather(*cls._tasks.values(), return_exceptions=True)
+
+
+async def touch_daily_rollups(user_id: str, dates):
+    """
+    Called after every diary write: bumps the days' diary_version so any worker reading them
+    rebuilds from the diaries until the background refresh lands, then schedules that refresh.
+    """
+    dates = sorted(set(dates))
+    try:
+        failed_days = await bulk_upsert_diaries(daily_rollups_collection, {
+            (user_id, date_str): {"$inc": {"diary_version": 1}} for date_str in dates
+        })
+        if failed_days:
+            print(f"Error marking daily rollups for {user_id}: {failed_days}")
+    except PyMongoError as e:
+        # A rollup failure never fails the write itself
+        print(f"Error marking daily rollups for {user_id}: {str(e)}")
+    RollupRefresher.schedule(user_id, dates)
+
+
+def _is_current(rollup) -> bool:
+    return (
+        rollup.get("built_version", -1) >= rollup.get("diary_version", 0)
+        and rollup.get("nutrition_goals") is not None
+    )
+
+
+async def get_daily_rollup(user_id: str, date_str: str):
+    """Single indexed read; missing, behind or goal-less rollups are rebuilt from the diaries"""
+    rollup = await daily_rollups_collection.find_one({"user_id": user_id, "date": date_str}, {"_id": 0})
+    if rollup is None or not _is_current(rollup):
+        rollups = await refresh_daily_rollups(user_id, [date_str])
+        rollup = rollups[0]
+    return rollup
+
+
+async def get_rollup_range(user_id: str, start_date: str, end_date: str):
+    """Range scan over the user_id_date_unique index, rebuilding the days that are behind in one batch"""
+    cursor = daily_rollups_collection.find(
+        {"user_id": user_id, "date": {"$gte": start_date, "$lte": end_date}},
+        {"_id": 0, "created_at": 0, "updated_at": 0}
+    ).sort("date", 1)
+    rollups = await cursor.to_list(length=MAX_ROLLUP_RANGE_DAYS)
+    behind = [rollup["date"] for rollup in rollups if not _is_current(rollup)]
+    if behind:
+        rebuilt = {rollup["date"]: rollup for rollup in await refresh_daily_rollups(user_id, behind)}
+        rollups = [rebuilt.get(rollup["date"], rollup) for rollup in rollups]
+    # Days only marked by a write whose diary is gone again have nothing to show
+    return [rollup for rollup in rollups if rollup["has_meal_diary"] or rollup["has_exercise_diary"] or rollup["weight_in_kg"] is not None]
+
+
+async def refresh_goal_snapshots(user_id: str):
+    """After a profile edit, today's and later rollups take the new goals; past days keep theirs"""
+    goals = await get_current_goals(user_id)
+    if goals is None:
+        return
+    try:
+        await daily_rollups_collection.update_many(
+            {"user_id": user_id, "date": {"$gte": date.today().isoformat()}},
+            {"$set": {"nutrition_goals": goals}}
+        )
+    except PyMongoError as e:
+        print(f"Error refreshing goal snapshots for {user_id}: {str(e)}")
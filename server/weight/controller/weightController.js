@@ -19,11 +19,22 @@ exports.get_weight = async (req, res) => {
 
         const user_id = verified.id;
 
+        // The backend returns the range one page at a time; follow next_cursor to build the full chart
         const response = await axios.get(`${FASTAPI_BASE_URL}/get_weight_logs`, {
             params: { user_id, time_range: range }
         });
+        const data = response.data;
+        let nextCursor = data.next_cursor;
+        while (nextCursor) {
+            const page = await axios.get(`${FASTAPI_BASE_URL}/get_weight_logs`, {
+                params: { user_id, time_range: range, after: nextCursor }
+            });
+            data.weight_logs = data.weight_logs.concat(page.data.weight_logs);
+            nextCursor = page.data.next_cursor;
+        }
+        data.next_cursor = null;
 
-        return res.json(response.data);
+        return res.json(data);
     } catch (error) {
         console.error("Error fetching weight log:", error.message);
         return res.status(500).json({ message: "Error fetching weight log" });